@@ -0,0 +1,257 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from catalog import CatalogIndex, source_digest
+from neighbours import NeighbourTable, NEIGHBOURS_PER_ITEM
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+CURRENT_NAME = "CURRENT"
+
+# LightFM attributes the server needs; everything else (momentum, item gradients) is training state
+MODEL_PARAMS = ('no_components', 'learning_rate', 'loss', 'learning_schedule', 'k', 'n',
+                'rho', 'epsilon', 'max_sampled', 'item_alpha', 'user_alpha')
+MODEL_ARRAYS = ('item_embeddings', 'item_biases', 'user_embeddings', 'user_biases',
+                'user_embedding_gradients', 'user_bias_gradients')
+
+CATALOG_TEXT_COLUMNS = ('titles', 'genres', 'synopses', 'image_urls', 'media_types')
+CATALOG_ARRAY_COLUMNS = ('has_data', 'mean', 'num_list_users', 'media_type_codes', 'first_season', 'genre_bits')
+
+
+class StringColumn:
+    """
+    Read-only column of strings stored as one UTF-8 buffer plus an offsets array, so it can
+    be memory-mapped like any other .npy file. Values are decoded on access.
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        buffer = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        return (buffer[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:]))
+
+
+class ModelParameters:
+    """
+    The parts of a trained LightFM model that serving reads, under LightFM's attribute names
+    so FoldInEngine accepts it in place of the model. It cannot be trained or predict() with.
+    """
+
+    def __init__(self, params, arrays):
+        for name in MODEL_PARAMS:
+            setattr(self, name, params[name])
+        for name in MODEL_ARRAYS:
+            setattr(self, name, arrays[name])
+
+
+class DatasetMapping:
+    """
+    Stand-in for the fitted LightFM Dataset with the maps serving needs. The user-feature map
+    only holds the genre features; the per-user identity features of training users, the
+    training user ids and item features are not part of the artifacts.
+    """
+
+    def __init__(self, item_id_map, user_feature_map, num_user_features):
+        self.item_id_map = item_id_map
+        self.user_feature_map = user_feature_map
+        self.num_user_features = num_user_features
+
+    def mapping(self):
+        return {}, self.user_feature_map, self.item_id_map, {}
+
+    def user_features_shape(self):
+        return 0, self.num_user_features
+
+    def interactions_shape(self):
+        return 0, len(self.item_id_map)
+
+
+class ModelArtifacts:
+    def __init__(self, path, manifest, model, dataset, catalog, neighbours=None):
+        self.path = path
+        self.manifest = manifest
+        self.version = manifest["version"]
+        self.model = model
+        self.dataset = dataset
+        self.catalog = catalog
+        # None for versions exported before the neighbour table existed
+        self.neighbours = neighbours
+        # Digest of the anime CSV the catalog was built from; None for older versions
+        self.catalog_source = manifest["catalog"].get("source_digest")
+
+
+def has_artifacts(root):
+    return (Path(root) / CURRENT_NAME).is_file()
+
+
+def export_artifacts(model, dataset, anime_df, root, neighbours=NEIGHBOURS_PER_ITEM):
+    """
+    Write a new artifact version under root and point root/CURRENT at it.
+
+    Every array is a plain .npy file and strings are UTF-8 buffers with offsets, so the server
+    can memory-map all of it; manifest.json records the model hyperparameters, the dtype and
+    shape of every file, the catalog vocabularies and a digest of anime_df, so the server
+    can tell whether the catalog is still current. The item neighbour table behind the
+    "because you watched" explanations is precomputed here too. Returns the version directory.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    catalog = CatalogIndex(anime_df, dataset)
+    neighbour_table = NeighbourTable.build(model.item_embeddings, neighbours)
+    user_id_map, user_feature_map, _, _ = dataset.mapping()
+    # Identity features are named after training users and never looked up when serving
+    genre_feature_map = {name: int(feature_id) for name, feature_id in user_feature_map.items()
+                         if name not in user_id_map}
+
+    staging = root / f".staging-{os.getpid()}-{time.time_ns()}"
+    staging.mkdir()
+    files = {}
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        for name in MODEL_ARRAYS:
+            _write_array(staging, f"model.{name}", getattr(model, name), files, digest)
+        _write_strings(staging, "model.item_ids", catalog.original_ids, files, digest)
+        for name in CATALOG_TEXT_COLUMNS:
+            _write_strings(staging, f"catalog.{name}", getattr(catalog, name), files, digest)
+        for name in CATALOG_ARRAY_COLUMNS:
+            _write_array(staging, f"catalog.{name}", getattr(catalog, name), files, digest)
+        _write_array(staging, "neighbours.ids", neighbour_table.ids, files, digest)
+        _write_array(staging, "neighbours.similarities", neighbour_table.similarities, files, digest)
+
+        version = f"{time.strftime('%Y%m%d-%H%M%S')}-{digest.hexdigest()[:8]}"
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "version": version,
+            "created_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            "checksum": digest.hexdigest(),
+            "model": {name: _json_value(getattr(model, name)) for name in MODEL_PARAMS},
+            "user_features": genre_feature_map,
+            "catalog": {
+                "genre_names": list(catalog.genre_names),
+                "media_type_names": list(catalog.media_type_names),
+                "source_digest": source_digest(anime_df),
+            },
+            "files": files,
+        }
+        (staging / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+
+        version_dir = root / version
+        os.replace(staging, version_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    current_tmp = root / f".{CURRENT_NAME}.tmp"
+    current_tmp.write_text(version + "\n")
+    os.replace(current_tmp, root / CURRENT_NAME)
+    return version_dir
+
+
+def load_artifacts(root, version=None, mmap=True):
+    """
+    Load an artifact version (root/CURRENT by default). With mmap the arrays are mapped
+    read-only rather than read, so startup does no parameter I/O and every worker process
+    shares the same pages through the OS cache.
+    """
+    root = Path(root)
+    version = version or (root / CURRENT_NAME).read_text().strip()
+    path = root / version
+    manifest = json.loads((path / MANIFEST_NAME).read_text())
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format {manifest.get('format_version')} in {path}")
+
+    files = manifest["files"]
+    mmap_mode = 'r' if mmap else None
+
+    def array(name):
+        entry = files[name]
+        loaded = np.load(path / entry["file"], mmap_mode=mmap_mode, allow_pickle=False)
+        if str(loaded.dtype) != entry["dtype"] or list(loaded.shape) != entry["shape"]:
+            raise ValueError(f"{path / entry['file']} does not match the manifest")
+        # A plain ndarray view keeps the mapping alive without memmap subclass semantics
+        loaded = loaded.view(np.ndarray)
+        loaded.flags.writeable = False
+        return loaded
+
+    def strings(name):
+        return StringColumn(array(f"{name}.offsets"), array(f"{name}.data"))
+
+    model = ModelParameters(manifest["model"], {name: array(f"model.{name}") for name in MODEL_ARRAYS})
+    item_ids = strings("model.item_ids")
+    item_id_map = {item_id: internal_id for internal_id, item_id in enumerate(item_ids)}
+    dataset = DatasetMapping(item_id_map, manifest["user_features"], model.user_embeddings.shape[0])
+
+    columns = {name: strings(f"catalog.{name}") for name in CATALOG_TEXT_COLUMNS}
+    columns.update({name: array(f"catalog.{name}") for name in CATALOG_ARRAY_COLUMNS})
+    catalog = CatalogIndex.from_columns(
+        item_ids,
+        item_id_map,
+        columns,
+        manifest["catalog"]["genre_names"],
+        manifest["catalog"]["media_type_names"],
+    )
+
+    neighbour_table = None
+    if "neighbours.ids" in files:
+        neighbour_table = NeighbourTable(array("neighbours.ids"), array("neighbours.similarities"))
+
+    return ModelArtifacts(path, manifest, model, dataset, catalog, neighbour_table)
+
+
+def _write_array(directory, name, array, files, digest):
+    array = np.ascontiguousarray(array)
+    file_name = f"{name}.npy"
+    np.save(directory / file_name, array, allow_pickle=False)
+    digest.update(array.tobytes())
+    files[name] = {"file": file_name, "dtype": str(array.dtype), "shape": list(array.shape)}
+
+
+def _write_strings(directory, name, values, files, digest):
+    encoded = [str(value).encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    _write_array(directory, f"{name}.offsets", offsets, files, digest)
+    _write_array(directory, f"{name}.data", data, files, digest)
+
+
+def _json_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+if __name__ == "__main__":
+    # Convert existing pickles, e.g. from backend/:
+    #   python artifacts.py --model model_files/lightfm_anime_model.pkl --dataset model_files/lightfm_anime_dataset.pkl
+    parser = argparse.ArgumentParser(description="Export pickled LightFM files as memory-mappable artifacts")
+    parser.add_argument("--model", default="model_files/lightfm_anime_model.pkl")
+    parser.add_argument("--dataset", default="model_files/lightfm_anime_dataset.pkl")
+    parser.add_argument("--anime-csv", default="data/anime_data_master.csv")
+    parser.add_argument("--out", default="model_files/artifacts")
+    args = parser.parse_args()
+
+    with open(args.model, 'rb') as model_file:
+        model = pickle.load(model_file)
+    with open(args.dataset, 'rb') as dataset_file:
+        dataset = pickle.load(dataset_file)
+    anime_df = pd.read_csv(args.anime_csv, na_values=[], keep_default_na=False)
+
+    version_dir = export_artifacts(model, dataset, anime_df, args.out)
+    print(f"Exported model artifacts to {version_dir}")
@@ -0,0 +1,77 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+# Overlay status codes index into this list
+STATUS_NAMES = ['watching', 'completed', 'on_hold', 'dropped', 'plan_to_watch']
+REQUIRED_COLUMNS = ['anime_id', 'x_coord', 'y_coord', 'num_list_users', 'title']
+
+
+class AtlasIndex:
+    """
+    The static part of /atlas, merged and encoded once at startup (or data reload).
+
+    payload holds the ready-to-send JSON body for the anonymous atlas and etag its hash.
+    A user's list is applied as a separate overlay of parallel arrays (anime ids and
+    STATUS_NAMES codes) that the frontend joins onto the points, so per-user requests
+    never touch the per-point records.
+    """
+
+    def __init__(self, atlas_df, anime_df):
+        atlas_df = atlas_df.copy()
+        anime_info_df = anime_df[['anime_id', 'num_list_users', 'title']].copy()
+
+        # Ensure 'anime_id' is the same data type in both DataFrames before merging
+        atlas_df['anime_id'] = atlas_df['anime_id'].astype(int)
+        anime_info_df['anime_id'] = anime_info_df['anime_id'].astype(int)
+        merged_df = pd.merge(atlas_df, anime_info_df, on='anime_id')
+
+        missing = [col for col in REQUIRED_COLUMNS if col not in merged_df.columns]
+        if missing:
+            raise ValueError(f"Atlas data is missing required columns: {missing}")
+
+        self.anime_ids = merged_df['anime_id'].to_numpy(dtype=np.int64)
+        self.x = merged_df['x_coord'].to_numpy(dtype=np.float64)
+        self.y = merged_df['y_coord'].to_numpy(dtype=np.float64)
+        self.num_list_users = pd.to_numeric(merged_df['num_list_users'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+        self.titles = merged_df['title'].astype(str).to_numpy(dtype=object)
+        for column in (self.anime_ids, self.x, self.y, self.num_list_users, self.titles):
+            column.flags.writeable = False
+
+        records = merged_df.to_dict('records')
+        for record in records:
+            record['user_status'] = None
+        self.points_json = _encode(records)
+        self.payload = b'{"atlas_data":' + self.points_json + b'}'
+        self.etag = '"' + hashlib.blake2b(self.payload, digest_size=16).hexdigest() + '"'
+
+    def __len__(self):
+        return len(self.anime_ids)
+
+    def user_overlay(self, anime_status):
+        """
+        Compact overlay of a user's statuses for points on the atlas, from {anime_id: status}.
+        """
+        status_codes = {name: code for code, name in enumerate(STATUS_NAMES)}
+        listed = [(anime_id, status_codes[status]) for anime_id, status in anime_status.items() if status in status_codes]
+        if not listed:
+            return {"anime_ids": [], "statuses": [], "status_names": STATUS_NAMES}
+
+        ids = np.fromiter((anime_id for anime_id, _ in listed), dtype=np.int64, count=len(listed))
+        codes = np.fromiter((code for _, code in listed), dtype=np.int8, count=len(listed))
+        on_atlas = np.isin(ids, self.anime_ids)
+        return {
+            "anime_ids": ids[on_atlas].tolist(),
+            "statuses": codes[on_atlas].tolist(),
+            "status_names": STATUS_NAMES,
+        }
+
+    def user_payload(self, anime_status):
+        """JSON body for /atlas?username=: the cached points plus the user's overlay."""
+        return b'{"atlas_data":' + self.points_json + b',"user_overlay":' + _encode(self.user_overlay(anime_status)) + b'}'
+
+
+def _encode(content):
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import Counter
+
+import httpx
+
+from mal_client import MALError
+from user_cache import normalize_username
+
+BATCH_MAX_USERS = int(os.getenv("BATCH_MAX_USERS", 1000))
+BATCH_FETCH_CONCURRENCY = int(os.getenv("BATCH_FETCH_CONCURRENCY", 8))
+BATCH_SCORE_BLOCK = int(os.getenv("BATCH_SCORE_BLOCK", 32))
+
+
+def unique_usernames(usernames):
+    """Drop blanks and case-insensitive repeats, keeping the first spelling and the order."""
+    seen = set()
+    unique = []
+    for username in usernames:
+        key = normalize_username(username)
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(username.strip())
+    return unique
+
+
+def user_error(username, status, detail):
+    return {"username": username, "status": status, "detail": detail}
+
+
+def user_result(username, result):
+    """One NDJSON line for a predict_scores_batch entry, with /predict's error statuses."""
+    if isinstance(result, Exception):
+        print(f"Error generating batch recommendations for {username}: {result!r}")
+        return user_error(username, 500, "Internal Server Error during prediction.")
+
+    top_20_predictions, ranked, user_stats, user_anime_details = result
+    if len(user_anime_details) == 0:
+        return user_error(username, 404, f"Username '{username}' not found on MyAnimeList.")
+    if len(top_20_predictions) == 0:
+        return user_error(username, 400, f"Unable to generate recommendations for user '{username}'")
+    return {
+        "username": username,
+        "status": 200,
+        "recommendations": top_20_predictions,
+        "total_count": len(ranked),
+        "user_stats": user_stats,
+    }
+
+
+async def predict_many(usernames, user_lists, score_block, concurrency=BATCH_FETCH_CONCURRENCY,
+                       block_size=BATCH_SCORE_BLOCK):
+    """
+    Yield one result dict per username, in the order they finish.
+
+    At most `concurrency` MAL lists are fetched at once. Whatever lists have arrived are
+    handed to `score_block` (an async callable running predict_scores_batch) in blocks of
+    up to block_size, while the remaining fetches carry on. Failures are per user: a MAL
+    error or an unknown user becomes that user's line, not an error for the whole batch.
+    """
+    fetched = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def fetch(username):
+        async with semaphore:
+            try:
+                list_objects = await user_lists.get(username, store=False)
+            except MALError as e:
+                print(f"Error fetching anime list for {username}: {e}")
+                fetched.put_nowait((username, None, user_error(
+                    username, 502, "MyAnimeList is not responding. Please try again later."
+                )))
+            except Exception as e:
+                print(f"Error fetching anime list for {username}: {e!r}")
+                fetched.put_nowait((username, None, user_error(username, 500, "Failed to fetch the anime list.")))
+            else:
+                fetched.put_nowait((username, list_objects or [], None))
+
+    tasks = [asyncio.create_task(fetch(username)) for username in usernames]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            block = [await fetched.get()]
+            while len(block) < block_size and not fetched.empty():
+                block.append(fetched.get_nowait())
+            remaining -= len(block)
+
+            to_score = []
+            for username, list_objects, error in block:
+                if error is not None:
+                    yield error
+                else:
+                    to_score.append((username, list_objects))
+            if to_score:
+                results = await score_block(to_score)
+                for (username, _), result in zip(to_score, results):
+                    yield user_result(username, result)
+    finally:
+        # The client went away or the server is shutting down
+        for task in tasks:
+            task.cancel()
+
+
+async def run_cli(args):
+    if args.input == "-":
+        usernames = unique_usernames(sys.stdin.read().split())
+    else:
+        with open(args.input) as f:
+            usernames = unique_usernames(f.read().split())
+    out = open(args.output, "w") if args.output != "-" else sys.stdout
+    chunks = [usernames[i:i + args.chunk_size] for i in range(0, len(usernames), args.chunk_size)]
+    statuses = Counter()
+    in_flight = asyncio.Semaphore(args.parallel)
+
+    async def send(client, chunk):
+        async with in_flight:
+            answered = set()
+            try:
+                async with client.stream("POST", f"{args.url.rstrip('/')}/predict/batch",
+                                         json={"usernames": chunk, "concurrency": args.concurrency}) as response:
+                    if response.status_code != 200:
+                        detail = (await response.aread()).decode(errors="replace")
+                        raise httpx.HTTPStatusError(detail, request=response.request, response=response)
+                    async for line in response.aiter_lines():
+                        if line:
+                            result = json.loads(line)
+                            answered.add(result["username"])
+                            statuses[result["status"]] += 1
+                            out.write(line + "\n")
+            except httpx.HTTPError as e:
+                print(f"Batch of {len(chunk)} users failed: {e}", file=sys.stderr)
+                for username in chunk:
+                    if username in answered:
+                        continue
+                    statuses["failed"] += 1
+                    out.write(json.dumps(user_error(username, "failed", str(e))) + "\n")
+            out.flush()
+            print(f"{sum(statuses.values())}/{len(usernames)} users done", file=sys.stderr)
+
+    # The server streams each chunk, so only the connection needs a timeout, not the read
+    async with httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=None)) as client:
+        await asyncio.gather(*(send(client, chunk) for chunk in chunks))
+
+    if out is not sys.stdout:
+        out.close()
+    print(f"Done: {dict(statuses)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fetch recommendations for many usernames from /predict/batch and write them as NDJSON"
+    )
+    parser.add_argument("input", help="File of whitespace-separated usernames, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="NDJSON output file (default: stdout)")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--chunk-size", type=int, default=min(200, BATCH_MAX_USERS),
+                        help="Usernames per /predict/batch request")
+    parser.add_argument("--parallel", type=int, default=1, help="Requests in flight at once")
+    parser.add_argument("--concurrency", type=int, default=BATCH_FETCH_CONCURRENCY,
+                        help="MAL fetches in flight per request (capped by the server)")
+    asyncio.run(run_cli(parser.parse_args()))
@@ -0,0 +1,87 @@
+import asyncio
+import os
+
+from metrics import untraced
+from model_executor import ExecutorSaturated
+
+PREDICT_MAX_BATCH = int(os.getenv("PREDICT_MAX_BATCH", 8))
+PREDICT_MAX_WAIT_MS = float(os.getenv("PREDICT_MAX_WAIT_MS", 2))
+
+
+class PredictBatcher:
+    """
+    Groups concurrent /predict calls into one model-executor job.
+
+    The first call to arrive opens a batch; it is flushed after max_wait_ms or as soon as
+    max_batch calls have joined, and run_batch receives the list of every caller's
+    arguments. run_batch returns one result per call (an exception instance fails only that
+    call). A batch takes a single executor slot, so admission control applies per batch,
+    and a call is refused up front with ExecutorSaturated when the executor is already full.
+    max_batch=1 disables batching.
+    """
+
+    def __init__(self, executor, run_batch, max_batch=PREDICT_MAX_BATCH, max_wait_ms=PREDICT_MAX_WAIT_MS):
+        self.executor = executor
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.calls = 0
+        self._pending = []
+        self._timer = None
+        # The event loop only keeps weak references to tasks; a running batch must stay alive
+        self._tasks = set()
+
+    async def submit(self, *args):
+        if self.executor.saturated:
+            self.executor.rejected += 1
+            raise ExecutorSaturated(self.executor.retry_after)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((args, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            self.batches += 1
+            self.calls += len(batch)
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        # Shared work is not attributed to whichever caller opened the batch; each caller's
+        # log line shows its wait as predict.batch_wait
+        if len(batch) > 1:
+            untraced()
+        try:
+            results = await self.executor.run(self.run_batch, [args for args, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "mean_batch_size": round(self.calls / self.batches, 2) if self.batches else 0.0,
+        }
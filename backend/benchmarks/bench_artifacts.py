@@ -0,0 +1,139 @@
+"""
+Compare loading the model from pickles with memory-mapping the exported artifacts.
+
+Run from the backend directory:
+    python -m benchmarks.bench_artifacts [--users 200000] [--items 25000] [--components 30]
+
+Builds a LightFM model and Dataset of the given size (random parameters, no training),
+writes both the pickles main.py used to load and an artifact directory, and checks that
+fold-in scores and every catalog record are identical either way. It then loads each format
+in fresh processes and reports startup time plus private (anonymous) and shared (file-backed)
+resident memory, which is what each extra uvicorn worker would add.
+"""
+import argparse
+import json
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from lightfm import LightFM
+from lightfm.data import Dataset
+from scipy.sparse import csr_matrix
+
+from artifacts import export_artifacts, load_artifacts
+from catalog import CatalogIndex
+from fold_in import FoldInEngine
+from benchmarks.synthetic import GENRES, make_catalog
+
+CHILD = """
+import json, pickle, sys, time
+start = time.perf_counter()
+if sys.argv[1] == "pickle":
+    import pandas as pd
+    from catalog import CatalogIndex
+    with open(sys.argv[2], 'rb') as f:
+        model = pickle.load(f)
+    with open(sys.argv[3], 'rb') as f:
+        dataset = pickle.load(f)
+    catalog = CatalogIndex(pd.read_pickle(sys.argv[4]), dataset)
+else:
+    from artifacts import load_artifacts
+    artifacts = load_artifacts(sys.argv[2])
+    model, catalog = artifacts.model, artifacts.catalog
+elapsed = time.perf_counter() - start
+# Touch every parameter page, as serving eventually does
+checksum = float(model.item_embeddings.sum() + model.user_embeddings.sum())
+status = dict(line.split(':', 1) for line in open('/proc/self/status'))
+print(json.dumps({"seconds": elapsed, "anon_kb": int(status["RssAnon"].split()[0]), "file_kb": int(status["RssFile"].split()[0])}))
+"""
+
+
+def make_random_model(num_users, num_items, no_components, seed=0):
+    rng = np.random.default_rng(seed)
+    usernames = [f"user{i}" for i in range(num_users)]
+    anime_ids = [str(i + 1) for i in range(num_items)]
+    dataset = Dataset()
+    dataset.fit(users=usernames, items=anime_ids, user_features=GENRES)
+    num_user_features = dataset.user_features_shape()[1]
+
+    model = LightFM(no_components=no_components, loss='warp', random_state=42)
+    model._initialize(no_components, num_items, num_user_features)
+    model.item_embeddings[:] = rng.normal(scale=0.3, size=model.item_embeddings.shape)
+    model.item_biases[:] = rng.normal(scale=0.1, size=num_items)
+    model.user_embeddings[:] = rng.normal(scale=0.3, size=model.user_embeddings.shape)
+    model.user_biases[:] = rng.normal(scale=0.1, size=num_user_features)
+    model.user_embedding_gradients[:] = rng.uniform(1, 5, size=model.user_embedding_gradients.shape)
+    model.user_bias_gradients[:] = rng.uniform(1, 5, size=num_user_features)
+
+    item_genres = rng.random((num_items, len(GENRES))) < 0.2
+    df = make_catalog(anime_ids, item_genres, seed)
+    df["synopsis"] = "A synthetic synopsis long enough to look like a real one. " * 10
+    return dataset, model, df
+
+
+def check_parity(model, dataset, df, artifacts):
+    catalog = CatalogIndex(df, dataset)
+    for internal_id in range(len(catalog)):
+        if catalog.record(internal_id, 0.5) != artifacts.catalog.record(internal_id, 0.5):
+            raise SystemExit(f"Catalog record {internal_id} differs")
+    for filters in ({}, {"genres": ["Action", "Drama"]}, {"media_types": ["tv"], "filter_sequels": True}):
+        if not np.array_equal(catalog.filter_mask(filters), artifacts.catalog.filter_mask(filters)):
+            raise SystemExit(f"Filter mask differs for {filters}")
+
+    rng = np.random.default_rng(1)
+    _, user_feature_map, _, _ = dataset.mapping()
+    feature_ids = [user_feature_map[g] for g in GENRES[:5]]
+    features = csr_matrix((rng.random(5), ([0] * 5, feature_ids)), shape=(1, dataset.user_features_shape()[1]))
+    items = rng.choice(dataset.interactions_shape()[1], size=200, replace=False)
+    interactions = csr_matrix((rng.random(200), ([0] * 200, items)), shape=(1, dataset.interactions_shape()[1]))
+    if not np.array_equal(FoldInEngine(model).predict(features, interactions),
+                          FoldInEngine(artifacts.model).predict(features, interactions)):
+        raise SystemExit("Fold-in scores differ between pickle and artifacts")
+
+
+def run_child(args, repeat):
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", CHILD, *args], capture_output=True, text=True, check=True)
+        runs.append(json.loads(output.stdout))
+    return {key: float(np.median([run[key] for run in runs])) for key in runs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200000)
+    parser.add_argument("--items", type=int, default=25000)
+    parser.add_argument("--components", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    dataset, model, df = make_random_model(args.users, args.items, args.components)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        with open(tmp / "model.pkl", 'wb') as f:
+            pickle.dump(model, f)
+        with open(tmp / "dataset.pkl", 'wb') as f:
+            pickle.dump(dataset, f)
+        df.to_pickle(tmp / "catalog.pkl")
+
+        start = time.perf_counter()
+        export_artifacts(model, dataset, df, tmp / "artifacts")
+        print(f"Export took {time.perf_counter() - start:.2f} s")
+        check_parity(model, dataset, df, load_artifacts(tmp / "artifacts"))
+        print("Fold-in scores and catalog records identical for pickle and artifacts")
+
+        pickled = run_child(["pickle", str(tmp / "model.pkl"), str(tmp / "dataset.pkl"), str(tmp / "catalog.pkl")], args.repeat)
+        mapped = run_child(["mmap", str(tmp / "artifacts")], args.repeat)
+
+    print(f"{args.users} users, {args.items} items, {args.components} components (median of {args.repeat} processes)")
+    for name, result in (("pickle", pickled), ("mmap", mapped)):
+        print(f"  {name:<7} load {result['seconds'] * 1000:8.1f} ms  "
+              f"private RSS {result['anon_kb'] / 1024:7.1f} MB  shared RSS {result['file_kb'] / 1024:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark atlas viewport queries on the spatial grid against a full scan.
+
+Run from the backend directory:
+    python -m benchmarks.bench_atlas_spatial [--sizes 10000 100000 1000000] [--queries 200]
+
+For each catalog size, random viewports at several zoom levels are answered by the grid
+and by masking every point, checking both return the same most-popular points.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from atlas import AtlasIndex
+from spatial import AtlasGrid, VIEWPORT_POINT_CAPS
+
+
+def make_atlas(size, rng):
+    anime_ids = np.arange(1, size + 1)
+    # Clustered layout, like a 2-D embedding of genres
+    centers = rng.normal(scale=10.0, size=(40, 2))
+    assignment = rng.integers(0, len(centers), size=size)
+    coords = centers[assignment] + rng.normal(scale=1.5, size=(size, 2))
+    atlas_df = pd.DataFrame({"anime_id": anime_ids, "x_coord": coords[:, 0], "y_coord": coords[:, 1]})
+    anime_df = pd.DataFrame({
+        "anime_id": anime_ids,
+        "num_list_users": rng.zipf(1.4, size=size) % 4000000,
+        "title": [f"Synthetic Anime {i}" for i in anime_ids],
+    })
+    return AtlasIndex(atlas_df, anime_df)
+
+
+def full_scan(atlas, box, limit):
+    min_x, min_y, max_x, max_y = box
+    inside = np.flatnonzero((atlas.x >= min_x) & (atlas.x <= max_x) & (atlas.y >= min_y) & (atlas.y <= max_y))
+    ranked = inside[np.argsort(-atlas.num_list_users[inside], kind='stable')]
+    return ranked[:limit], inside.size > limit
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'points':>9} {'zoom':>4} {'grid p50':>10} {'grid p95':>10} {'scan p50':>10}")
+    for size in args.sizes:
+        atlas = make_atlas(size, rng)
+        start = time.perf_counter()
+        grid = AtlasGrid(atlas)
+        build_time = time.perf_counter() - start
+        min_x, min_y, max_x, max_y = grid.bounds
+
+        for zoom in range(len(VIEWPORT_POINT_CAPS)):
+            limit = VIEWPORT_POINT_CAPS[zoom]
+            span_x = (max_x - min_x) / 2 ** zoom
+            span_y = (max_y - min_y) / 2 ** zoom
+            grid_times, scan_times = [], []
+            for _ in range(args.queries):
+                x0 = min_x + rng.random() * max(0.0, max_x - min_x - span_x)
+                y0 = min_y + rng.random() * max(0.0, max_y - min_y - span_y)
+                box = (x0, y0, x0 + span_x, y0 + span_y)
+
+                t0 = time.perf_counter()
+                indices, truncated = grid.query(*box, limit)
+                t1 = time.perf_counter()
+                expected, expected_truncated = full_scan(atlas, box, limit)
+                t2 = time.perf_counter()
+
+                if truncated != expected_truncated or not np.array_equal(
+                        np.sort(atlas.num_list_users[indices]), np.sort(atlas.num_list_users[expected])):
+                    raise SystemExit(f"Grid and full scan disagree for {box}")
+                grid_times.append(t1 - t0)
+                scan_times.append(t2 - t1)
+
+            print(f"{size:>9} {zoom:>4} {np.percentile(grid_times, 50) * 1000:>8.3f}ms "
+                  f"{np.percentile(grid_times, 95) * 1000:>8.3f}ms {np.percentile(scan_times, 50) * 1000:>8.3f}ms")
+        print(f"{size:>9} grid built in {build_time * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
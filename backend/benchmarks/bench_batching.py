@@ -0,0 +1,107 @@
+"""
+Compare micro-batched /predict model work against one executor job per request.
+
+Run from the backend directory:
+    python -m benchmarks.bench_batching [--items 10000] [--clients 16] [--seconds 5]
+
+First checks that predict_scores_batch returns the same top-20 as predict_scores for
+every synthetic user (the fold-in is per user and seeded, so only the scoring product
+may differ, by float rounding). Then drives a PredictBatcher on a ModelExecutor from
+--clients concurrent asyncio clients for each (max batch, max wait) setting and reports
+requests/s, latency percentiles and the mean batch size. (1, 0 ms) is the unbatched
+baseline.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+
+import numpy as np
+
+from batching import PredictBatcher
+from catalog import CatalogIndex
+from fold_in import FoldInEngine
+from model_executor import ModelExecutor
+from predict import predict_scores, predict_scores_batch
+from benchmarks.fake_mal import make_anime_list
+from benchmarks.synthetic import GENRES, make_catalog, make_model
+
+SETTINGS = [(1, 0.0), (4, 2.0), (8, 2.0), (16, 5.0), (32, 10.0)]
+
+
+def check_parity(users, dataset, model, catalog, engine):
+    batched = predict_scores_batch(users, dataset, model, catalog, fold_in_engine=engine)
+    max_diff = 0.0
+    for (username, list_objects), result in zip(users, batched):
+        single = predict_scores(username, list_objects, dataset, model, catalog, fold_in_engine=engine)
+        if [r["anime_id"] for r in single[0]] != [r["anime_id"] for r in result[0]]:
+            raise SystemExit(f"Batched top-20 differs from single-user top-20 for {username}")
+        max_diff = max(max_diff, float(np.abs(single[1].scores - result[1].scores).max()))
+    return max_diff
+
+
+async def drive(batcher, users, clients, seconds):
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def client(offset):
+        i = offset
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await batcher.submit(*users[i % len(users)])
+            latencies.append(time.perf_counter() - started)
+            i += clients
+
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--list-size", type=int, default=300)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"Training synthetic model ({args.items} items)...")
+    dataset, model, _, item_genres = make_model(num_users=2000, num_items=args.items, epochs=5)
+    _, _, item_id_map, _ = dataset.mapping()
+    anime_ids = list(item_id_map)
+    catalog = CatalogIndex(make_catalog(anime_ids, item_genres), dataset)
+    engine = FoldInEngine(model)
+    genres_by_id = {int(a): [GENRES[j] for j in np.flatnonzero(item_genres[i])] or [GENRES[0]]
+                    for i, a in enumerate(anime_ids)}
+    users = [(f"user{i}", make_anime_list(anime_ids, args.list_size, seed=i, genres_by_id=genres_by_id))
+             for i in range(args.users)]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        max_diff = check_parity(users, dataset, model, catalog, engine)
+    print(f"Parity: batched top-20 matches single-user for {len(users)} users, max score diff {max_diff:.2e}")
+
+    def run_batch(batch):
+        return predict_scores_batch(batch, dataset, model, catalog, fold_in_engine=engine)
+
+    print(f"{args.clients} concurrent clients, {args.threads} model threads, {args.seconds:.0f}s per setting")
+    baseline = None
+    for max_batch, max_wait_ms in SETTINGS:
+        # Queue sized so nothing is refused: this measures throughput, not admission control
+        executor = ModelExecutor(threads=args.threads, max_queue=args.clients)
+        batcher = PredictBatcher(executor, run_batch, max_batch=max_batch, max_wait_ms=max_wait_ms)
+        with contextlib.redirect_stdout(io.StringIO()):
+            latencies = asyncio.run(drive(batcher, users, args.clients, args.seconds))
+        executor.shutdown()
+
+        throughput = len(latencies) / args.seconds
+        baseline = baseline or throughput
+        latencies = np.array(latencies) * 1000
+        print(f"batch {max_batch:>2}, wait {max_wait_ms:4.1f} ms: {throughput:7.1f} req/s ({throughput / baseline:.2f}x)  "
+              f"p50 {np.percentile(latencies, 50):6.1f} ms  p99 {np.percentile(latencies, 99):6.1f} ms  "
+              f"mean batch {batcher.stats()['mean_batch_size']}")
+
+
+if __name__ == "__main__":
+    main()
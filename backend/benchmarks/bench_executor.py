@@ -0,0 +1,131 @@
+"""
+Burst /predict against one worker and check admission control and /health latency.
+
+Run from the backend directory:
+    python -m benchmarks.bench_executor [--burst 64] [--threads 2] [--queue 8]
+
+Uses the synthetic data and fake MyAnimeList from bench_workers. For a bounded executor
+(--threads/--queue) and an effectively unbounded one, fires --burst concurrent /predict
+requests at a single-worker serve.py while polling /health, then reports how many were
+served or refused with 503 (and that Retry-After was set), latencies of both, and the
+/health latency during the burst.
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.bench_workers import BACKEND_DIR, free_port, request, write_data
+from benchmarks.fake_mal import FakeMALServer, make_anime_list
+
+
+def percentiles(values):
+    if not values:
+        return "      -"
+    values = np.array(values) * 1000
+    return f"p50 {np.percentile(values, 50):7.1f} ms  p99 {np.percentile(values, 99):7.1f} ms  max {values.max():7.1f} ms"
+
+
+def burst(port, usernames, size):
+    results = []
+    lock = threading.Lock()
+    start_gate = threading.Barrier(size)
+
+    def one(username):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        start_gate.wait()
+        started = time.perf_counter()
+        conn.request("POST", "/predict", body=f'{{"username": "{username}"}}',
+                     headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        response.read()
+        with lock:
+            results.append((response.status, response.getheader("Retry-After"), time.perf_counter() - started))
+
+    threads = [threading.Thread(target=one, args=(usernames[i % len(usernames)],)) for i in range(size)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def run(label, port_env, args, usernames):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port), "--workers", "1"],
+        cwd=BACKEND_DIR, env=port_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                if request(http.client.HTTPConnection("127.0.0.1", port, timeout=5), "GET", "/ready")[0] == 200:
+                    break
+            except OSError:
+                time.sleep(0.1)
+
+        # Warm the user-list cache so the burst measures model work, not MAL fetches
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        for username in usernames:
+            request(conn, "POST", "/predict", {"username": username})
+
+        health_times = []
+        threads, results = burst(port, usernames, args.burst)
+        health = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        while any(t.is_alive() for t in threads):
+            started = time.perf_counter()
+            status, body = request(health, "GET", "/health")
+            health_times.append(time.perf_counter() - started)
+            time.sleep(0.02)
+        for t in threads:
+            t.join()
+        executor = request(health, "GET", "/health")[1]["model_executor"]
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    served = [elapsed for status, _, elapsed in results if status == 200]
+    refused = [elapsed for status, _, elapsed in results if status == 503]
+    missing_retry_after = sum(1 for status, retry_after, _ in results if status == 503 and not retry_after)
+    if missing_retry_after:
+        raise SystemExit(f"{missing_retry_after} 503 responses without Retry-After")
+
+    print(f"{label}: {len(served)} served, {len(refused)} refused with 503, "
+          f"{len(results) - len(served) - len(refused)} other")
+    print(f"    served   {percentiles(served)}")
+    print(f"    refused  {percentiles(refused)}")
+    print(f"    /health  {percentiles(health_times)}  ({len(health_times)} polls)")
+    print(f"    executor wait p95 {executor['wait_ms_p95']} ms, max {executor['wait_ms_max']} ms, "
+          f"rejected {executor['rejected']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--queue", type=int, default=8)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=32)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir, model_dir, anime_ids, genres_by_id = write_data(Path(tmp), args.items)
+        users = {f"user{i}": make_anime_list(anime_ids, 300, seed=i, genres_by_id=genres_by_id)
+                 for i in range(args.users)}
+        with FakeMALServer(users, page_size=1000) as mal:
+            env = dict(os.environ, DATA_DIR=str(data_dir), MODEL_DIR=str(model_dir), MAL_API_URL=mal.base_url,
+                       MODEL_THREADS=str(args.threads))
+            print(f"Burst of {args.burst} /predict requests, {args.items} items, {os.cpu_count()} CPUs")
+            run(f"bounded ({args.threads} threads, queue {args.queue})",
+                dict(env, MODEL_QUEUE_SIZE=str(args.queue)), args, list(users))
+            run(f"unbounded ({args.threads} threads, no queue limit)",
+                dict(env, MODEL_QUEUE_SIZE=str(1_000_000)), args, list(users))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Compare the fold-in engine against the original deepcopy + fit_partial path.
+
+Run from the backend directory:
+    python -m benchmarks.bench_fold_in [--users 20] [--items 3000]
+    python -m benchmarks.bench_fold_in --model-dir model_files [--anime-csv data/anime_data_master.csv]
+
+Runs on a synthetic model, or with --model-dir on a trained lightfm_anime_model.pkl, with
+item genres taken from --anime-csv. For each new user it reports how many of the top-20
+unseen recommendations the two paths share, the Spearman rank correlation of their full
+score vectors, and the time each path takes. Fold-in is a batched approximation of
+fit_partial, so the two do not agree exactly; the bench exits non-zero when the agreement
+falls below MIN_MEAN_TOP_OVERLAP, MIN_TOP_OVERLAP or MIN_SPEARMAN.
+"""
+import argparse
+import pickle
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from fold_in import FoldInEngine
+from predict import build_new_user_matrices, fit_partial_scores
+from benchmarks.synthetic import GENRES, make_model
+
+TOP_N = 20
+# Measured: mean top-20 overlap ~0.95 on the synthetic model, single users down to 0.75
+MIN_MEAN_TOP_OVERLAP = 0.85
+MIN_TOP_OVERLAP = 0.6
+MIN_SPEARMAN = 0.98
+
+
+def spearman(a, b):
+    rank_a = np.argsort(np.argsort(a))
+    rank_b = np.argsort(np.argsort(b))
+    return float(np.corrcoef(rank_a, rank_b)[0, 1])
+
+
+def load_trained(model_dir, anime_csv):
+    """A trained model and dataset, with an items x GENRES matrix of catalog genres."""
+    with open(Path(model_dir) / "lightfm_anime_model.pkl", "rb") as f:
+        model = pickle.load(f)
+    with open(Path(model_dir) / "lightfm_anime_dataset.pkl", "rb") as f:
+        dataset = pickle.load(f)
+    _, _, item_id_map, _ = dataset.mapping()
+    df = pd.read_csv(anime_csv, na_values=[], keep_default_na=False)
+    genres_by_id = dict(zip(df['anime_id'].astype(str), df['genres'].astype(str)))
+    item_genres = np.zeros((len(item_id_map), len(GENRES)), dtype=bool)
+    for anime_id, internal_id in item_id_map.items():
+        names = {g.strip() for g in genres_by_id.get(anime_id, '').split(',')}
+        item_genres[internal_id] = [g in names for g in GENRES]
+    return dataset, model, item_genres
+
+
+def make_new_user(rng, dataset, item_genres, list_size):
+    _, _, item_id_map, _ = dataset.mapping()
+    anime_ids = list(item_id_map.keys())
+    taste = rng.dirichlet(np.full(len(GENRES), 0.3))
+    p = item_genres @ taste + 0.05
+    picked = rng.choice(len(anime_ids), size=list_size, replace=False, p=p / p.sum())
+
+    statuses = ['completed', 'watching', 'plan_to_watch', 'dropped', 'on_hold']
+    new_user_data = [
+        {
+            "anime_id": int(anime_ids[i]),
+            "status": str(rng.choice(statuses, p=[0.6, 0.1, 0.2, 0.05, 0.05])),
+            "score": int(rng.integers(0, 11)),
+        }
+        for i in picked
+    ]
+    genre_counts = item_genres[picked].sum(axis=0) / list_size
+    preferences = {g: float(c) for g, c in zip(GENRES, genre_counts) if c > 0}
+    return preferences, new_user_data
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--items", type=int, default=3000)
+    parser.add_argument("--train-users", type=int, default=2000)
+    parser.add_argument("--model-dir", help="Compare on this trained model instead of a synthetic one")
+    parser.add_argument("--anime-csv", default="data/anime_data_master.csv")
+    args = parser.parse_args()
+
+    if args.model_dir:
+        print(f"Loading trained model from {args.model_dir}...")
+        dataset, model, item_genres = load_trained(args.model_dir, args.anime_csv)
+    else:
+        print(f"Training synthetic model ({args.train_users} users, {args.items} items)...")
+        dataset, model, _, item_genres = make_model(num_users=args.train_users, num_items=args.items)
+    engine = FoldInEngine(model)
+    rng = np.random.default_rng(1)
+
+    overlaps, correlations, legacy_times, engine_times = [], [], [], []
+    for _ in range(args.users):
+        list_size = min(int(rng.integers(20, 400)), item_genres.shape[0] // 2)
+        preferences, new_user_data = make_new_user(rng, dataset, item_genres, list_size)
+        features, interactions = build_new_user_matrices(preferences, new_user_data, dataset)
+
+        start = time.perf_counter()
+        reference = fit_partial_scores(model, features, interactions)
+        legacy_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        folded = engine.predict(features, interactions)
+        engine_times.append(time.perf_counter() - start)
+
+        unseen = np.ones(reference.size, dtype=bool)
+        unseen[interactions.indices] = False
+        top_reference = set(np.flatnonzero(unseen)[np.argsort(-reference[unseen])[:TOP_N]])
+        top_folded = set(np.flatnonzero(unseen)[np.argsort(-folded[unseen])[:TOP_N]])
+        overlaps.append(len(top_reference & top_folded) / TOP_N)
+        correlations.append(spearman(reference, folded))
+
+    print(f"Top-{TOP_N} overlap:      mean {np.mean(overlaps):.3f}, min {np.min(overlaps):.3f}")
+    print(f"Spearman correlation: mean {np.mean(correlations):.4f}, min {np.min(correlations):.4f}")
+    print(f"fit_partial path:     {np.median(legacy_times) * 1000:.2f} ms median")
+    print(f"fold-in engine:       {np.median(engine_times) * 1000:.2f} ms median")
+
+    failures = []
+    if np.mean(overlaps) < MIN_MEAN_TOP_OVERLAP:
+        failures.append(f"mean top-{TOP_N} overlap {np.mean(overlaps):.3f} < {MIN_MEAN_TOP_OVERLAP}")
+    if np.min(overlaps) < MIN_TOP_OVERLAP:
+        failures.append(f"min top-{TOP_N} overlap {np.min(overlaps):.3f} < {MIN_TOP_OVERLAP}")
+    if np.min(correlations) < MIN_SPEARMAN:
+        failures.append(f"min Spearman {np.min(correlations):.4f} < {MIN_SPEARMAN}")
+    if failures:
+        raise SystemExit("Fold-in engine drifted from the fit_partial path: " + "; ".join(failures))
+    print("Fold-in agrees with fit_partial within the thresholds.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Benchmark train.py's ingestion: CSV to filtered LightFM interaction and weight matrices.
+
+Run from the backend directory:
+    python -m benchmarks.bench_ingest [--rows 1000000 10000000] [--legacy-rows 1000000]
+
+Writes synthetic user dumps (users with long-tailed list lengths over a long-tailed
+catalog, with the status/score mix of real lists) to a temporary directory. Checks on a
+small dump (with some digit-only usernames among the others) that the streaming
+pipeline in ingest.py yields exactly the same Dataset mappings and matrices as the
+original pandas/iterrows code, then runs each pipeline in a fresh process per dump size
+and reports wall time per stage and peak RSS. The original pipeline is only run up to
+--legacy-rows, since it takes minutes per million rows.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from lightfm.data import Dataset
+
+from ingest import read_interactions, k_core, first_appearance, interaction_matrices
+
+MIN_INTERACTIONS_PER_USER = 5
+MIN_INTERACTIONS_PER_ITEM = 3
+STATUSES = np.array(['Completed', 'Watching', 'Plan to Watch', 'Dropped', 'On-Hold'])
+
+
+def write_dump(path, rows, num_items=20000, seed=0, chunk_rows=1_000_000):
+    """A user_anime_data CSV with `rows` rows, written in chunks, rows grouped by user."""
+    rng = np.random.default_rng(seed)
+    item_popularity = 1.0 / np.arange(1, num_items + 1) ** 0.9
+    item_popularity /= item_popularity.sum()
+    written = 0
+    user = 0
+    with open(path, 'w') as f:
+        f.write("username,anime_id,anime_title,status,score\n")
+        while written < rows:
+            budget = min(chunk_rows, rows - written)
+            lengths = np.minimum(rng.zipf(1.6, size=20000) + 2, 3000)
+            lengths = lengths[np.cumsum(lengths) <= budget]
+            if lengths.size == 0:
+                lengths = np.array([budget])
+            n = int(lengths.sum())
+            usernames = np.repeat(np.arange(user, user + lengths.size), lengths)
+            anime_ids = rng.choice(num_items, size=n, p=item_popularity) + 1
+            status = STATUSES[rng.choice(5, size=n, p=[0.6, 0.08, 0.2, 0.06, 0.06])]
+            score = np.where(rng.random(n) < 0.3, 0, rng.integers(1, 11, size=n))
+            # Some users have digit-only names, which must keep their leading zeros
+            names = np.where(usernames % 7 == 3, np.char.zfill(usernames.astype(str), 7),
+                             np.char.add("user", usernames.astype(str)))
+            pd.DataFrame({
+                "username": names,
+                "anime_id": anime_ids,
+                "anime_title": np.char.add("Anime ", anime_ids.astype(str)),
+                "status": status,
+                "score": score,
+            }).to_csv(f, header=False, index=False)
+            written += n
+            user += lengths.size
+
+
+def legacy_pipeline(path):
+    """train.py's original ingestion, for reference."""
+    timings = {}
+    started = time.perf_counter()
+    df = pd.read_csv(path)
+    timings["read"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    df['anime_id'] = df['anime_id'].astype(str)
+    df['username'] = df['username'].astype(str)
+    while True:
+        user_counts = df['username'].value_counts()
+        item_counts = df['anime_id'].value_counts()
+        initial_rows = len(df)
+        df = df[df['username'].isin(user_counts[user_counts >= MIN_INTERACTIONS_PER_USER].index)]
+        df = df[df['anime_id'].isin(item_counts[item_counts >= MIN_INTERACTIONS_PER_ITEM].index)]
+        if len(df) == initial_rows:
+            break
+    timings["k_core"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    dataset = Dataset()
+    dataset.fit(users=df['username'].unique(), items=df['anime_id'].unique())
+    interactions_data = []
+    for index, row in df.iterrows():
+        row_weight = 1.0
+        score = float(row['score'])
+        if row['status'] == 'Completed' or row['status'] == 'Watching':
+            if score == 0:
+                row_weight = 0.5
+            elif score >= 8:
+                row_weight = score / 10.0
+            elif score == 7:
+                row_weight = 0.6
+            elif score == 6:
+                row_weight = 0.4
+            elif score == 5:
+                row_weight = 0.2
+            else:
+                row_weight = 0.1
+        elif row['status'] == 'Plan to Watch':
+            row_weight = 0.7
+        elif row['status'] == 'Dropped':
+            row_weight = 0.0
+        elif row['status'] == 'On-Hold':
+            row_weight = 0.2
+        interactions_data.append((row['username'], row['anime_id'], row_weight))
+    interactions, weights = dataset.build_interactions(interactions_data)
+    timings["matrices"] = time.perf_counter() - started
+    return dataset, interactions, weights, timings
+
+
+def streaming_pipeline(path):
+    timings = {}
+    started = time.perf_counter()
+    log = read_interactions(path)
+    timings["read"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    keep = k_core(log.user_codes, log.item_codes, MIN_INTERACTIONS_PER_USER, MIN_INTERACTIONS_PER_ITEM)
+    timings["k_core"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    dataset = Dataset()
+    dataset.fit(users=log.usernames[first_appearance(log.user_codes[keep])],
+                items=log.anime_ids[first_appearance(log.item_codes[keep])])
+    user_id_map, _, item_id_map, _ = dataset.mapping()
+    interactions, weights = interaction_matrices(log, keep, user_id_map, item_id_map)
+    timings["matrices"] = time.perf_counter() - started
+    return dataset, interactions, weights, timings
+
+
+def check_parity(path):
+    legacy = legacy_pipeline(path)
+    streaming = streaming_pipeline(path)
+    if legacy[0].mapping()[0] != streaming[0].mapping()[0] or legacy[0].mapping()[2] != streaming[0].mapping()[2]:
+        raise SystemExit("User or item mappings differ from the original pipeline")
+    for name, a, b in [("interactions", legacy[1], streaming[1]), ("weights", legacy[2], streaming[2])]:
+        if (a.shape != b.shape or a.dtype != b.dtype or not np.array_equal(a.row, b.row)
+                or not np.array_equal(a.col, b.col) or not np.array_equal(a.data, b.data)):
+            raise SystemExit(f"{name} matrix differs from the original pipeline")
+    return legacy[1].nnz
+
+
+def peak_rss_mb():
+    # getrusage's ru_maxrss carries over the parent's peak into a forked child, VmHWM does not
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def run_child(pipeline, path):
+    _, interactions, _, timings = (legacy_pipeline if pipeline == "legacy" else streaming_pipeline)(path)
+    timings["nnz"] = int(interactions.nnz)
+    timings["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(timings))
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        run_child(sys.argv[2], sys.argv[3])
+        return
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--legacy-rows", type=int, default=1_000_000)
+    parser.add_argument("--parity-rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        parity_path = Path(tmp) / "parity.csv"
+        write_dump(parity_path, args.parity_rows, seed=1)
+        nnz = check_parity(parity_path)
+        print(f"Parity: identical mappings and matrices on {args.parity_rows} rows ({nnz} kept)")
+
+        for rows in args.rows:
+            path = Path(tmp) / f"dump_{rows}.csv"
+            started = time.perf_counter()
+            write_dump(path, rows)
+            print(f"{rows} rows ({path.stat().st_size / 1e6:.0f} MB CSV, written in {time.perf_counter() - started:.0f}s):")
+            for pipeline in ["streaming", "legacy"]:
+                if pipeline == "legacy" and rows > args.legacy_rows:
+                    print(f"    legacy     skipped (> --legacy-rows {args.legacy_rows})")
+                    continue
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_ingest", "--child", pipeline, str(path)],
+                    capture_output=True, text=True, check=True,
+                ).stdout.strip().splitlines()[-1]
+                result = json.loads(output)
+                total = result["read"] + result["k_core"] + result["matrices"]
+                print(f"    {pipeline:<10} total {total:7.1f}s  (read {result['read']:6.1f}s, "
+                      f"k-core {result['k_core']:6.1f}s, matrices {result['matrices']:6.1f}s)  "
+                      f"peak RSS {result['peak_rss_mb']:6.0f} MB, {result['nnz']} interactions kept")
+            path.unlink()
+
+
+if __name__ == "__main__":
+    main()
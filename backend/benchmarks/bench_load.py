@@ -0,0 +1,326 @@
+"""
+Load test serve.py end to end against a synthetic catalog, model and MyAnimeList.
+
+Run from the backend directory:
+    python -m benchmarks.bench_load [--items 10000] [--concurrency 1 4 16] [--seconds 10]
+    python -m benchmarks.bench_load --compare benchmarks/results/load-<old>.json [benchmarks/results/load-<new>.json]
+
+Writes a synthetic catalog, atlas and trained model (as memory-mapped artifacts) of the
+given size to a temporary directory and serves a fake MyAnimeList whose lists have a
+long-tailed size distribution (median --list-size, a few past MAL's 1000-entry page so
+pagination is exercised). It then starts serve.py with --workers workers, warms every
+user's list and session, and for each scenario and concurrency level runs that many
+closed-loop clients (one keep-alive connection each) for --warmup and then --seconds.
+
+Scenarios:
+    predict      POST /predict for a random user
+    filtered     POST /predict/filtered on a user's session with random genre/type filters and page
+    atlas        GET /atlas (anonymous, precomputed)
+    atlas_user   GET /atlas?username=... (per-user overlay)
+    anime        GET /get/anime/{id} for a random catalog id
+
+Reports p50/p95/p99 latency, throughput, errors and the server's peak RSS during each run
+(VmHWM, reset through /proc/<pid>/clear_refs before each run, summed over serve.py's
+processes, so memory shared between workers is counted once per worker). Everything is
+seeded, and runs offline. Results are saved as JSON named after the git commit, so two
+commits can be compared with --compare. Clients run in this process as threads, next to
+the fake MAL server, so the server shares the machine with them: compare results from the
+same machine and settings only.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+
+from benchmarks.bench_workers import BACKEND_DIR, free_port, write_data
+from benchmarks.fake_mal import FakeMALServer, make_anime_list
+from benchmarks.synthetic import GENRES, MEDIA_TYPES
+
+SCENARIOS = ("predict", "filtered", "atlas", "atlas_user", "anime")
+RESULTS_DIR = BACKEND_DIR / "benchmarks" / "results"
+# MAL answers at most this many list entries per page
+MAL_PAGE_SIZE = 1000
+
+
+def list_sizes(num_users, median, num_items, seed=0):
+    """Long-tailed MAL list sizes: log-normal around median, between 10 and the catalog size."""
+    rng = np.random.default_rng(seed)
+    return np.clip(rng.lognormal(np.log(median), 1.0, size=num_users), 10, num_items).astype(int)
+
+
+class Client:
+    """One keep-alive connection to the server; request() returns (status, body)."""
+
+    def __init__(self, port):
+        self.port = port
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+
+    def request(self, method, path, body=None):
+        payload = json.dumps(body).encode() if body is not None else None
+        try:
+            self.conn.request(method, path, body=payload, headers={"Content-Type": "application/json"})
+            response = self.conn.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            # Reconnect on the next request
+            self.conn.close()
+            self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            return 0, b""
+
+
+def make_request(scenario, rng, usernames, sessions, anime_ids):
+    """(method, path, body) of one random request for scenario."""
+    if scenario == "predict":
+        return "POST", "/predict", {"username": str(rng.choice(usernames))}
+    if scenario == "filtered":
+        username = str(rng.choice(usernames))
+        return "POST", "/predict/filtered", {
+            "session_token": sessions[username],
+            "username": username,
+            "selected_genres": [str(g) for g in rng.choice(GENRES, size=int(rng.integers(0, 3)), replace=False)],
+            "selected_media_types": [str(t) for t in rng.choice(MEDIA_TYPES, size=int(rng.integers(0, 2)), replace=False)],
+            "filter_sequels": bool(rng.random() < 0.5),
+            "page": int(rng.integers(1, 4)),
+        }
+    if scenario == "atlas":
+        return "GET", "/atlas", None
+    if scenario == "atlas_user":
+        return "GET", f"/atlas?username={quote(str(rng.choice(usernames)))}", None
+    if scenario == "anime":
+        return "GET", f"/get/anime/{rng.choice(anime_ids)}", None
+    raise ValueError(f"Unknown scenario {scenario}")
+
+
+def client_loop(port, scenario, seconds, seed, inputs, latencies):
+    rng = np.random.default_rng(seed)
+    client = Client(port)
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        method, path, body = make_request(scenario, rng, *inputs)
+        started = time.perf_counter()
+        status, _ = client.request(method, path, body)
+        latencies.append((time.perf_counter() - started, 200 <= status < 300))
+    client.conn.close()
+
+
+def drive(port, scenario, concurrency, seconds, seed, inputs):
+    """Run concurrency closed-loop clients for seconds; returns [(latency, ok)] and the elapsed time."""
+    latencies = []
+    threads = [threading.Thread(target=client_loop, args=(port, scenario, seconds, seed + i, inputs, latencies))
+               for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, time.perf_counter() - started
+
+
+def server_pids(server_pid):
+    children = Path(f"/proc/{server_pid}/task/{server_pid}/children").read_text().split()
+    return [server_pid] + [int(c) for c in children]
+
+
+def reset_peak_rss(pids):
+    for pid in pids:
+        try:
+            Path(f"/proc/{pid}/clear_refs").write_text("5")
+        except OSError:
+            pass
+
+
+def peak_rss_mb(pids):
+    total = 0
+    for pid in pids:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                total += int(line.split()[1])
+    return total / 1024
+
+
+def start_server(workers, env):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    started = time.perf_counter()
+    while True:
+        if Client(port).request("GET", "/ready")[0] == 200:
+            return server, port, time.perf_counter() - started
+        if server.poll() is not None or time.perf_counter() - started > 300:
+            server.kill()
+            raise SystemExit(f"serve.py with {workers} workers did not become ready")
+        time.sleep(0.1)
+
+
+def warm_sessions(port, usernames):
+    """Fetch every user's list once and keep their /predict session tokens."""
+    client = Client(port)
+    sessions = {}
+    for username in usernames:
+        status, body = client.request("POST", "/predict", {"username": username})
+        if status != 200:
+            raise SystemExit(f"Warm-up /predict for {username} returned {status}")
+        sessions[username] = json.loads(body)["session_token"]
+    return sessions
+
+
+def summarize(scenario, concurrency, latencies, elapsed, rss_mb):
+    seconds = np.array([latency for latency, _ in latencies])
+    ok = sum(1 for _, good in latencies if good)
+    p50, p95, p99 = np.percentile(seconds, [50, 95, 99]) * 1000 if seconds.size else (float("nan"),) * 3
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(latencies) - ok,
+        "seconds": round(elapsed, 3),
+        "throughput": round(ok / elapsed, 2),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(seconds.max() * 1000), 3) if seconds.size else float("nan"),
+        "peak_rss_mb": round(rss_mb, 1),
+    }
+
+
+def print_row(row):
+    print(f"{row['scenario']:<11} c={row['concurrency']:<3} {row['throughput']:8.1f} req/s  "
+          f"p50 {row['p50_ms']:8.2f} ms  p95 {row['p95_ms']:8.2f} ms  p99 {row['p99_ms']:8.2f} ms  "
+          f"{row['errors']:>4} errors  peak RSS {row['peak_rss_mb']:7.1f} MB")
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BACKEND_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip() != ""
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, dirty
+
+
+def compare(base_path, new_path):
+    base = json.loads(Path(base_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    def label(run):
+        return run["commit"] + ("-dirty" if run["dirty"] else "")
+
+    print(f"{label(base)} ({base_path}) -> {label(new)} ({new_path})")
+    if base["config"] != new["config"] or base["machine"] != new["machine"]:
+        print("Warning: the runs used different settings or machines:")
+        for section in ("config", "machine"):
+            for key in sorted(set(base[section]) | set(new[section])):
+                if base[section].get(key) != new[section].get(key):
+                    print(f"    {section}.{key}: {base[section].get(key)} -> {new[section].get(key)}")
+
+    def change(old, value):
+        return f"{(value - old) / old * 100:+6.1f}%" if old else "    n/a"
+
+    base_rows = {(row["scenario"], row["concurrency"]): row for row in base["results"]}
+    for row in new["results"]:
+        old = base_rows.get((row["scenario"], row["concurrency"]))
+        if old is None:
+            continue
+        print(f"{row['scenario']:<11} c={row['concurrency']:<3} "
+              f"req/s {old['throughput']:8.1f} -> {row['throughput']:8.1f} {change(old['throughput'], row['throughput'])}  "
+              f"p50 {change(old['p50_ms'], row['p50_ms'])}  p95 {change(old['p95_ms'], row['p95_ms'])}  "
+              f"p99 {change(old['p99_ms'], row['p99_ms'])}  "
+              f"peak RSS {old['peak_rss_mb']:6.1f} -> {row['peak_rss_mb']:6.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=10000, help="Catalog and model items")
+    parser.add_argument("--train-users", type=int, default=2000, help="Users the synthetic model is trained on")
+    parser.add_argument("--components", type=int, default=30)
+    parser.add_argument("--users", type=int, default=200, help="MAL users the clients ask for")
+    parser.add_argument("--list-size", type=int, default=250, help="Median MAL list size")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help=f"Results file (default: {RESULTS_DIR.relative_to(BACKEND_DIR)}/load-<commit>.json)")
+    parser.add_argument("--compare", nargs="+", metavar="RESULTS",
+                        help="Compare a saved results file with another (or with this run's results) and exit")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) == 2:
+        compare(*args.compare)
+        return
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes one or two results files")
+
+    commit, dirty = git_commit()
+    output = Path(args.output) if args.output else RESULTS_DIR / f"load-{commit}{'-dirty' if dirty else ''}.json"
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        data_dir, model_dir, anime_ids, genres_by_id = write_data(
+            Path(tmp), args.items, seed=args.seed, num_users=args.train_users, no_components=args.components)
+        sizes = list_sizes(args.users, args.list_size, args.items, seed=args.seed)
+        users = {f"user{i}": make_anime_list(anime_ids, int(size), seed=args.seed + i, genres_by_id=genres_by_id)
+                 for i, size in enumerate(sizes)}
+        print(f"Synthetic data in {time.perf_counter() - started:.0f}s: {args.items} items, {args.users} MAL users "
+              f"(list sizes p50 {int(np.median(sizes))}, max {sizes.max()}), {os.cpu_count()} CPUs")
+
+        with FakeMALServer(users, page_size=MAL_PAGE_SIZE) as mal:
+            env = dict(os.environ, DATA_DIR=str(data_dir), MODEL_DIR=str(model_dir), MAL_API_URL=mal.base_url,
+                       REQUEST_LOG="0")
+            server, port, ready_seconds = start_server(args.workers, env)
+            try:
+                usernames = list(users)
+                pids = server_pids(server.pid)
+                idle_rss = peak_rss_mb(pids)
+                started = time.perf_counter()
+                sessions = warm_sessions(port, usernames)
+                print(f"serve.py with {args.workers} workers ready in {ready_seconds:.1f}s, idle RSS {idle_rss:.0f} MB; "
+                      f"{len(usernames)} lists and sessions warmed in {time.perf_counter() - started:.1f}s")
+
+                inputs = (usernames, sessions, [int(a) for a in anime_ids])
+                results = []
+                for scenario in args.scenarios:
+                    for concurrency in args.concurrency:
+                        drive(port, scenario, concurrency, args.warmup, args.seed + 1000, inputs)
+                        reset_peak_rss(pids)
+                        latencies, elapsed = drive(port, scenario, concurrency, args.seconds, args.seed, inputs)
+                        row = summarize(scenario, concurrency, latencies, elapsed, peak_rss_mb(pids))
+                        results.append(row)
+                        print_row(row)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "machine": {"cpus": os.cpu_count(), "python": platform.python_version(), "platform": platform.platform()},
+        "config": config,
+        "setup": {"ready_seconds": round(ready_seconds, 2), "idle_rss_mb": round(idle_rss, 1)},
+        "results": results,
+    }, indent=2))
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        compare(args.compare[0], output)
+
+
+if __name__ == "__main__":
+    main()
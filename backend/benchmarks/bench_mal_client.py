@@ -0,0 +1,96 @@
+"""
+Exercise the async MAL client against the local stand-in server, fully offline.
+
+Run from the backend directory:
+    python -m benchmarks.bench_mal_client [--users 20] [--list-size 1500] [--latency 0.05]
+
+Checks that paginated lists come back complete, that unknown users map to None, that
+429/5xx responses are retried, and compares fetching every user concurrently through
+the pooled async client with the old one-at-a-time blocking loop.
+"""
+import argparse
+import asyncio
+import json
+import time
+import urllib.request
+
+from mal_client import MALClient, MALError
+from benchmarks.fake_mal import FakeMALServer, make_anime_list
+
+
+def blocking_fetch(base_url, username):
+    """The old synchronous pagination loop, one fresh connection per page."""
+    url = f"{base_url}/users/{username}/animelist?nsfw=true&limit=1000&fields=list_status"
+    entries = []
+    while url:
+        with urllib.request.urlopen(url) as response:
+            data = json.load(response)
+        entries.extend(data["data"])
+        url = data["paging"].get("next", "")
+    return entries
+
+
+async def check_behaviour(users):
+    with FakeMALServer(users, page_size=100) as mal:
+        client = MALClient(base_url=mal.base_url, backoff_seconds=0.01)
+        name, entries = next(iter(users.items()))
+        fetched = await client.fetch_anime_list(name)
+        assert [e["node"]["id"] for e in fetched] == [e["node"]["id"] for e in entries], "pagination lost entries"
+        assert await client.fetch_anime_list("no-such-user") is None, "unknown user should be None"
+        await client.aclose()
+
+    with FakeMALServer(users, fail_first=2, fail_status=429) as mal:
+        client = MALClient(base_url=mal.base_url, backoff_seconds=0.01)
+        assert len(await client.fetch_anime_list(name)) == len(entries), "429 was not retried"
+        await client.aclose()
+
+    with FakeMALServer(users, fail_first=10, fail_status=503) as mal:
+        client = MALClient(base_url=mal.base_url, max_retries=2, backoff_seconds=0.01)
+        try:
+            await client.fetch_anime_list(name)
+            raise AssertionError("persistent 503 should raise MALError")
+        except MALError:
+            pass
+        await client.aclose()
+    print("Pagination, 404, retry and give-up behaviour OK")
+
+
+async def fetch_all(client, usernames):
+    return await asyncio.gather(*(client.fetch_anime_list(name) for name in usernames))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--list-size", type=int, default=1500)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    anime_ids = list(range(1, 20001))
+    users = {f"user{i}": make_anime_list(anime_ids, args.list_size, seed=i) for i in range(args.users)}
+    asyncio.run(check_behaviour(users))
+
+    with FakeMALServer(users, page_size=1000, latency=args.latency) as mal:
+        start = time.perf_counter()
+        for name in users:
+            blocking_fetch(mal.base_url, name)
+        blocking_time = time.perf_counter() - start
+
+        async def run():
+            client = MALClient(base_url=mal.base_url)
+            start = time.perf_counter()
+            results = await fetch_all(client, list(users))
+            elapsed = time.perf_counter() - start
+            await client.aclose()
+            return results, elapsed
+
+        results, async_time = asyncio.run(run())
+        assert all(len(r) == min(args.list_size, len(anime_ids)) for r in results)
+
+    print(f"{args.users} users x {args.list_size} entries, {args.latency * 1000:.0f} ms per page")
+    print(f"blocking, one at a time: {blocking_time:.2f} s")
+    print(f"async pooled, concurrent: {async_time:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
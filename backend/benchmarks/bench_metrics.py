@@ -0,0 +1,99 @@
+"""
+Overhead of the metrics instrumentation.
+
+Run from the backend directory:
+    python -m benchmarks.bench_metrics [--requests 1000] [--rounds 7]
+
+Times a span, a histogram observation and rendering /metrics, then serves a trivial
+endpoint through an ASGI app with and without MetricsMiddleware (with and without the
+per-request log line) in interleaved rounds and reports the added time per request.
+"""
+import argparse
+import asyncio
+import io
+import time
+from contextlib import redirect_stdout
+
+import httpx
+from fastapi import FastAPI
+
+import metrics
+from metrics import MetricsMiddleware, STAGE_SECONDS, declare_endpoints, registry, span
+
+
+def per_call_us(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def make_app(middleware):
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        with span("response.encode"):
+            return {"ok": True}
+
+    if middleware:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+async def serve_requests(apps, requests, rounds):
+    """Best per-request time of each app over interleaved rounds, so drift hits them alike."""
+    clients = [httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") for app in apps]
+    best = [float("inf")] * len(apps)
+    for client in clients:
+        for _ in range(50):
+            await client.get("/ping")
+    for _ in range(rounds):
+        for position, client in enumerate(clients):
+            started = time.perf_counter()
+            for _ in range(requests):
+                await client.get("/ping")
+            best[position] = min(best[position], (time.perf_counter() - started) / requests * 1e6)
+    for client in clients:
+        await client.aclose()
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=7)
+    args = parser.parse_args()
+
+    declare_endpoints(["/ping"])
+
+    def timed_span():
+        with span("predict.rank"):
+            pass
+
+    histogram = STAGE_SECONDS["predict.rank"]
+    print(f"span:                 {per_call_us(timed_span, 200000):6.2f} us")
+    print(f"histogram observe:    {per_call_us(lambda: histogram.observe(0.003), 200000):6.2f} us")
+    print(f"render /metrics:      {per_call_us(registry.render, 200) / 1000:6.2f} ms "
+          f"({len(registry.render())} bytes)")
+
+    # The log flag is read per request, so the logged app is the same middleware with it on
+    logged_app = make_app(True)
+
+    async def toggle_log(scope, receive, send):
+        metrics.REQUEST_LOG = True
+        try:
+            await logged_app(scope, receive, send)
+        finally:
+            metrics.REQUEST_LOG = False
+
+    with redirect_stdout(io.StringIO()):
+        baseline, instrumented, logged = asyncio.run(
+            serve_requests([make_app(False), make_app(True), toggle_log], args.requests, args.rounds))
+    print(f"request without middleware: {baseline:7.1f} us")
+    print(f"request with middleware:    {instrumented:7.1f} us (+{instrumented - baseline:.1f} us)")
+    print(f"  ... and the request log:  {logged:7.1f} us (+{logged - baseline:.1f} us)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Memory, build time and explanation latency of the precomputed item-neighbour table.
+
+Run from the backend directory:
+    python -m benchmarks.bench_neighbours [--items 10000] [--list-sizes 100 500 2000 5000]
+
+Prints the table size for a range of catalog sizes, builds the table for a trained
+synthetic model, then for users with each --list-sizes entries compares explaining the
+top 20 from the table against computing it live (cosine of every recommendation with
+every watched title). Reports per-user latency of both, how many recommendations get an
+explanation, and how often the table's explanations match the live top 3.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from fold_in import FoldInEngine
+from neighbours import NeighbourTable, EXPLANATIONS_PER_ITEM, NEIGHBOURS_PER_ITEM
+from predict import build_new_user_matrices
+from ranking import top_k_order
+from benchmarks.bench_fold_in import make_new_user
+from benchmarks.synthetic import make_model
+
+TOP_N = 20
+
+
+def live_explain(vectors, item_ids, interactions, limit=EXPLANATIONS_PER_ITEM):
+    """Reference: score every recommendation against every watched title, O(list x top-k x dim)."""
+    watched = interactions.indices
+    weights = np.asarray(interactions.data, dtype=np.float32)
+    similarities = vectors[item_ids] @ vectors[watched].T
+    contributions = similarities * weights
+    explanations = []
+    for r in range(len(item_ids)):
+        best = top_k_order(contributions[r], limit)
+        explanations.append([(int(watched[j]), float(similarities[r, j])) for j in best if contributions[r, j] > 0])
+    return explanations
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--neighbours", type=int, default=NEIGHBOURS_PER_ITEM)
+    parser.add_argument("--list-sizes", type=int, nargs="+", default=[100, 500, 2000, 5000])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"Table size at M={args.neighbours} (int32 ids + float16 similarities):")
+    for num_items in [10_000, 25_000, 100_000, 1_000_000]:
+        print(f"    {num_items:>9} items: {num_items * args.neighbours * 6 / 1e6:8.1f} MB")
+
+    print(f"Training synthetic model ({args.items} items)...")
+    dataset, model, _, item_genres = make_model(num_users=2000, num_items=args.items, epochs=5)
+    started = time.perf_counter()
+    table = NeighbourTable.build(model.item_embeddings, args.neighbours)
+    print(f"Built table for {len(table)} items in {time.perf_counter() - started:.2f}s, {table.nbytes / 1e6:.1f} MB")
+
+    engine = FoldInEngine(model)
+    vectors = model.item_embeddings / np.linalg.norm(model.item_embeddings, axis=1, keepdims=True)
+    rng = np.random.default_rng(0)
+    for list_size in args.list_sizes:
+        if list_size >= args.items:
+            continue
+        table_ms, live_ms, explained, matches, total = [], [], 0, 0, 0
+        for _ in range(args.users):
+            preferences, new_user_data = make_new_user(rng, dataset, item_genres, list_size)
+            features, interactions = build_new_user_matrices(preferences, new_user_data, dataset)
+            scores = engine.predict(features, interactions)
+            scores[interactions.indices] = -np.inf
+            top_items = top_k_order(scores, TOP_N)
+
+            from_table, elapsed = timed(lambda: table.explain(top_items, interactions), args.repeat)
+            table_ms.append(elapsed)
+            from_live, elapsed = timed(lambda: live_explain(vectors, top_items, interactions), args.repeat)
+            live_ms.append(elapsed)
+
+            for table_row, live_row in zip(from_table, from_live):
+                explained += bool(table_row)
+                total += 1
+                matches += len({i for i, _ in table_row} & {i for i, _ in live_row})
+
+        print(f"list of {list_size:>5}: table {np.mean(table_ms):6.3f} ms  live {np.mean(live_ms):7.3f} ms  "
+              f"({np.mean(live_ms) / np.mean(table_ms):5.1f}x), {explained / total:6.1%} explained, "
+              f"{matches / (total * EXPLANATIONS_PER_ITEM):6.1%} of live top-{EXPLANATIONS_PER_ITEM} found")
+
+
+if __name__ == "__main__":
+    main()
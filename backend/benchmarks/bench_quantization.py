@@ -0,0 +1,103 @@
+"""
+Accuracy, memory and latency of quantized scoring against the float32 path.
+
+Run from the backend directory:
+    python -m benchmarks.bench_quantization [--items 10000] [--sizes 100000 1000000] [--users 20]
+
+For a trained synthetic model it folds in --users new users and, for int8 and float16
+scoring with and without exact re-ranking, reports the mean top-20 overlap with float32
+(seen items excluded, as /predict does) and the Spearman rank correlation of the full
+score vectors. For the model and for random item matrices of each of --sizes it then
+reports the scoring matrix size and the latency of scoring one user and a batch of 16.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from fold_in import FoldInEngine
+from predict import build_new_user_matrices
+from quantization import QuantizedItems, QUANTIZATIONS
+from ranking import top_k_order
+from benchmarks.bench_fold_in import make_new_user, spearman
+from benchmarks.synthetic import make_model
+
+TOP_N = 20
+RERANK = [0, 200]
+
+
+def timed(fn, repeat):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def top_unseen(scores, seen):
+    scores = scores.copy()
+    scores[seen] = -np.inf
+    return top_k_order(scores, TOP_N)
+
+
+def check_accuracy(model, dataset, item_genres, args):
+    rng = np.random.default_rng(0)
+    users = [build_new_user_matrices(*make_new_user(rng, dataset, item_genres, args.list_size), dataset)
+             for _ in range(args.users)]
+    exact = FoldInEngine(model)
+    solved = [exact.fold_in(features, interactions) for features, interactions in users]
+    reference = [exact.score(*user) for user in solved]
+
+    print(f"Accuracy against float32 over {args.users} users ({args.list_size}-entry lists):")
+    for quantization in QUANTIZATIONS:
+        for rerank in RERANK:
+            engine = FoldInEngine(model, quantization=quantization, rerank=rerank)
+            overlaps, correlations = [], []
+            for (_, interactions), user, expected in zip(users, solved, reference):
+                scores = engine.score(*user, exclude=interactions.indices)
+                top = top_unseen(scores, interactions.indices)
+                overlaps.append(len(np.intersect1d(top, top_unseen(expected, interactions.indices))) / TOP_N)
+                correlations.append(spearman(scores, expected))
+            print(f"    {quantization:<8} re-rank {rerank:>3}: top-{TOP_N} overlap {np.mean(overlaps):.3f} "
+                  f"(min {np.min(overlaps):.2f}), Spearman {np.mean(correlations):.5f}")
+
+
+def report_speed(label, item_embeddings, args):
+    rng = np.random.default_rng(1)
+    no_components = item_embeddings.shape[1]
+    user = rng.normal(size=no_components).astype(np.float32)
+    batch = rng.normal(size=(16, no_components)).astype(np.float32)
+
+    single = timed(lambda: item_embeddings @ user, args.repeat)
+    batched = timed(lambda: batch @ item_embeddings.T, args.repeat)
+    print(f"{label}: {item_embeddings.shape[0]} items")
+    print(f"    float32   {item_embeddings.nbytes / 1e6:8.1f} MB  one user {single:7.3f} ms  16 users {batched:7.3f} ms")
+    for quantization in QUANTIZATIONS:
+        quantized = QuantizedItems(item_embeddings, quantization)
+        q_single = timed(lambda: quantized.dot(user), args.repeat)
+        q_batched = timed(lambda: quantized.dot(batch), args.repeat)
+        print(f"    {quantization:<8}  {quantized.nbytes / 1e6:8.1f} MB  one user {q_single:7.3f} ms "
+              f"({single / q_single:4.2f}x)  16 users {q_batched:7.3f} ms ({batched / q_batched:4.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--sizes", type=int, nargs="*", default=[100000, 1000000])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--list-size", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"Training synthetic model ({args.items} items)...")
+    dataset, model, _, item_genres = make_model(num_users=2000, num_items=args.items, epochs=5)
+    check_accuracy(model, dataset, item_genres, args)
+
+    report_speed("trained model", np.ascontiguousarray(model.item_embeddings), args)
+    for size in args.sizes:
+        rng = np.random.default_rng(size)
+        report_speed(f"random {size}", rng.normal(size=(size, model.no_components)).astype(np.float32), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Measure a data reload under serve.py and check that it reaches every endpoint and worker.
+
+Run from the backend directory:
+    python -m benchmarks.bench_reload [--workers 2] [--items 5000] [--clients 4]
+
+Writes a synthetic catalog, atlas and model artifacts to a temporary directory, starts
+serve.py against a fake MyAnimeList and drives /predict and /get/anime from --clients
+client processes. Midway it renames every title in the anime CSV, without exporting new
+artifacts, and sends the server SIGHUP. Reports how long until every worker serves the
+new generation and the latency and errors of requests during the reload, then checks
+that /predict, /similar and /get/anime all show the new titles on every worker, and that
+a worker restarted after the reload catches up too. Exits non-zero if any check fails.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_workers import BACKEND_DIR, free_port, write_data
+from benchmarks.fake_mal import FakeMALServer, make_anime_list
+
+RENAMED_PREFIX = "Renamed "
+
+
+def request(port, method, path, body=None):
+    """(status, X-Data-Generation, decoded body) on a fresh connection, so requests spread over workers."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    payload = json.dumps(body).encode() if body is not None else None
+    conn.request(method, path, body=payload, headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response.status, response.getheader("x-data-generation"), json.loads(data or b'null')
+
+
+def client_loop(port, usernames, anime_ids, stop, seed, results):
+    rng = np.random.default_rng(seed)
+    samples = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        if rng.random() < 0.5:
+            status, generation, _ = request(port, "POST", "/predict", {"username": str(rng.choice(usernames))})
+        else:
+            status, generation, _ = request(port, "GET", f"/get/anime/{rng.choice(anime_ids)}")
+        samples.append((time.time(), time.perf_counter() - started, status, generation))
+    results.put(samples)
+
+
+def wait_ready(server, port, timeout=120):
+    started = time.perf_counter()
+    while True:
+        try:
+            if request(port, "GET", "/ready")[0] == 200:
+                return time.perf_counter() - started
+        except OSError:
+            pass
+        if server.poll() is not None or time.perf_counter() - started > timeout:
+            raise SystemExit("serve.py did not become ready")
+        time.sleep(0.1)
+
+
+def worker_generations(port, workers, samples=None):
+    """{pid: generation id} from /health, asking until every worker has answered."""
+    seen = {}
+    for _ in range(samples or 40 * workers):
+        status, _, health = request(port, "GET", "/health")
+        if status == 200:
+            seen[health["pid"]] = health["generation"]["id"]
+        if len(seen) == workers and samples is None:
+            break
+    return seen
+
+
+def wait_for_generation(port, workers, old_generation, timeout=120):
+    """Seconds until every worker reports a generation other than old_generation."""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        seen = worker_generations(port, workers)
+        if len(seen) == workers and old_generation not in seen.values():
+            return time.perf_counter() - started, set(seen.values())
+        time.sleep(0.1)
+    raise SystemExit(f"Workers still on generation {old_generation} after {timeout}s")
+
+
+def titles_checked(port, username, anime_ids, repeats):
+    """Failures of the renamed-title checks, asked repeats times so every worker answers some."""
+    failures = []
+    for _ in range(repeats):
+        status, _, predicted = request(port, "POST", "/predict", {"username": username})
+        if status != 200:
+            failures.append(f"/predict returned {status}")
+            continue
+        stale = [r["title"] for r in predicted["recommendations"] if not r["title"].startswith(RENAMED_PREFIX)]
+        if stale:
+            failures.append(f"/predict still shows old titles: {stale[:3]}")
+
+        anime_id = predicted["recommendations"][0]["anime_id"]
+        status, _, similar = request(port, "GET", f"/similar/{anime_id}")
+        stale = [r["title"] for r in similar["recommendations"] if not r["title"].startswith(RENAMED_PREFIX)]
+        if status != 200 or stale:
+            failures.append(f"/similar/{anime_id} returned {status} with old titles {stale[:3]}")
+
+        status, _, details = request(port, "GET", f"/get/anime/{anime_id}")
+        if status != 200 or not details["title"].startswith(RENAMED_PREFIX):
+            failures.append(f"/get/anime/{anime_id} returned {status}: {details}")
+
+        ids = "&".join(f"ids={a}" for a in anime_ids[:20])
+        status, _, batch = request(port, "GET", f"/get/anime?{ids}")
+        stale = [d["title"] for d in batch["details"].values() if not d["title"].startswith(RENAMED_PREFIX)]
+        if status != 200 or stale:
+            failures.append(f"/get/anime?ids= returned {status} with old titles {stale[:3]}")
+    return failures
+
+
+def latency_summary(samples):
+    if not samples:
+        return "no requests"
+    latencies = np.array([s[1] for s in samples]) * 1000
+    errors = sum(s[2] != 200 for s in samples)
+    return (f"{len(samples):5d} requests, p50 {np.percentile(latencies, 50):6.1f} ms, "
+            f"p99 {np.percentile(latencies, 99):6.1f} ms, max {latencies.max():6.1f} ms, {errors} errors")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--list-size", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--warmup-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir, model_dir, anime_ids, genres_by_id = write_data(Path(tmp), args.items, num_users=400)
+        users = {f"user{i}": make_anime_list(anime_ids, args.list_size, seed=i, genres_by_id=genres_by_id)
+                 for i in range(args.users)}
+        csv_path = data_dir / "anime_data_master.csv"
+
+        with FakeMALServer(users, page_size=1000) as mal:
+            env = dict(os.environ, DATA_DIR=str(data_dir), MODEL_DIR=str(model_dir), MAL_API_URL=mal.base_url)
+            port = free_port()
+            server = subprocess.Popen(
+                [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port),
+                 "--workers", str(args.workers)],
+                cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                print(f"{args.items} items, {args.workers} workers, {args.clients} client processes, "
+                      f"{os.cpu_count()} CPUs; ready in {wait_ready(server, port):.1f}s")
+                generations = set(worker_generations(port, args.workers).values())
+                if len(generations) != 1:
+                    raise SystemExit(f"Workers started on different generations: {generations}")
+                [old_generation] = generations
+
+                stop = multiprocessing.Event()
+                results = multiprocessing.Queue()
+                clients = [multiprocessing.Process(target=client_loop,
+                                                   args=(port, list(users), anime_ids, stop, i, results))
+                           for i in range(args.clients)]
+                for p in clients:
+                    p.start()
+                time.sleep(args.warmup_seconds)
+
+                df = pd.read_csv(csv_path, na_values=[], keep_default_na=False)
+                df["title"] = RENAMED_PREFIX + df["title"].astype(str)
+                df.to_csv(csv_path, index=False)
+                reload_started = time.time()
+                os.kill(server.pid, signal.SIGHUP)
+                converge_seconds, new_generations = wait_for_generation(port, args.workers, old_generation)
+                reload_finished = time.time()
+                time.sleep(args.warmup_seconds)
+
+                stop.set()
+                samples = [s for _ in clients for s in results.get()]
+                for p in clients:
+                    p.join()
+
+                print(f"Every worker on the new generation {converge_seconds:.1f}s after SIGHUP")
+                print(f"  before reload  {latency_summary([s for s in samples if s[0] < reload_started])}")
+                print(f"  during reload  {latency_summary([s for s in samples if reload_started <= s[0] < reload_finished])}")
+                print(f"  after reload   {latency_summary([s for s in samples if s[0] >= reload_finished])}")
+                if any(s[2] != 200 for s in samples):
+                    failures.append(f"{sum(s[2] != 200 for s in samples)} requests failed around the reload")
+                if len(new_generations) != 1:
+                    failures.append(f"Workers reloaded to different generations: {new_generations}")
+                failures += titles_checked(port, "user0", anime_ids, 4 * args.workers)
+
+                # A worker forked by the parent after the reload must not stay on the old data
+                children = Path(f"/proc/{server.pid}/task/{server.pid}/children").read_text().split()
+                os.kill(int(children[0]), signal.SIGKILL)
+                time.sleep(0.5)
+                wait_ready(server, port)
+                restart_seconds, restarted_generations = wait_for_generation(port, args.workers, old_generation)
+                print(f"Worker restarted after the reload caught up in {restart_seconds:.1f}s")
+                if restarted_generations != new_generations:
+                    failures.append(f"Restarted worker is on {restarted_generations}, not {new_generations}")
+                failures += titles_checked(port, "user1", anime_ids, 4 * args.workers)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+    if failures:
+        raise SystemExit("Reload checks failed:\n  " + "\n  ".join(dict.fromkeys(failures)))
+    print("Renamed titles served by /predict, /similar and /get/anime on every worker, restarted one included")
+
+
+if __name__ == "__main__":
+    main()
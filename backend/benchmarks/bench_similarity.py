@@ -0,0 +1,86 @@
+"""
+Recall and latency of the approximate /similar index against exact search.
+
+Run from the backend directory:
+    python -m benchmarks.bench_similarity [--sizes 100000 1000000] [--queries 200] [--k 20]
+
+Uses the item embeddings of a trained synthetic model (--model-items items) plus random
+clustered embeddings at each of --sizes. For each index it reports build time, then for
+exact search and for IVF at each --nprobe: mean recall@k against exact, and p50/p99 query
+latency, both unfiltered and with a genre filter (synthetic catalogs only carry genres
+for the trained model, so the filtered case uses a random 10% mask elsewhere).
+"""
+import argparse
+import time
+
+import numpy as np
+
+from similarity import ItemSimilarityIndex
+from benchmarks.synthetic import make_model
+
+
+def clustered_embeddings(num_items, no_components=30, clusters=None, seed=0):
+    rng = np.random.default_rng(seed)
+    clusters = clusters or max(8, num_items // 1000)
+    centers = rng.normal(size=(clusters, no_components))
+    sizes = rng.zipf(1.5, size=clusters).astype(float)
+    members = rng.choice(clusters, size=num_items, p=sizes / sizes.sum())
+    return (centers[members] + 0.6 * rng.normal(size=(num_items, no_components))).astype(np.float32)
+
+
+def evaluate(index, mask, queries, k, mode, nprobe, exact_results):
+    recalls = []
+    latencies = []
+    results = []
+    for q in queries:
+        started = time.perf_counter()
+        item_ids, _ = index.search(q, mask, k, mode=mode, nprobe=nprobe)
+        latencies.append(time.perf_counter() - started)
+        results.append(item_ids)
+        if exact_results is not None:
+            expected = exact_results[len(results) - 1]
+            recalls.append(len(np.intersect1d(item_ids, expected)) / max(1, len(expected)))
+    latencies = np.array(latencies) * 1000
+    return results, (np.mean(recalls) if recalls else 1.0), np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def report(label, embeddings, masks, args):
+    started = time.perf_counter()
+    index = ItemSimilarityIndex(embeddings)
+    print(f"{label}: {len(index)} items, {index.nlist} lists, built in {time.perf_counter() - started:.2f}s")
+
+    rng = np.random.default_rng(1)
+    for mask_label, mask in masks:
+        queries = rng.choice(len(index), size=args.queries, replace=False)
+        exact, _, p50, p99 = evaluate(index, mask, queries, args.k, "exact", 0, None)
+        print(f"    {mask_label:<10} exact          recall 1.000  p50 {p50:7.3f} ms  p99 {p99:7.3f} ms")
+        for nprobe in args.nprobe:
+            if nprobe > index.nlist:
+                continue
+            _, recall, p50, p99 = evaluate(index, mask, queries, args.k, "ivf", nprobe, exact)
+            print(f"    {mask_label:<10} ivf nprobe {nprobe:>3} recall {recall:.3f}  p50 {p50:7.3f} ms  p99 {p99:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-items", type=int, default=10000)
+    parser.add_argument("--sizes", type=int, nargs="*", default=[100000, 1000000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    print(f"Training synthetic model ({args.model_items} items)...")
+    _, model, _, item_genres = make_model(num_users=2000, num_items=args.model_items, epochs=5)
+    genre_mask = item_genres[:, 0] > 0
+    report("trained model", model.item_embeddings,
+           [("all", np.ones(args.model_items, dtype=bool)), ("genre", genre_mask)], args)
+
+    for size in args.sizes:
+        rng = np.random.default_rng(size)
+        report(f"clustered {size}", clustered_embeddings(size, seed=size),
+               [("all", np.ones(size, dtype=bool)), ("10% mask", rng.random(size) < 0.1)], args)
+
+
+if __name__ == "__main__":
+    main()
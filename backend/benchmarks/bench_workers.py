@@ -0,0 +1,211 @@
+"""
+Measure per-worker memory and /predict throughput of serve.py from 1 to N workers.
+
+Run from the backend directory:
+    python -m benchmarks.bench_workers [--workers 1 2 4] [--items 10000] [--seconds 10]
+
+Writes a synthetic catalog, atlas and trained model (as memory-mapped artifacts) to a
+temporary directory, serves a fake MyAnimeList with --users users, and for each worker
+count starts serve.py, waits for /ready, warms every worker's user-list cache and then
+drives /predict from --clients client processes for --seconds. Reports requests/s and,
+per worker, RSS, PSS (RSS with shared pages split between the processes mapping them)
+and private memory. It also checks that /predict/filtered answers the same for a
+session no matter which worker receives it.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from artifacts import export_artifacts
+from benchmarks.fake_mal import FakeMALServer, make_anime_list
+from benchmarks.synthetic import GENRES, make_catalog, make_model
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def write_data(directory, num_items, seed=0, num_users=2000, no_components=30):
+    dataset, model, _, item_genres = make_model(num_users=num_users, num_items=num_items,
+                                                no_components=no_components, epochs=5, seed=seed)
+    _, _, item_id_map, _ = dataset.mapping()
+    anime_ids = list(item_id_map)
+
+    data_dir = directory / "data"
+    model_dir = directory / "model_files"
+    data_dir.mkdir()
+    model_dir.mkdir()
+
+    df = make_catalog(anime_ids, item_genres, seed)
+    df.to_csv(data_dir / "anime_data_master.csv", index=False)
+    rng = np.random.default_rng(seed)
+    pd.DataFrame({
+        "anime_id": [int(a) for a in anime_ids],
+        "x_coord": rng.random(len(anime_ids)),
+        "y_coord": rng.random(len(anime_ids)),
+    }).to_csv(data_dir / "atlas_data.csv", index=False)
+
+    with open(model_dir / "lightfm_anime_model.pkl", 'wb') as f:
+        pickle.dump(model, f)
+    with open(model_dir / "lightfm_anime_dataset.pkl", 'wb') as f:
+        pickle.dump(dataset, f)
+    export_artifacts(model, dataset, df, model_dir / "artifacts")
+
+    genres_by_id = {int(a): [GENRES[j] for j in np.flatnonzero(item_genres[i])] or [GENRES[0]]
+                    for i, a in enumerate(anime_ids)}
+    return data_dir, model_dir, anime_ids, genres_by_id
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request(conn, method, path, body=None):
+    payload = json.dumps(body).encode() if body is not None else None
+    conn.request(method, path, body=payload, headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    return response.status, json.loads(response.read() or b'null')
+
+
+def client_loop(port, usernames, seconds, seed, results):
+    rng = np.random.default_rng(seed)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    done = errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        status, _ = request(conn, "POST", "/predict", {"username": str(rng.choice(usernames))})
+        done += status == 200
+        errors += status != 200
+    results.put((done, errors))
+
+
+def worker_memory(server_pid):
+    children = Path(f"/proc/{server_pid}/task/{server_pid}/children").read_text().split()
+    memory = []
+    for pid in [server_pid] + [int(c) for c in children]:
+        fields = {}
+        for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+            name, value = line.split(':', 1)
+            fields[name] = int(value.split()[0])
+        memory.append({
+            "pid": pid,
+            "rss_mb": fields["Rss"] / 1024,
+            "pss_mb": fields["Pss"] / 1024,
+            "private_mb": (fields["Private_Clean"] + fields["Private_Dirty"]) / 1024,
+        })
+    return memory
+
+
+def run(workers, args, env, usernames):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        start = time.perf_counter()
+        while True:
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+                if request(conn, "GET", "/ready")[0] == 200:
+                    break
+            except OSError:
+                pass
+            if server.poll() is not None or time.perf_counter() - start > 120:
+                raise SystemExit(f"serve.py with {workers} workers did not become ready")
+            time.sleep(0.1)
+        ready_seconds = time.perf_counter() - start
+        idle_memory = worker_memory(server.pid)
+
+        # Sessions are per worker; filtered requests that carry the username must still agree
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        status, predicted = request(conn, "POST", "/predict", {"username": usernames[0]})
+        filtered_totals = set()
+        for _ in range(4 * workers):
+            fresh = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            status, filtered = request(fresh, "POST", "/predict/filtered", {
+                "session_token": predicted["session_token"], "username": usernames[0],
+                "selected_genres": [GENRES[0]], "page": 2,
+            })
+            if status != 200:
+                raise SystemExit(f"/predict/filtered returned {status}")
+            filtered_totals.add((filtered["total_count"], tuple(r["anime_id"] for r in filtered["recommendations"])))
+        if len(filtered_totals) != 1:
+            raise SystemExit("Workers disagree on a rebuilt session")
+
+        # Warm each worker's user-list cache, then measure
+        results = multiprocessing.Queue()
+        warmup = [multiprocessing.Process(target=client_loop, args=(port, usernames, 2.0, i, results))
+                  for i in range(args.clients)]
+        for p in warmup:
+            p.start()
+        for p in warmup:
+            p.join()
+        while not results.empty():
+            results.get()
+
+        clients = [multiprocessing.Process(target=client_loop, args=(port, usernames, args.seconds, 100 + i, results))
+                   for i in range(args.clients)]
+        for p in clients:
+            p.start()
+        totals = [results.get() for _ in clients]
+        for p in clients:
+            p.join()
+
+        loaded_memory = worker_memory(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    done = sum(t[0] for t in totals)
+    errors = sum(t[1] for t in totals)
+    return ready_seconds, done / args.seconds, errors, idle_memory, loaded_memory
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--list-size", type=int, default=300)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir, model_dir, anime_ids, genres_by_id = write_data(Path(tmp), args.items)
+        users = {f"user{i}": make_anime_list(anime_ids, args.list_size, seed=i, genres_by_id=genres_by_id)
+                 for i in range(args.users)}
+
+        with FakeMALServer(users, page_size=1000) as mal:
+            env = dict(os.environ, DATA_DIR=str(data_dir), MODEL_DIR=str(model_dir), MAL_API_URL=mal.base_url)
+            print(f"{args.items} items, {args.users} users, {args.clients} client processes, "
+                  f"{os.cpu_count()} CPUs")
+            baseline = None
+            for workers in args.workers:
+                ready_seconds, throughput, errors, idle_memory, loaded_memory = run(workers, args, env, list(users))
+                baseline = baseline or throughput
+                print(f"{workers} workers: ready in {ready_seconds:.1f}s, {throughput:7.1f} req/s "
+                      f"({throughput / baseline:.2f}x), {errors} errors")
+                # After load, worker memory also holds that worker's user lists and sessions
+                roles = ["parent"] + [f"worker {i}" for i in range(workers)]
+                for role, idle, loaded in zip(roles, idle_memory, loaded_memory):
+                    print(f"    {role:<9} pid {idle['pid']:>7}  idle: RSS {idle['rss_mb']:6.1f} MB  "
+                          f"PSS {idle['pss_mb']:6.1f} MB  private {idle['private_mb']:6.1f} MB  |  "
+                          f"after load: RSS {loaded['rss_mb']:6.1f} MB  private {loaded['private_mb']:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Local stand-in for the MyAnimeList v2 API, for running the backend and benchmarks offline.
+
+    with FakeMALServer({"alice": make_anime_list(anime_ids, 600)}) as mal:
+        client = MALClient(base_url=mal.base_url)
+
+Only GET /v2/users/{username}/animelist is implemented. Lists are paged like MAL does
+(absolute paging.next URLs), unknown users get 404, and latency, rate limiting and
+server errors can be injected to exercise timeouts and retries.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import numpy as np
+
+from benchmarks.synthetic import GENRES, MEDIA_TYPES
+
+STATUSES = ['completed', 'watching', 'plan_to_watch', 'dropped', 'on_hold']
+
+
+def make_anime_list(anime_ids, size, seed=0, genres_by_id=None):
+    """Build `size` MAL list entries drawn from anime_ids, with all USER_LIST_FIELDS populated."""
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(anime_ids), size=min(size, len(anime_ids)), replace=False)
+    entries = []
+    for i in picked:
+        anime_id = int(anime_ids[i])
+        if genres_by_id is not None:
+            genres = genres_by_id[anime_id]
+        else:
+            genres = list(rng.choice(GENRES, size=int(rng.integers(1, 5)), replace=False))
+        status = str(rng.choice(STATUSES, p=[0.6, 0.08, 0.2, 0.06, 0.06]))
+        year = int(rng.integers(1990, 2025))
+        entries.append({
+            "node": {
+                "id": anime_id,
+                "title": f"Synthetic Anime {anime_id}",
+                "main_picture": {
+                    "medium": f"https://cdn.example.com/images/anime/{anime_id}m.jpg",
+                    "large": f"https://cdn.example.com/images/anime/{anime_id}l.jpg",
+                },
+                "genres": [{"id": GENRES.index(g) + 1, "name": g} for g in genres],
+                "start_season": {"year": year, "season": str(rng.choice(["winter", "spring", "summer", "fall"]))},
+                "media_type": str(rng.choice(MEDIA_TYPES)),
+            },
+            "list_status": {
+                "status": status,
+                "score": int(rng.integers(0, 11)) if status != 'plan_to_watch' else 0,
+                "num_episodes_watched": int(rng.integers(0, 26)),
+                "is_rewatching": False,
+                "updated_at": f"{year}-01-01T00:00:00+00:00",
+                "start_date": f"{year}-01-01",
+                "finish_date": f"{year}-03-01" if status == 'completed' else None,
+            },
+        })
+    return entries
+
+
+class FakeMALServer:
+    """
+    Threaded HTTP server imitating MAL's animelist endpoint.
+
+    users maps username (case-insensitive) to list entries. page_size caps entries per page
+    regardless of the requested limit so pagination is exercised. Every request sleeps
+    latency seconds; fail_first makes the first N requests answer fail_status (e.g. 429).
+    """
+
+    def __init__(self, users, page_size=100, latency=0.0, fail_first=0, fail_status=429, port=0):
+        self.users = {name.lower(): entries for name, entries in users.items()}
+        self.page_size = page_size
+        self.latency = latency
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v2"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _next_failure(self):
+        with self._lock:
+            self.request_count += 1
+            return self.request_count <= self.fail_first
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                if server._next_failure():
+                    return self._send(server.fail_status, {"error": "too_many_requests"}, {"Retry-After": "0"})
+
+                parsed = urlparse(self.path)
+                parts = parsed.path.strip("/").split("/")
+                if len(parts) != 4 or parts[:2] != ["v2", "users"] or parts[3] != "animelist":
+                    return self._send(404, {"error": "not_found"})
+
+                entries = server.users.get(unquote(parts[2]).lower())
+                if entries is None:
+                    return self._send(404, {"error": "not_found"})
+
+                query = parse_qs(parsed.query)
+                offset = int(query.get("offset", ["0"])[0])
+                limit = min(int(query.get("limit", ["100"])[0]), server.page_size)
+                body = {"data": entries[offset:offset + limit], "paging": {}}
+                if offset + limit < len(entries):
+                    fields = query.get("fields", [""])[0]
+                    body["paging"]["next"] = (f"{server.base_url}/users/{parts[2]}/animelist"
+                                              f"?offset={offset + limit}&limit={limit}&fields={fields}&nsfw=true")
+                return self._send(200, body)
+
+            def _send(self, status, body, headers=None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from lightfm import LightFM
+from lightfm.data import Dataset
+
+GENRES = [
+    "Action", "Adventure", "Comedy", "Drama", "Fantasy", "Romance", "Sci-Fi", "Slice of Life",
+    "Mystery", "Horror", "Sports", "Supernatural", "Mecha", "Music", "Psychological", "Ecchi",
+]
+
+
+def make_model(num_users=2000, num_items=3000, no_components=30, epochs=10, seed=0):
+    """
+    Train a small LightFM model shaped like the production one: genre-weighted user features
+    plus identity features, string anime ids, WARP loss and adagrad.
+
+    Users and items get hidden genre profiles so the model has real structure to learn.
+    Returns (dataset, model, user_genre_weights, item_genres).
+    """
+    rng = np.random.default_rng(seed)
+    num_genres = len(GENRES)
+
+    item_genres = rng.random((num_items, num_genres)) < 0.2
+    item_popularity = rng.zipf(1.6, num_items).clip(max=500).astype(float)
+    user_taste = rng.dirichlet(np.full(num_genres, 0.3), size=num_users)
+
+    usernames = [f"user{i}" for i in range(num_users)]
+    anime_ids = [str(i + 1) for i in range(num_items)]
+
+    dataset = Dataset()
+    dataset.fit(users=usernames, items=anime_ids, user_features=GENRES)
+
+    interactions_data = []
+    user_features_input = []
+    for u, username in enumerate(usernames):
+        affinity = item_genres @ user_taste[u] + 0.05
+        p = affinity * np.log1p(item_popularity)
+        p /= p.sum()
+        size = int(rng.integers(20, 200))
+        picked = rng.choice(num_items, size=size, replace=False, p=p)
+        weights = rng.choice([0.0, 0.2, 0.5, 0.7, 0.8, 0.9, 1.0], size=size)
+        interactions_data.extend((username, anime_ids[i], w) for i, w in zip(picked, weights))
+
+        genre_counts = item_genres[picked].sum(axis=0) / size
+        user_features_input.append((username, {g: float(c) for g, c in zip(GENRES, genre_counts) if c > 0}))
+
+    interactions, weights = dataset.build_interactions(interactions_data)
+    user_features = dataset.build_user_features(user_features_input, normalize=False)
+
+    model = LightFM(no_components=no_components, learning_rate=0.05, loss='warp', random_state=42)
+    model.fit(interactions, user_features=user_features, sample_weight=weights, epochs=epochs)
+
+    return dataset, model, user_taste, item_genres
+
+
+MEDIA_TYPES = ['tv', 'movie', 'ova', 'ona', 'special', 'music']
+
+
+def make_catalog(anime_ids, item_genres, seed=0):
+    """
+    Build an anime_data_master.csv-shaped DataFrame for the given anime ids, using the same
+    genre assignment the synthetic model was trained on.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i, anime_id in enumerate(anime_ids):
+        rows.append({
+            "anime_id": int(anime_id),
+            "title": f"Synthetic Anime {anime_id}",
+            "mean": round(float(rng.uniform(4.0, 9.2)), 2),
+            "num_list_users": int(rng.zipf(1.3) * 1000) % 4000000,
+            "genres": ", ".join(GENRES[j] for j in np.flatnonzero(item_genres[i])),
+            "synopsis": "A synthetic synopsis.",
+            "image_url": f"https://cdn.example.com/images/anime/{anime_id}.jpg",
+            "media_type": str(rng.choice(MEDIA_TYPES, p=[0.5, 0.15, 0.1, 0.12, 0.1, 0.03])),
+            "relationship": str(rng.choice(['s1', 's2', 's3'], p=[0.65, 0.25, 0.1])),
+        })
+    return pd.DataFrame(rows)
@@ -0,0 +1,179 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+# Relationship value the frontend's "hide sequels" filter keeps
+FIRST_SEASON = 's1'
+
+
+class CatalogIndex:
+    """
+    Immutable, array-backed view of the anime catalog built once at startup.
+
+    Every column is aligned to LightFM internal item ids, so column[internal_id] is the
+    catalog value for that model item. Items the model knows about but the catalog does
+    not (see BAD_ANIME_IDS) have has_data[internal_id] == False and default values.
+    """
+
+    def __init__(self, df, dataset):
+        _, _, item_id_map, _ = dataset.mapping()
+        num_items = dataset.interactions_shape()[1]
+
+        # id maps in both directions; model ids are the string keys the Dataset was fit on
+        self.original_to_internal = dict(item_id_map)
+        original_ids = np.empty(num_items, dtype=object)
+        for original_id, internal_id in item_id_map.items():
+            original_ids[internal_id] = original_id
+        self.original_ids = original_ids
+
+        catalog = df.copy()
+        catalog['anime_id'] = catalog['anime_id'].astype(str)
+        catalog = catalog.drop_duplicates(subset='anime_id', keep='last').set_index('anime_id')
+        rows = catalog.reindex(original_ids)
+
+        self.has_data = rows.index.isin(catalog.index)
+        self.titles = _text_column(rows, 'title')
+        self.genres = _text_column(rows, 'genres')
+        self.synopses = _text_column(rows, 'synopsis')
+        self.image_urls = _text_column(rows, 'image_url')
+        self.media_types = _text_column(rows, 'media_type')
+        self.mean = _numeric_column(rows, 'mean', np.float64)
+        self.num_list_users = _numeric_column(rows, 'num_list_users', np.int64)
+
+        # Media types are matched case-insensitively; code 0 means "no media type"
+        lowered = np.array([m.lower() for m in self.media_types], dtype=object)
+        self.media_type_names = [''] + sorted(set(lowered) - {''})
+        media_type_lookup = {name: code for code, name in enumerate(self.media_type_names)}
+        self.media_type_codes = np.array([media_type_lookup[m] for m in lowered], dtype=np.int16)
+
+        self.first_season = np.array([r == FIRST_SEASON for r in _text_column(rows, 'relationship')], dtype=bool)
+
+        # One bit per genre, packed into as many uint64 words as the vocabulary needs
+        item_genres = [{g.strip() for g in genres.split(',')} - {''} for genres in self.genres]
+        self.genre_names = sorted(set().union(*item_genres)) if item_genres else []
+        self.genre_bits_lookup = {name: bit for bit, name in enumerate(self.genre_names)}
+        num_words = max(1, (len(self.genre_names) + 63) // 64)
+        self.genre_bits = np.zeros((num_items, num_words), dtype=np.uint64)
+        for internal_id, names in enumerate(item_genres):
+            for name in names:
+                bit = self.genre_bits_lookup[name]
+                self.genre_bits[internal_id, bit // 64] |= np.uint64(1 << (bit % 64))
+
+        for column in (self.original_ids, self.has_data, self.titles, self.genres, self.synopses,
+                       self.image_urls, self.media_types, self.mean, self.num_list_users,
+                       self.media_type_codes, self.first_season, self.genre_bits):
+            column.flags.writeable = False
+
+    @classmethod
+    def from_columns(cls, original_ids, original_to_internal, columns, genre_names, media_type_names):
+        """
+        Rebuild an index from columns that were already aligned to internal ids, such as the
+        memory-mapped catalog in a model artifact directory (see artifacts.py).
+        """
+        catalog = cls.__new__(cls)
+        catalog.original_ids = original_ids
+        catalog.original_to_internal = original_to_internal
+        for name, column in columns.items():
+            setattr(catalog, name, column)
+        catalog.media_type_names = list(media_type_names)
+        catalog.genre_names = list(genre_names)
+        catalog.genre_bits_lookup = {name: bit for bit, name in enumerate(catalog.genre_names)}
+        return catalog
+
+    def __len__(self):
+        return len(self.original_ids)
+
+    def internal_id(self, anime_id):
+        """Internal item id for an original anime id (int or str), or None if the model lacks it."""
+        return self.original_to_internal.get(str(anime_id))
+
+    def genre_mask(self, genre_names):
+        """
+        Pack genre names into a bitmask row. Returns None if any name is not in the catalog,
+        since no item can then contain all of them.
+        """
+        mask = np.zeros(self.genre_bits.shape[1], dtype=np.uint64)
+        for name in genre_names:
+            bit = self.genre_bits_lookup.get(name)
+            if bit is None:
+                return None
+            mask[bit // 64] |= np.uint64(1 << (bit % 64))
+        return mask
+
+    def filter_mask(self, filters):
+        """
+        Boolean mask over internal item ids of catalog items passing the /predict/filtered
+        filters: all selected genres, any selected media type, the num_list_users range and
+        the first-season flag when sequels are hidden.
+        """
+        mask = self.has_data.copy()
+
+        selected_genres = filters.get("genres", [])
+        if selected_genres:
+            genre_mask = self.genre_mask(selected_genres)
+            if genre_mask is None:
+                return np.zeros(len(self), dtype=bool)
+            mask &= ((self.genre_bits & genre_mask) == genre_mask).all(axis=1)
+
+        selected_media_types = filters.get("media_types", [])
+        if selected_media_types:
+            codes = [code for code, name in enumerate(self.media_type_names) if name and name in selected_media_types]
+            mask &= np.isin(self.media_type_codes, codes)
+
+        min_users = filters.get("min_users", 0)
+        max_users = filters.get("max_users", 4200000)
+        mask &= (self.num_list_users >= min_users) & (self.num_list_users <= max_users)
+
+        if filters.get("filter_sequels", False):
+            mask &= self.first_season
+
+        return mask
+
+    def record(self, internal_id, score):
+        """Recommendation dict for one item, in the shape the frontend expects."""
+        original_anime_id = self.original_ids[internal_id]
+        if not self.has_data[internal_id]:
+            return {
+                "anime_id": original_anime_id,
+                "title": f"Unknown Anime (ID: {original_anime_id})",
+                "score": score,
+                "num_list_users": 0,
+                "mean": 0.0,
+                "genres": '',
+                "synopsis": '',
+                "image_url": '',
+                "media_type": ''
+            }
+        return {
+            "anime_id": original_anime_id,
+            "title": self.titles[internal_id],
+            "score": score,
+            "num_list_users": int(self.num_list_users[internal_id]),
+            "mean": float(self.mean[internal_id]),
+            "genres": self.genres[internal_id],
+            "synopsis": self.synopses[internal_id],
+            "image_url": self.image_urls[internal_id],
+            "media_type": self.media_types[internal_id]
+        }
+
+
+def source_digest(df):
+    """Hash of a catalog DataFrame's columns and values, recording which CSV a catalog was built from."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([str(column) for column in df.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _text_column(rows, name):
+    if name not in rows.columns:
+        return np.full(len(rows), '', dtype=object)
+    return np.array(['' if pd.isna(v) else str(v) for v in rows[name]], dtype=object)
+
+
+def _numeric_column(rows, name, dtype):
+    if name not in rows.columns:
+        return np.zeros(len(rows), dtype=dtype)
+    return pd.to_numeric(rows[name], errors='coerce').fillna(0).to_numpy(dtype=dtype)
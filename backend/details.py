@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+# Most ids one /get/anime batch request may ask for
+DETAILS_BATCH_MAX_IDS = int(os.getenv("DETAILS_BATCH_MAX_IDS", 200))
+
+
+class AnimeDetailsIndex:
+    """
+    The card details /get/anime serves, encoded once per anime at startup (or data reload).
+
+    Lookups are a dict access by anime id, and responses are joined from the pre-encoded
+    entries. version hashes every entry, so it changes exactly when a served detail does;
+    ETags are built from it and stay valid until the catalog changes.
+    """
+
+    def __init__(self, anime_df):
+        anime_ids = pd.to_numeric(anime_df['anime_id'], errors='coerce')
+        titles = _column(anime_df, 'title', 'Unknown')
+        image_urls = _column(anime_df, 'image_url', '')
+        means = pd.to_numeric(_column(anime_df, 'mean', 0.0), errors='coerce').fillna(0.0)
+        num_list_users = pd.to_numeric(_column(anime_df, 'num_list_users', 0), errors='coerce').fillna(0)
+
+        self.entries = {}
+        for anime_id, title, image_url, mean, users in zip(anime_ids, titles, image_urls, means, num_list_users):
+            # The first row of a duplicated id wins, as it did with the DataFrame scan
+            if pd.isna(anime_id) or int(anime_id) in self.entries:
+                continue
+            self.entries[int(anime_id)] = _encode({
+                "title": str(title),
+                "image_url": str(image_url),
+                "mean": float(mean),
+                "num_list_users": int(users),
+            })
+
+        digest = hashlib.blake2b(digest_size=8)
+        for anime_id in sorted(self.entries):
+            digest.update(b'%d:%s\n' % (anime_id, self.entries[anime_id]))
+        self.version = digest.hexdigest()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, anime_id):
+        """Encoded details of one anime, or None if the catalog lacks it."""
+        return self.entries.get(anime_id)
+
+    def etag(self, anime_id):
+        return f'"{self.version}-{anime_id}"'
+
+    def batch_etag(self, anime_ids):
+        ids = ",".join(str(anime_id) for anime_id in anime_ids).encode()
+        return f'"{self.version}-{hashlib.blake2b(ids, digest_size=8).hexdigest()}"'
+
+    def batch_payload(self, anime_ids):
+        """
+        JSON body for a batch request: {"details": {id: details}, "missing": [ids]}, with
+        ids in request order and duplicates dropped.
+        """
+        found = []
+        missing = []
+        for anime_id in dict.fromkeys(anime_ids):
+            entry = self.entries.get(anime_id)
+            if entry is None:
+                missing.append(anime_id)
+            else:
+                found.append(b'"%d":%s' % (anime_id, entry))
+        return b'{"details":{' + b','.join(found) + b'},"missing":' + _encode(missing) + b'}'
+
+
+def _column(df, name, default):
+    if name not in df.columns:
+        return pd.Series(default, index=df.index)
+    return df[name]
+
+
+def _encode(content):
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,296 @@
+"""
+Offline evaluation of a model artifact on the held-out split.
+
+Run from the backend directory:
+    python evaluate.py [--artifacts artifacts] [--version V] [--sample-users 5000]
+                       [--serving-users 500] [--threads 4] [--report evaluation.json]
+
+The training data is preprocessed through the same cache as train.py and split with the
+same seed, so the test interactions are the ones the model never saw. Two paths are
+measured on users with held-out interactions:
+
+- model: the trained model's own representation of each training user, with LightFM's
+  precision@k, recall@k and AUC (train items excluded) on --threads threads.
+- serving: each user's training list is turned back into MAL list entries and run
+  through predict_scores_batch, so the scores come from the fold-in engine and /predict's
+  own ranking (seen and bad ids excluded, min-max normalized), as a new user would get.
+
+Per-user metrics are averaged over a random sample of users (--sample-users, 0 for all)
+with a t-interval at --confidence. Catalog coverage is the share of catalog items that
+appear in at least one sampled user's top k. Everything is written as JSON to --report.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from lightfm import LightFM
+from lightfm.evaluation import precision_at_k, recall_at_k, auc_score
+from scipy import sparse, stats
+
+from artifacts import load_artifacts, MODEL_PARAMS
+from fold_in import FoldInEngine
+from ingest import train_test_split, held_out_pairs
+from predict import predict_scores_batch
+from preprocess_cache import load_or_preprocess, PREPROCESS_CACHE_DIR
+from ranking import top_k_order
+
+# A MAL (status, score) that build_new_user_matrices maps to each training weight
+LIST_ENTRY_FOR_WEIGHT = {
+    0.0: ('dropped', 0),
+    0.1: ('completed', 1),
+    0.2: ('on_hold', 0),
+    0.4: ('completed', 6),
+    0.5: ('completed', 0),
+    0.6: ('completed', 7),
+    0.7: ('plan_to_watch', 0),
+    0.8: ('completed', 8),
+    0.9: ('completed', 9),
+    1.0: ('completed', 10),
+}
+KNOWN_WEIGHTS = np.array(sorted(LIST_ENTRY_FOR_WEIGHT))
+
+
+def lightfm_from_artifact(model):
+    """
+    A LightFM instance with the artifact's parameters, for LightFM's threaded evaluation.
+    Training state the artifacts leave out (item gradients, momentum) is zero-filled.
+    """
+    lightfm_model = LightFM(**{name: getattr(model, name) for name in MODEL_PARAMS})
+    # LightFM's Cython code needs writable arrays, so the read-only maps are copied
+    for side in ('item', 'user'):
+        embeddings = np.array(getattr(model, f"{side}_embeddings"), dtype=np.float32)
+        biases = np.array(getattr(model, f"{side}_biases"), dtype=np.float32)
+        setattr(lightfm_model, f"{side}_embeddings", embeddings)
+        setattr(lightfm_model, f"{side}_biases", biases)
+        setattr(lightfm_model, f"{side}_embedding_gradients",
+                np.array(getattr(model, f"{side}_embedding_gradients", np.zeros_like(embeddings)), dtype=np.float32))
+        setattr(lightfm_model, f"{side}_bias_gradients",
+                np.array(getattr(model, f"{side}_bias_gradients", np.zeros_like(biases)), dtype=np.float32))
+        setattr(lightfm_model, f"{side}_embedding_momentum", np.zeros_like(embeddings))
+        setattr(lightfm_model, f"{side}_bias_momentum", np.zeros_like(biases))
+    return lightfm_model
+
+
+def summarize(values, confidence):
+    """Mean of per-user values with a t-interval; the interval is None below two users."""
+    values = np.asarray(values, dtype=np.float64)
+    n = int(values.size)
+    summary = {"mean": float(values.mean()) if n else None, "ci_low": None, "ci_high": None,
+               "std": float(values.std(ddof=1)) if n > 1 else None, "users": n}
+    if n > 1:
+        half_width = stats.t.ppf((1 + confidence) / 2, n - 1) * summary["std"] / np.sqrt(n)
+        summary["ci_low"] = summary["mean"] - half_width
+        summary["ci_high"] = summary["mean"] + half_width
+    return summary
+
+
+def format_value(value):
+    """A summary value for the console; n/a for the mean or interval of too few users."""
+    return "n/a" if value is None else f"{value:.4f}"
+
+
+def coverage(recommended_ids, num_items):
+    recommended = np.unique(np.concatenate(recommended_ids)) if recommended_ids else np.empty(0)
+    return {"items": int(recommended.size), "share": recommended.size / num_items}
+
+
+def rank_metrics(item_ids, scores, top_items, held_out, k):
+    """precision@k, recall@k and AUC of one ranking of unseen items against held-out items."""
+    hits = np.isin(top_items, held_out).sum()
+    positive = np.isin(item_ids, held_out)
+    num_positive = int(positive.sum())
+    num_negative = positive.size - num_positive
+    if num_positive == 0 or num_negative == 0:
+        auc = 0.0
+    else:
+        # Mann-Whitney: the chance a held-out item outranks an unseen non-held-out one
+        ranks = stats.rankdata(scores)
+        auc = (ranks[positive].sum() - num_positive * (num_positive + 1) / 2) / (num_positive * num_negative)
+    # Held-out items /predict never ranks (bad ids) count as misses
+    return hits / k, hits / held_out.size, float(auc)
+
+
+def evaluate_model(lightfm_model, train_interactions, test_interactions, user_features, users, args):
+    """LightFM's metrics for the sampled training users, plus their top-k for coverage."""
+    # Only the sampled users keep their held-out rows; LightFM skips users without any
+    keep = np.zeros((test_interactions.shape[0], 1), dtype=test_interactions.dtype)
+    keep[users] = 1
+    sampled_test = sparse.csr_matrix(test_interactions.multiply(keep))
+    sampled_test.eliminate_zeros()
+
+    started = time.perf_counter()
+    common = dict(train_interactions=train_interactions, user_features=user_features,
+                  num_threads=args.threads, preserve_rows=True)
+    precision = precision_at_k(lightfm_model, sampled_test, k=args.k, **common)[users]
+    # preserve_rows divides by zero for every unsampled user
+    with np.errstate(invalid='ignore'):
+        recall = recall_at_k(lightfm_model, sampled_test, k=args.k, **common)[users]
+    auc = auc_score(lightfm_model, sampled_test, **common)[users]
+    metric_seconds = time.perf_counter() - started
+
+    # Top k per user for coverage, scored in blocks without the train items
+    started = time.perf_counter()
+    item_embeddings = lightfm_model.item_embeddings
+    top_items = []
+    for start in range(0, users.size, 256):
+        block = users[start:start + 256]
+        user_features_block = user_features[block]
+        scores = (user_features_block @ lightfm_model.user_embeddings) @ item_embeddings.T
+        scores += lightfm_model.item_biases
+        seen = train_interactions[block].tocoo()
+        scores[seen.row, seen.col] = -np.inf
+        top_items.extend(top_k_order(row, args.k) for row in scores)
+    coverage_seconds = time.perf_counter() - started
+
+    return {
+        "precision_at_k": summarize(precision, args.confidence),
+        "recall_at_k": summarize(recall, args.confidence),
+        "auc": summarize(auc, args.confidence),
+        "coverage": coverage(top_items, item_embeddings.shape[0]),
+        "seconds": round(metric_seconds + coverage_seconds, 3),
+    }
+
+
+def list_objects_for_user(item_ids, weights, catalog, genre_names):
+    """MAL list entries that build_new_user_matrices turns back into this training row."""
+    list_objects = []
+    for item_id, weight in zip(item_ids, weights):
+        status, score = LIST_ENTRY_FOR_WEIGHT[float(KNOWN_WEIGHTS[np.abs(KNOWN_WEIGHTS - weight).argmin()])]
+        genres = [{"name": g.strip()} for g in catalog.genres[item_id].split(',') if g.strip() in genre_names]
+        list_objects.append({
+            "node": {"id": catalog.original_ids[item_id], "title": catalog.titles[item_id], "genres": genres},
+            "list_status": {"status": status, "score": score},
+        })
+    return list_objects
+
+
+def evaluate_serving(artifacts, train_interactions, train_weights, test_interactions, users, args):
+    """predict_scores_batch on sampled users folded in from their training lists."""
+    engine = FoldInEngine(artifacts.model)
+    catalog = artifacts.catalog
+    # Only genres that are user features, so the rebuilt list's genre row lines up with the
+    # user's training row (build_new_user_matrices would skip the others with a warning each)
+    genre_names = set(artifacts.dataset.mapping()[1])
+
+    precision, recall, auc, top_items = [], [], [], []
+    started = time.perf_counter()
+    for start in range(0, users.size, args.serving_batch):
+        block = users[start:start + args.serving_batch]
+        batch = []
+        for user in block:
+            row = train_interactions[user]
+            weights = np.asarray(train_weights[user, row.indices].todense()).ravel()
+            batch.append((f"user{user}", list_objects_for_user(row.indices, weights, catalog, genre_names)))
+        results = predict_scores_batch(batch, artifacts.dataset, artifacts.model, catalog, fold_in_engine=engine)
+        for user, result in zip(block, results):
+            if isinstance(result, Exception):
+                raise result
+            ranked = result[1]
+            top, _ = ranked.top(args.k)
+            user_precision, user_recall, user_auc = rank_metrics(
+                ranked.item_ids, ranked.scores, top, test_interactions[user].indices, args.k)
+            precision.append(user_precision)
+            recall.append(user_recall)
+            auc.append(user_auc)
+            top_items.append(top)
+
+    return {
+        "precision_at_k": summarize(precision, args.confidence),
+        "recall_at_k": summarize(recall, args.confidence),
+        "auc": summarize(auc, args.confidence),
+        "coverage": coverage(top_items, len(catalog)),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--artifacts", default="artifacts")
+    parser.add_argument("--version", default=None, help="Artifact version (default: CURRENT)")
+    parser.add_argument("--interactions", default="user_anime_data_v2_5282.csv")
+    parser.add_argument("--user-genres", default="user_genre_data_nsfw.txt")
+    parser.add_argument("--min-user-interactions", type=int, default=5)
+    parser.add_argument("--min-item-interactions", type=int, default=3)
+    parser.add_argument("--test-fraction", type=float, default=0.1)
+    parser.add_argument("--no-cache", action="store_true", help="Preprocess without the preprocessing cache")
+
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=1, help="LightFM threads for the model metrics")
+    parser.add_argument("--sample-users", type=int, default=0, help="Users to evaluate (0: every test user)")
+    parser.add_argument("--serving-users", type=int, default=500,
+                        help="Sampled users also run through the serving path (0: skip it)")
+    parser.add_argument("--serving-batch", type=int, default=32)
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", default="evaluation.json")
+    args = parser.parse_args()
+
+    artifacts = load_artifacts(args.artifacts, args.version)
+    print(f"Evaluating model artifacts {artifacts.version}")
+
+    data = load_or_preprocess(args.interactions, args.user_genres,
+                              args.min_user_interactions, args.min_item_interactions,
+                              root=None if args.no_cache else PREPROCESS_CACHE_DIR)
+    _, _, item_id_map, _ = data.dataset.mapping()
+    if (item_id_map != artifacts.dataset.item_id_map
+            or data.user_features.shape[1] != artifacts.model.user_embeddings.shape[0]):
+        raise SystemExit("The artifacts were not trained on this data (item ids or user features differ). "
+                         "Pass the same inputs and thresholds train.py used.")
+
+    train_interactions, test_interactions, train_weights = train_test_split(data, args.test_fraction)
+    train_interactions = train_interactions.tocsr()
+    train_weights = train_weights.tocsr()
+    test_interactions = held_out_pairs(test_interactions, train_interactions)
+    user_features = data.user_features.tocsr()
+
+    test_users = np.flatnonzero(np.diff(test_interactions.indptr))
+    rng = np.random.default_rng(args.seed)
+    users = rng.permutation(test_users)
+    if args.sample_users:
+        users = users[:args.sample_users]
+    print(f"{users.size} of {test_users.size} users with held-out interactions sampled")
+
+    report = {
+        "artifact": {"version": artifacts.version, "path": str(artifacts.path), "model": artifacts.manifest["model"]},
+        "data": {
+            "interactions": args.interactions,
+            "user_genres": args.user_genres,
+            "min_interactions_per_user": args.min_user_interactions,
+            "min_interactions_per_item": args.min_item_interactions,
+            "test_fraction": args.test_fraction,
+            "users": int(train_interactions.shape[0]),
+            "items": int(train_interactions.shape[1]),
+            "test_users": int(test_users.size),
+            "test_interactions": int(test_interactions.nnz),
+        },
+        "settings": {"k": args.k, "threads": args.threads, "sample_users": int(users.size),
+                     "confidence": args.confidence, "seed": args.seed},
+    }
+
+    print("Evaluating the model on training users...")
+    report["model"] = evaluate_model(lightfm_from_artifact(artifacts.model), train_interactions,
+                                     test_interactions, user_features, users, args)
+    if args.serving_users:
+        serving_users = users[:args.serving_users]
+        print(f"Evaluating the serving path on {serving_users.size} folded-in users...")
+        report["serving"] = evaluate_serving(artifacts, train_interactions, train_weights,
+                                             test_interactions, serving_users, args)
+
+    with open(args.report, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+
+    for path in ("model", "serving"):
+        if path not in report:
+            continue
+        result = report[path]
+        print(f"{path}: " + "  ".join(
+            f"{name} {format_value(result[name]['mean'])} "
+            f"[{format_value(result[name]['ci_low'])}, {format_value(result[name]['ci_high'])}]"
+            for name in ("precision_at_k", "recall_at_k", "auc")
+        ) + f"  coverage {result['coverage']['share']:.1%}  ({result['seconds']:.1f}s)")
+    print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
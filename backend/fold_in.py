@@ -0,0 +1,223 @@
+import numpy as np
+
+from quantization import QuantizedItems, SCORING_QUANTIZATION, SCORING_RERANK
+from ranking import top_k_order
+
+# LightFM caps the WARP loss multiplier at this value (see fit_warp in _lightfm_fast)
+MAX_LOSS = 10.0
+
+
+class FoldInEngine:
+    """
+    Learns a representation for a user the model has never seen, without touching the model.
+
+    The item embeddings, item biases and the trained user-feature (genre) embeddings are
+    kept as read-only views shared by every request. Fold-in trains only a private copy of
+    the handful of genre rows the new user actually has, so nothing item-sized is copied.
+
+    It is a batched approximation of fit_partial, not a replay of it: each epoch samples
+    WARP negatives against one frozen user representation and applies all the adagrad
+    updates together, where fit_warp updates after every interaction. Against fit_partial
+    the top-20 recommendations overlap by about 0.95 on average (0.75-0.95 per user) with
+    a Spearman correlation above 0.98; benchmarks/bench_fold_in.py fails below that.
+    """
+
+    def __init__(self, model, epochs=10, seed=42, quantization=SCORING_QUANTIZATION, rerank=SCORING_RERANK):
+        if model.loss != 'warp' or model.learning_schedule != 'adagrad':
+            raise ValueError(f"Fold-in only supports warp/adagrad models, got {model.loss}/{model.learning_schedule}")
+
+        self.no_components = model.no_components
+        self.learning_rate = model.learning_rate
+        self.max_sampled = model.max_sampled
+        self.epochs = epochs
+        self.seed = seed
+
+        self.item_embeddings = _read_only(model.item_embeddings)
+        self.item_biases = _read_only(model.item_biases)
+        self.user_embeddings = _read_only(model.user_embeddings)
+        self.user_biases = _read_only(model.user_biases)
+        self.user_embedding_gradients = _read_only(model.user_embedding_gradients)
+        self.user_bias_gradients = _read_only(model.user_bias_gradients)
+
+        self.num_items = self.item_embeddings.shape[0]
+
+        # Optional quantized copy for the full scoring pass; fold-in and re-ranking only
+        # gather a few float32 rows
+        self.quantized = QuantizedItems(self.item_embeddings, quantization) if quantization else None
+        self.rerank = rerank
+
+    def fold_in(self, user_features, interactions):
+        """
+        Solve for a new user's representation.
+
+        user_features is a 1 x num_user_features CSR row of genre weights and interactions is
+        a 1 x num_items CSR row of list weights. Returns (embedding, bias) for the new user.
+        """
+        [solved] = self.fold_in_batch([(user_features, interactions)])
+        return solved
+
+    def fold_in_batch(self, users):
+        """
+        fold_in for a list of (user_features, interactions) pairs, solved together.
+
+        Each epoch gathers, scores and updates every user's positives and sampled negatives
+        in one pass over the concatenated batch. Each user draws its permutations and
+        negative candidates from its own generator seeded with `seed`, and every update
+        stays within that user's rows, so a user's result does not depend on the batch.
+        """
+        solved = [None] * len(users)
+        batch = []
+        for position, (user_features, interactions) in enumerate(users):
+            feature_ids = user_features.indices
+            feature_weights = user_features.data.astype(np.float32)
+            # Like fit_warp, only strictly positive interactions are trained on, but any listed
+            # item (including dropped ones) is rejected when sampled as a negative
+            positives = interactions.indices[interactions.data > 0]
+            if positives.size == 0 or feature_ids.size == 0:
+                solved[position] = (feature_weights @ self.user_embeddings[feature_ids],
+                                    float(feature_weights @ self.user_biases[feature_ids]))
+            else:
+                batch.append((position, feature_ids, feature_weights, positives, interactions.indices))
+        if not batch:
+            return solved
+
+        num_users = len(batch)
+        feature_counts = np.array([len(user[1]) for user in batch])
+        positive_counts = np.array([len(user[3]) for user in batch])
+        feature_starts = np.cumsum(feature_counts) - feature_counts
+        positive_starts = np.cumsum(positive_counts) - positive_counts
+        positive_users = np.repeat(np.arange(num_users), positive_counts)
+
+        # Private copies of just these users' feature rows and their adagrad accumulators
+        feature_ids = np.concatenate([user[1] for user in batch])
+        feature_weights = np.concatenate([user[2] for user in batch])
+        embeddings = self.user_embeddings[feature_ids].copy()
+        biases = self.user_biases[feature_ids].copy()
+        embedding_accum = self.user_embedding_gradients[feature_ids].copy()
+        bias_accum = self.user_bias_gradients[feature_ids].copy()
+
+        positives = np.concatenate([user[3] for user in batch])
+        listed = np.zeros((num_users, self.num_items), dtype=bool)
+        for row, user in enumerate(batch):
+            listed[row, user[4]] = True
+
+        rngs = [np.random.default_rng(self.seed) for _ in batch]
+        pos_embeddings = self.item_embeddings[positives]
+        pos_biases = self.item_biases[positives]
+        sample_positions = np.arange(1, self.max_sampled + 1)
+
+        for _ in range(self.epochs):
+            user_repr = np.add.reduceat(feature_weights[:, None] * embeddings, feature_starts, axis=0)
+            order = np.concatenate([start + rng.permutation(count)
+                                    for rng, start, count in zip(rngs, positive_starts, positive_counts)])
+            # Each generator draws its user's permutation, then that user's candidates
+            candidates = np.concatenate([rng.integers(0, self.num_items, size=(count, self.max_sampled))
+                                         for rng, count in zip(rngs, positive_counts)])
+            row_repr = user_repr[positive_users]
+            pos_repr = pos_embeddings[order]
+            pos_pred = np.einsum('pd,pd->p', pos_repr, row_repr) + pos_biases[order]
+
+            # Every negative this epoch could need is drawn up front; keep the first one per
+            # positive that violates the margin, as the sequential sampler would
+            neg_pred = (np.einsum('psd,pd->ps', self.item_embeddings[candidates], row_repr)
+                        + self.item_biases[candidates])
+            violating = (neg_pred > (pos_pred - 1.0)[:, None]) & ~listed[positive_users[:, None], candidates]
+
+            has_violation = violating.any(axis=1)
+            if not has_violation.any():
+                continue
+            first = violating.argmax(axis=1)[has_violation]
+            sampled = sample_positions[first]
+            negatives = candidates[has_violation, first]
+
+            loss = np.log(np.maximum(1.0, np.floor((self.num_items - 1) / sampled)))
+            loss = np.minimum(loss, MAX_LOSS).astype(np.float32)
+
+            grads = loss[:, None] * (self.item_embeddings[negatives] - pos_repr[has_violation])
+            grad_ends = np.cumsum(np.bincount(positive_users[has_violation], minlength=num_users))
+            # Each user's features x steps block is applied on its own slice of the batch
+            # arrays; one block at a time stays in cache, unlike a batch-wide pairing
+            for row in np.flatnonzero(np.diff(grad_ends, prepend=0)):
+                features = slice(feature_starts[row], feature_starts[row] + feature_counts[row])
+                steps = slice(grad_ends[row - 1] if row else 0, grad_ends[row])
+                _adagrad_step(embeddings[features], embedding_accum[features], feature_weights[features],
+                              grads[steps], self.learning_rate)
+                _adagrad_step(biases[features], bias_accum[features], feature_weights[features],
+                              loss[steps], self.learning_rate)
+
+        user_embeddings = np.add.reduceat(feature_weights[:, None] * embeddings, feature_starts, axis=0)
+        user_biases = np.add.reduceat(feature_weights * biases, feature_starts)
+        for row, user in enumerate(batch):
+            solved[user[0]] = (user_embeddings[row], float(user_biases[row]))
+        return solved
+
+    def score(self, user_embedding, user_bias, exclude=None):
+        """
+        Score every item for a folded-in user, matching LightFM's predict().
+
+        With quantization the scores come from the quantized items, and the `rerank` best
+        items outside `exclude` (the user's own list) are rescored exactly in float32.
+        """
+        if self.quantized is None:
+            return self.item_embeddings @ user_embedding + self.item_biases + np.float32(user_bias)
+        scores = self.quantized.dot(user_embedding) + self.item_biases + np.float32(user_bias)
+        self._rerank(scores, user_embedding, user_bias, exclude)
+        return scores
+
+    def _rerank(self, scores, user_embedding, user_bias, exclude):
+        if self.rerank <= 0:
+            return
+        candidate_scores = scores
+        if exclude is not None and len(exclude):
+            candidate_scores = scores.copy()
+            candidate_scores[exclude] = -np.inf
+        candidates = top_k_order(candidate_scores, self.rerank)
+        scores[candidates] = (self.item_embeddings[candidates] @ user_embedding
+                              + self.item_biases[candidates] + np.float32(user_bias))
+
+    def predict(self, user_features, interactions):
+        return self.score(*self.fold_in(user_features, interactions), exclude=interactions.indices)
+
+    def predict_batch(self, users):
+        """
+        Fold in several users together and score them all against every item with one
+        matrix-matrix product. users is a list of (user_features, interactions) pairs;
+        returns a len(users) x num_items array.
+        """
+        if not users:
+            return np.empty((0, self.num_items), dtype=np.float32)
+        solved = self.fold_in_batch(users)
+        embeddings = np.stack([embedding for embedding, _ in solved])
+        biases = np.array([bias for _, bias in solved], dtype=np.float32)
+        if self.quantized is None:
+            return embeddings @ self.item_embeddings.T + self.item_biases + biases[:, None]
+
+        scores = self.quantized.dot(embeddings) + self.item_biases + biases[:, None]
+        for row, (_, interactions) in enumerate(users):
+            self._rerank(scores[row], embeddings[row], biases[row], interactions.indices)
+        return scores
+
+
+def _read_only(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+def _adagrad_step(params, accum, feature_weights, grads, learning_rate):
+    """
+    Apply a sequence of per-interaction gradients to feature rows with LightFM's adagrad rule.
+
+    LightFM updates each row with learning_rate / sqrt(accum) and only then adds the squared
+    gradient to the accumulator, so every step sees the sum of the squares before it.
+    """
+    squared = np.cumsum(grads ** 2, axis=0)
+    seen_before = squared - grads ** 2
+    weights = feature_weights.reshape((-1,) + (1,) * grads.ndim)
+    # features x steps blocks dominate fold-in time, so they are computed in two buffers
+    running_accum = (weights ** 2) * seen_before[None]
+    running_accum += accum[:, None]
+    np.sqrt(running_accum, out=running_accum)
+    steps = (learning_rate * weights) * grads[None]
+    params -= np.divide(steps, running_accum, out=steps).sum(axis=1)
+    accum += (weights ** 2)[:, 0] * squared[-1]
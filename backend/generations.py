@@ -0,0 +1,228 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from predict import predict_scores_batch
+
+# Poll the data and model files this often and reload when they change; 0 turns it off
+RELOAD_WATCH_SECONDS = float(os.getenv("RELOAD_WATCH_SECONDS", 0))
+# Catalog items in the smoke prediction a new generation must pass
+VALIDATION_ITEMS = 20
+GENERATION_HEADER = b"x-data-generation"
+
+# The generation the current request was pinned to on arrival
+_pinned = contextvars.ContextVar("data_generation", default=None)
+
+
+class ReloadFailed(Exception):
+    pass
+
+
+def source_signature(paths):
+    """(path, mtime, size) of each source file, None for missing ones; changes when any file is replaced."""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            signature.append((str(path), None, None))
+        else:
+            signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def generation_id(generation, signature):
+    """Short id of a generation, the same in every worker that loaded the same files."""
+    atlas_index = generation.get("atlas_index")
+    description = [
+        generation["model_version"],
+        generation["anime_details"].version,
+        atlas_index.etag if atlas_index is not None else None,
+        signature,
+    ]
+    return hashlib.blake2b(json.dumps(description).encode(), digest_size=6).hexdigest()
+
+
+def generation_info(generation):
+    return {
+        "id": generation["id"],
+        "model_version": generation["model_version"],
+        "catalog_version": generation["anime_details"].version,
+        "loaded_at": time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(generation["loaded_at"])),
+    }
+
+
+def validate_generation(generation):
+    """
+    Refuse a generation that could not serve /predict: a catalog that does not match the
+    model, or a smoke prediction that fails or has non-finite scores. The prediction also
+    warms the new model's memory maps and scoring path before it takes traffic.
+    """
+    catalog = generation["catalog"]
+    model = generation["model"]
+    if len(catalog) != model.item_embeddings.shape[0]:
+        raise ValueError(f"Catalog has {len(catalog)} items but the model has {model.item_embeddings.shape[0]}")
+    if len(generation["anime_details"]) == 0:
+        raise ValueError("Anime catalog is empty")
+
+    known = np.flatnonzero(catalog.has_data)[:VALIDATION_ITEMS]
+    if known.size == 0:
+        raise ValueError("No model item is in the anime catalog")
+    list_objects = [
+        {
+            "node": {
+                "id": int(catalog.original_ids[i]),
+                "title": catalog.titles[i],
+                "genres": [{"name": g.strip()} for g in catalog.genres[i].split(',') if g.strip()],
+                "media_type": catalog.media_types[i],
+            },
+            "list_status": {"status": "completed", "score": 8},
+        }
+        for i in known
+    ]
+    [result] = predict_scores_batch(
+        [("reload-check", list_objects)],
+        generation["dataset"],
+        model,
+        catalog,
+        fold_in_engine=generation["fold_in"],
+        neighbours=generation["neighbours"]
+    )
+    if isinstance(result, Exception):
+        raise ValueError(f"Smoke prediction failed: {result!r}") from result
+    top_predictions, ranked, _, _ = result
+    if not top_predictions or not np.isfinite(ranked.scores).all():
+        raise ValueError("Smoke prediction returned no finite scores")
+
+
+class DataReloader:
+    """
+    Builds the next data generation off the event loop and swaps it in.
+
+    load (main.load_generation) runs on a thread and returns a complete new generation,
+    which must pass validate_generation before store["current"] is replaced in a single
+    assignment. Requests already pinned to the old generation finish on it, and it is
+    freed once the last of them is done. One reload runs at a time; asking for another
+    meanwhile waits for the running one. If loading or validation fails, the current
+    generation stays.
+    """
+
+    def __init__(self, store, load, sources):
+        self.store = store
+        self.load = load
+        self.sources = sources
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_duration = None
+        self._running = None
+        # Files that failed to load are not retried until they change again
+        self._failed_signature = None
+
+    async def reload(self, reason):
+        """Load, validate and swap in a new generation; returns it or raises ReloadFailed."""
+        if self._running is None or self._running.done():
+            self._running = asyncio.ensure_future(self._reload(reason))
+        return await asyncio.shield(self._running)
+
+    def trigger(self, reason):
+        """Start a reload without waiting for it (for signal handlers)."""
+        task = asyncio.ensure_future(self.reload(reason))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _reload(self, reason):
+        previous = self.store["current"]
+        print(f"Reloading data ({reason}); serving generation {previous['id']} meanwhile...")
+        started = time.perf_counter()
+        try:
+            generation = await asyncio.to_thread(self._build)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"Reload failed, still serving generation {previous['id']}: {self.last_error}")
+            raise ReloadFailed(self.last_error) from e
+
+        self.store["current"] = generation
+        self.reloads += 1
+        self.last_error = None
+        self.last_duration = time.perf_counter() - started
+        print(f"Swapped data generation {previous['id']} for {generation['id']} "
+              f"(loaded and validated in {self.last_duration:.1f}s).")
+        return generation
+
+    def _build(self):
+        generation = self.load()
+        validate_generation(generation)
+        return generation
+
+    async def watch(self, interval=RELOAD_WATCH_SECONDS):
+        """
+        Reload whenever the source files differ from the served generation's. A change is
+        only acted on once the files have stayed the same for a whole interval, so a file
+        that is still being copied in is not loaded half-written.
+        """
+        pending = None
+        while True:
+            await asyncio.sleep(interval)
+            signature = source_signature(self.sources)
+            if signature == self.store["current"]["signature"] or signature == self._failed_signature:
+                pending = None
+                continue
+            if signature != pending:
+                pending = signature
+                continue
+            pending = None
+            try:
+                await self.reload("source files changed")
+            except ReloadFailed:
+                self._failed_signature = signature
+
+    def stats(self):
+        return {
+            "reloading": self._running is not None and not self._running.done(),
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_duration_seconds": round(self.last_duration, 2) if self.last_duration is not None else None,
+        }
+
+
+def pinned_generation():
+    """The generation the current request was pinned to, or None outside a request."""
+    return _pinned.get()
+
+
+class GenerationMiddleware:
+    """
+    ASGI middleware pinning each request to the data generation being served when it
+    arrives, so a reload mid-request never mixes two generations, and naming that
+    generation in the X-Data-Generation response header.
+    """
+
+    def __init__(self, app, store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        generation = self.store.get("current")
+        if scope["type"] != "http" or generation is None:
+            await self.app(scope, receive, send)
+            return
+
+        header = (GENERATION_HEADER, generation["id"].encode())
+
+        async def send_with_generation(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=[*message.get("headers", []), header])
+            await send(message)
+
+        token = _pinned.set(generation)
+        try:
+            await self.app(scope, receive, send_with_generation)
+        finally:
+            _pinned.reset(token)
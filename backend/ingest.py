@@ -0,0 +1,281 @@
+import numpy as np
+import pandas as pd
+from lightfm.cross_validation import random_train_test_split
+from lightfm.data import Dataset
+from scipy.sparse import coo_matrix
+
+# Rows of the user dump parsed per pandas chunk
+CHUNK_SIZE = 1_000_000
+INTERACTION_COLUMNS = ['username', 'anime_id', 'status', 'score']
+
+
+class PreprocessedData:
+    """The fitted Dataset (id and feature mappings) and the matrices a model is fit on."""
+
+    def __init__(self, dataset, interactions, weights, user_features):
+        self.dataset = dataset
+        self.interactions = interactions
+        self.weights = weights
+        self.user_features = user_features
+
+
+class InteractionLog:
+    """
+    The scraped user/anime list dump as columns: int32 user and item codes into the
+    usernames and anime_ids vocabularies (in order of first appearance) and a float32
+    interaction weight per row. Costs 12 bytes per row instead of a frame of strings.
+    """
+
+    def __init__(self, usernames, anime_ids, user_codes, item_codes, weights):
+        self.usernames = usernames
+        self.anime_ids = anime_ids
+        self.user_codes = user_codes
+        self.item_codes = item_codes
+        self.weights = weights
+
+    def __len__(self):
+        return self.user_codes.size
+
+
+def interaction_weights(status, score):
+    """
+    Vectorized weight heuristic for training rows: Completed/Watching by score, then
+    Plan to Watch, Dropped and On-Hold, and 1.0 for any other status.
+    """
+    status = np.asarray(status, dtype=object)
+    score = np.asarray(score, dtype=np.float64)
+    watched = (status == 'Completed') | (status == 'Watching')
+    watched_weight = np.select(
+        [score == 0, score >= 8, score == 7, score == 6, score == 5],
+        [0.5, score / 10.0, 0.6, 0.4, 0.2],
+        default=0.1
+    )
+    return np.select(
+        [watched, status == 'Plan to Watch', status == 'Dropped', status == 'On-Hold'],
+        [watched_weight, 0.7, 0.0, 0.2],
+        default=1.0
+    ).astype(np.float32)
+
+
+class _Vocabulary:
+    """Assigns int32 codes to string ids across chunks, in order of first appearance."""
+
+    def __init__(self):
+        self.codes = {}
+
+    def encode(self, values):
+        # Only the chunk's distinct values go through the dict
+        inverse, uniques = pd.factorize(values)
+        uniques_codes = np.fromiter(
+            (self.codes.setdefault(value, len(self.codes)) for value in uniques),
+            dtype=np.int32, count=len(uniques)
+        )
+        return uniques_codes[inverse]
+
+    def values(self):
+        values = np.empty(len(self.codes), dtype=object)
+        values[:] = list(self.codes)
+        return values
+
+
+def read_interactions(path, chunksize=CHUNK_SIZE):
+    """
+    Stream the user dump CSV in chunks into an InteractionLog. Only the username, anime_id,
+    status and score columns are read, and each chunk is dropped once it is encoded.
+
+    Usernames and anime ids are kept exactly as written. train.py used to let pandas infer
+    their dtypes and then cast to str, which gives the same keys for any dump with
+    alphabetic usernames in it (the column stays strings, numeric-looking names included)
+    but rewrote names when a whole column or read block was numeric ("007" became "7") and
+    NA-like names ("NA", "null") became "nan". Those keys then missed the user genre file,
+    which is keyed by the names as written. bench_ingest checks parity with the old code.
+    """
+    users = _Vocabulary()
+    items = _Vocabulary()
+    user_codes, item_codes, weights = [], [], []
+
+    reader = pd.read_csv(
+        path,
+        usecols=INTERACTION_COLUMNS,
+        dtype={'username': str, 'anime_id': str, 'status': str},
+        na_filter=False,
+        chunksize=chunksize,
+    )
+    for chunk in reader:
+        user_codes.append(users.encode(chunk['username'].to_numpy()))
+        item_codes.append(items.encode(chunk['anime_id'].to_numpy()))
+        score = pd.to_numeric(chunk['score'], errors='coerce').to_numpy(dtype=np.float64)
+        weights.append(interaction_weights(chunk['status'].to_numpy(), score))
+
+    def joined(parts, dtype):
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    return InteractionLog(
+        users.values(),
+        items.values(),
+        joined(user_codes, np.int32),
+        joined(item_codes, np.int32),
+        joined(weights, np.float32),
+    )
+
+
+def k_core(user_codes, item_codes, min_user_interactions, min_item_interactions):
+    """
+    Boolean row mask of the largest subset in which every user has at least
+    min_user_interactions rows and every item at least min_item_interactions. Each pass
+    counts the surviving rows with bincount and drops rows of users or items below the
+    threshold, until a pass removes nothing.
+    """
+    keep = np.ones(user_codes.size, dtype=bool)
+    num_users = int(user_codes.max()) + 1 if user_codes.size else 0
+    num_items = int(item_codes.max()) + 1 if item_codes.size else 0
+    while True:
+        user_counts = np.bincount(user_codes[keep], minlength=num_users)
+        item_counts = np.bincount(item_codes[keep], minlength=num_items)
+        passing = keep & (user_counts[user_codes] >= min_user_interactions) & (item_counts[item_codes] >= min_item_interactions)
+        removed = int(keep.sum() - passing.sum())
+        keep = passing
+        if removed == 0:
+            return keep
+        print(f"k-core pass removed {removed} rows, {int(keep.sum())} left")
+
+
+def first_appearance(codes):
+    """Distinct codes in the order they first appear in codes."""
+    uniques, first_index = np.unique(codes, return_index=True)
+    return uniques[np.argsort(first_index)]
+
+
+def interaction_matrices(log, keep, user_id_map, item_id_map):
+    """
+    Build LightFM's (interactions, weights) COO matrices for the kept rows directly, with
+    the row and column ids of a Dataset fit on those users and items. Equivalent to
+    Dataset.build_interactions without a Python loop per row.
+    """
+    user_codes = log.user_codes[keep]
+    item_codes = log.item_codes[keep]
+
+    user_internal = np.full(log.usernames.size, -1, dtype=np.int32)
+    for code in np.unique(user_codes):
+        user_internal[code] = user_id_map[log.usernames[code]]
+    item_internal = np.full(log.anime_ids.size, -1, dtype=np.int32)
+    for code in np.unique(item_codes):
+        item_internal[code] = item_id_map[log.anime_ids[code]]
+
+    rows = user_internal[user_codes]
+    cols = item_internal[item_codes]
+    shape = (len(user_id_map), len(item_id_map))
+    interactions = coo_matrix((np.ones(rows.size, dtype=np.int32), (rows, cols)), shape=shape)
+    weights = coo_matrix((log.weights[keep], (rows, cols)), shape=shape)
+    return interactions, weights
+
+
+def read_user_genres(path):
+    """
+    Parse the user genre file, one "username,Genre=weight,..." line per user, into
+    (username, {genre: weight}) pairs. Raises ValueError on a malformed genre entry.
+    """
+    user_genres = []
+    with open(path, "r") as infile:
+        for line in infile:
+            parts = line.strip().split(",")
+            username = parts[0]
+            user_specific_genres = {}
+            for unparsed_genres in parts[1:]:
+                genre_data = unparsed_genres.strip().split("=")
+                if len(genre_data) != 2:
+                    raise ValueError(f"Invalid genre data for user {username}: {genre_data}")
+                genre_name, genre_weight = tuple(genre_data)
+                user_specific_genres[genre_name.strip()] = float(genre_weight)
+            user_genres.append((username, user_specific_genres))
+    return user_genres
+
+
+def preprocess(interactions_path, user_genres_path, min_user_interactions, min_item_interactions):
+    """
+    Load the user dump and genre file, k-core filter the interactions, fit a Dataset on the
+    surviving users, items and their genres, and build the interaction, weight and user
+    feature matrices. Raises ValueError if the inputs are malformed or nothing survives.
+    """
+    print(f"Loading user anime data from {interactions_path}...")
+    # Streamed in chunks into int32 user/item codes and float32 weights
+    log = read_interactions(interactions_path)
+
+    print(f"Initial interactions: {len(log)}")
+    print(f"Unique users: {log.usernames.size}, Unique anime: {log.anime_ids.size}")
+
+    print(f"Loading user anime genre data from {user_genres_path}...")
+    parsed_user_features_input = read_user_genres(user_genres_path)
+    all_genre_names = {genre_name for _, genres in parsed_user_features_input for genre_name in genres}
+
+    print(f"Loaded {len(parsed_user_features_input)} user genre entries from {user_genres_path}.")
+
+    print(f"Found {len(all_genre_names)} unique genre names in feature file.")
+    for genre_name in sorted(all_genre_names):
+        print(f" - {genre_name}")
+    print("\n")
+
+    keep = k_core(log.user_codes, log.item_codes, min_user_interactions, min_item_interactions)
+    if not keep.any():
+        raise ValueError("No interactions left after filtering. Check your MIN_INTERACTIONS thresholds or data.")
+
+    # Users and items in order of first appearance, as Dataset.fit on the filtered rows would see them
+    active_usernames = log.usernames[first_appearance(log.user_codes[keep])]
+    active_anime_ids = log.anime_ids[first_appearance(log.item_codes[keep])]
+
+    print(f"Final interactions after filtering: {int(keep.sum())}")
+    print(f"Number of unique users: {active_usernames.size}")
+    print(f"Number of unique anime: {active_anime_ids.size}")
+
+    print("\nFiltering user features for users present in interaction data...")
+    active_users = set(active_usernames)
+    parsed_user_features_input = [(username, features) for username, features in parsed_user_features_input
+                                  if username in active_users]
+    # Genres from active users only
+    all_genre_names = {genre_name for _, features in parsed_user_features_input for genre_name in features}
+
+    print(f"Number of users with features after filtering: {len(parsed_user_features_input)}")
+    print(f"Number of unique genres from active users: {len(all_genre_names)}")
+
+    dataset = Dataset()
+    dataset.fit(users=active_usernames,
+                items=active_anime_ids,
+                user_features=list(all_genre_names))
+
+    # Weights were computed per row while streaming (see interaction_weights)
+    user_id_map, _, item_id_map, _ = dataset.mapping()
+    (interactions, weights) = interaction_matrices(log, keep, user_id_map, item_id_map)
+    del log, keep
+
+    user_features_matrix = dataset.build_user_features(parsed_user_features_input, normalize=False)
+    return PreprocessedData(dataset, interactions, weights, user_features_matrix)
+
+
+def train_test_split(data, test_fraction, seed=42):
+    """
+    Split the interactions and weights of a PreprocessedData the same way (one seed for
+    both keeps them aligned). Returns (train_interactions, test_interactions, train_weights).
+    """
+    (train_interactions, test_interactions) = random_train_test_split(
+        data.interactions,
+        test_percentage=test_fraction,
+        random_state=np.random.RandomState(seed)
+    )
+    (train_weights, _) = random_train_test_split(
+        data.weights,
+        test_percentage=test_fraction,
+        random_state=np.random.RandomState(seed)
+    )
+    return train_interactions, test_interactions, train_weights
+
+
+def held_out_pairs(test_interactions, train_interactions):
+    """
+    The test interactions as CSR without the user/anime pairs that are also in the train
+    split. A pair listed twice in the dump can land on both sides of random_train_test_split,
+    which LightFM's evaluation rejects.
+    """
+    test_interactions = test_interactions.tocsr()
+    test_interactions = test_interactions - test_interactions.multiply(train_interactions.tocsr() > 0)
+    test_interactions.eliminate_zeros()
+    return test_interactions
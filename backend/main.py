@@ -1,50 +1,196 @@
 import pandas as pd
-from fastapi import FastAPI, HTTPException, Request 
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 import traceback
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from contextlib import asynccontextmanager
 from typing import List, Dict, Any
 from pathlib import Path 
 import uvicorn
 import pickle
+import os
+import json
+import asyncio
+import secrets
+import signal
+import time
 
-from predict import predict_scores, fetch_recs_from_filters, get_user_anime_status
+from predict import predict_scores_batch, fetch_recs_from_filters, filter_ranked_items, get_user_anime_status
+from mal_client import MALClient, MALError
+from user_cache import UserListCache
+from fold_in import FoldInEngine
+from neighbours import NeighbourTable
+from catalog import CatalogIndex, source_digest
+from artifacts import has_artifacts, load_artifacts, CURRENT_NAME
+from sessions import RecommendationSessions
+from model_executor import ModelExecutor, ExecutorSaturated
+from batching import PredictBatcher
+from batch_predict import predict_many, unique_usernames, BATCH_MAX_USERS, BATCH_FETCH_CONCURRENCY
+from similarity import ItemSimilarityIndex, similar_items, SIMILAR_MODE, SIMILAR_MODES, SIMILAR_NPROBE
+from atlas import AtlasIndex
+from details import AnimeDetailsIndex, DETAILS_BATCH_MAX_IDS
+from spatial import AtlasGrid, MAX_TILE_ZOOM
+from metrics import MetricsMiddleware, declare_endpoints, registry as metrics_registry, span
+from generations import (DataReloader, GenerationMiddleware, ReloadFailed, RELOAD_WATCH_SECONDS, generation_id,
+                         generation_info, pinned_generation, source_signature, validate_generation)
 
 BACKEND_DIR = Path(__file__).resolve().parent
 
-CSV_FILE_PATH = BACKEND_DIR / "data" / "anime_data_master.csv"
-MODEL_SAVE_PATH = BACKEND_DIR / "model_files" / "lightfm_anime_model.pkl"
-DATASET_SAVE_PATH = BACKEND_DIR / "model_files" / "lightfm_anime_dataset.pkl"
-ATLAS_DATA_PATH = BACKEND_DIR / "data" / "atlas_data.csv"
+DATA_DIR = Path(os.getenv("DATA_DIR", BACKEND_DIR / "data"))
+MODEL_DIR = Path(os.getenv("MODEL_DIR", BACKEND_DIR / "model_files"))
 
+CSV_FILE_PATH = DATA_DIR / "anime_data_master.csv"
+MODEL_SAVE_PATH = MODEL_DIR / "lightfm_anime_model.pkl"
+DATASET_SAVE_PATH = MODEL_DIR / "lightfm_anime_dataset.pkl"
+ARTIFACTS_DIR = Path(os.getenv("MODEL_ARTIFACTS_DIR", MODEL_DIR / "artifacts"))
+# "mmap" loads the exported .npy artifacts, "pickle" the original pickles, "auto" whichever exists
+MODEL_FORMAT = os.getenv("MODEL_FORMAT", "auto")
+ATLAS_DATA_PATH = DATA_DIR / "atlas_data.csv"
+# Files a reload picks up; the artifact CURRENT pointer changes when a new version is exported
+DATA_SOURCES = [CSV_FILE_PATH, ATLAS_DATA_PATH, MODEL_SAVE_PATH, DATASET_SAVE_PATH, ARTIFACTS_DIR / CURRENT_NAME]
+# Bearer token for /admin endpoints; they are disabled while it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Per-process state, plus "current": the generation of read-only data being served
 data_store = {}
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # Load data on startup
+def load_generation():
+    """
+    Load one generation of the read-only data every request serves from: catalog, model
+    and atlas, and the indexes derived from them. It is built into a new dict without
+    touching the generation being served, so reloads can run while requests are handled.
+    """
+    # Taken first, so a file replaced while loading makes the watcher reload again
+    signature = source_signature(DATA_SOURCES)
+    generation = {"signature": signature, "loaded_at": time.time()}
+
     print(f"Loading anime data from {CSV_FILE_PATH}...")
     df = pd.read_csv(CSV_FILE_PATH, na_values=[], keep_default_na=False)
-    data_store["csv"] = df
+    generation["csv"] = df
     print("Anime data loaded.")
 
-    print(f"Loading pre-trained model from {MODEL_SAVE_PATH}...")
-    with open(MODEL_SAVE_PATH, 'rb') as model_file:
-        data_store["model"] = pickle.load(model_file)
-    print("Model loaded.")
+    generation["anime_details"] = AnimeDetailsIndex(df)
+    print(f"Anime details indexed for {len(generation['anime_details'])} ids (catalog version "
+          f"{generation['anime_details'].version}).")
+
+    if MODEL_FORMAT == "pickle" or (MODEL_FORMAT == "auto" and not has_artifacts(ARTIFACTS_DIR)):
+        print(f"Loading pre-trained model from {MODEL_SAVE_PATH}...")
+        with open(MODEL_SAVE_PATH, 'rb') as model_file:
+            generation["model"] = pickle.load(model_file)
+        print("Model loaded.")
+
+        print(f"Loading dataset object from {DATASET_SAVE_PATH}...")
+        with open(DATASET_SAVE_PATH, 'rb') as dataset_file:
+            generation["dataset"] = pickle.load(dataset_file)
+        print("Dataset object loaded.")
 
-    print(f"Loading dataset object from {DATASET_SAVE_PATH}...")
-    with open(DATASET_SAVE_PATH, 'rb') as dataset_file:
-        data_store["dataset"] = pickle.load(dataset_file)
-    print("Dataset object loaded.")
+        print("Building catalog index...")
+        generation["catalog"] = CatalogIndex(generation["csv"], generation["dataset"])
+        print(f"Catalog index built for {len(generation['catalog'])} items.")
+        generation["model_version"] = "pickle"
+        generation["neighbours"] = None
+    else:
+        print(f"Memory-mapping model artifacts from {ARTIFACTS_DIR}...")
+        artifacts = load_artifacts(ARTIFACTS_DIR)
+        generation["model"] = artifacts.model
+        generation["dataset"] = artifacts.dataset
+        generation["model_version"] = artifacts.version
+        generation["neighbours"] = artifacts.neighbours
+        print(f"Model artifacts {artifacts.version} mapped for {artifacts.model.item_embeddings.shape[0]} items.")
+        if artifacts.catalog_source == source_digest(df):
+            generation["catalog"] = artifacts.catalog
+        else:
+            # The CSV changed since the export; /predict and /similar must show what /get/anime does
+            print(f"{CSV_FILE_PATH} differs from the catalog in artifacts {artifacts.version}, rebuilding the catalog index...")
+            generation["catalog"] = CatalogIndex(df, artifacts.dataset)
+            print(f"Catalog index built for {len(generation['catalog'])} items.")
+
+    # Item-side parameters stay shared and read-only; each request only folds in its own user
+    generation["fold_in"] = FoldInEngine(generation["model"])
+    quantized = generation["fold_in"].quantized
+    if quantized is not None:
+        print(f"Scoring on {quantized.dtype} item embeddings ({quantized.nbytes / 1e6:.1f} MB, "
+              f"float32 {generation['fold_in'].item_embeddings.nbytes / 1e6:.1f} MB).")
+
+    if generation["neighbours"] is None:
+        # Pickled models and older artifact versions do not carry the precomputed table
+        print("Building item neighbour table...")
+        generation["neighbours"] = NeighbourTable.build(generation["model"].item_embeddings)
+    print(f"Item neighbour table ready ({generation['neighbours'].nbytes / 1e6:.1f} MB).")
+
+    print("Building item similarity index...")
+    generation["similarity"] = ItemSimilarityIndex(generation["model"].item_embeddings)
+    print(f"Item similarity index built with {generation['similarity'].nlist} lists.")
 
     print(f"Loading atlas data from {ATLAS_DATA_PATH}...")
     df_atlas = pd.read_csv(ATLAS_DATA_PATH, na_values=[], keep_default_na=False)
-    data_store["atlas"] = df_atlas
+    generation["atlas"] = df_atlas
     print("Atlas data loaded.")
 
+    print("Building atlas payload...")
+    try:
+        generation["atlas_index"] = AtlasIndex(df_atlas, df)
+        generation["atlas_grid"] = AtlasGrid(generation["atlas_index"])
+        print(f"Atlas payload built for {len(generation['atlas_index'])} points.")
+    except Exception as e:
+        generation["atlas_index"] = None
+        generation["atlas_grid"] = None
+        print(f"Error building atlas payload: {e}")
+
+    generation["id"] = generation_id(generation, signature)
+    return generation
+
+def load_data_store():
+    """
+    Load and validate the first generation of read-only data.
+
+    serve.py calls this once in the parent process before forking its workers, so they all
+    share these arrays instead of loading their own copies.
+    """
+    generation = load_generation()
+    validate_generation(generation)
+    data_store["current"] = generation
+    print(f"Serving data generation {generation['id']}.")
+
+def current_generation():
+    """The generation this request was pinned to on arrival (see GenerationMiddleware)."""
+    return pinned_generation() or data_store["current"]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load data on startup, unless serve.py already did before forking this worker
+    if "current" not in data_store:
+        load_data_store()
+
+    # Per-process state: connection pools and caches are never shared between workers
+    data_store["sessions"] = RecommendationSessions()
+    data_store["model_executor"] = ModelExecutor()
+    # Concurrent /predict calls share one executor job and one scoring matrix product
+    data_store["predict_batcher"] = PredictBatcher(data_store["model_executor"], score_pinned_users)
+    data_store["mal"] = MALClient()
+    data_store["user_lists"] = UserListCache(data_store["mal"])
+
+    # Reloads are per process: SIGHUP (serve.py forwards it to every worker), /admin/reload
+    # or, with RELOAD_WATCH_SECONDS, a change to any of DATA_SOURCES
+    reloader = DataReloader(data_store, load_generation, DATA_SOURCES)
+    data_store["reloader"] = reloader
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reloader.trigger, "SIGHUP")
+    except (ValueError, RuntimeError, NotImplementedError):
+        # Not on the main thread (e.g. under a test client) or no signals on this platform
+        pass
+    watcher = asyncio.create_task(reloader.watch()) if RELOAD_WATCH_SECONDS > 0 else None
+    if data_store.pop("reload_on_start", False):
+        # serve.py forked this worker from data the other workers have since reloaded
+        reloader.trigger("forked after a reload")
+
     yield
     # Clean up resources on shutdown if needed
+    if watcher is not None:
+        watcher.cancel()
+    await data_store["mal"].aclose()
+    data_store["model_executor"].shutdown()
     data_store.clear()
     print("Data store cleared.")
 
@@ -69,7 +215,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Data-Generation"],
 )
+app.add_middleware(GenerationMiddleware, store=data_store)
+# Outermost, so latency and in-flight counts cover every other middleware too
+app.add_middleware(MetricsMiddleware)
 
 @app.get("/")
 async def root():
@@ -77,42 +227,171 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "pid": os.getpid(),
+        "model_version": current_generation()["model_version"],
+        "generation": generation_info(current_generation()),
+        "reload": data_store["reloader"].stats(),
+        "user_list_cache": data_store["user_lists"].stats(),
+        "model_executor": data_store["model_executor"].stats(),
+        "predict_batcher": data_store["predict_batcher"].stats()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Stage, request and payload-size histograms and in-flight gauges in Prometheus text format."""
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness gate for load balancers. Under serve.py it stays 503 until every worker has
+    attached to the shared data, so traffic is not routed to a half-started pool.
+    """
+    workers = data_store.get("workers")
+    if workers is None:
+        return {"status": "ready", "workers": 1}
+    attached = sum(workers["attached"])
+    if attached < workers["expected"]:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "starting", "workers": attached, "expected": workers["expected"]}
+        )
+    return {"status": "ready", "workers": attached}
+
+@app.post("/admin/reload")
+async def reload_data(request: Request):
+    """
+    Load, validate and swap in a new generation of the catalog, model and atlas without a
+    restart. Requests in flight finish on the generation they started with.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(request.headers.get("authorization", ""), f"Bearer {ADMIN_TOKEN}"):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    workers = data_store.get("workers")
+    if workers is not None:
+        # Every serve.py worker holds its own generation; the parent forwards SIGHUP to all of them
+        os.kill(os.getppid(), signal.SIGHUP)
+        return JSONResponse(
+            status_code=202,
+            content={"status": "reloading", "workers": workers["expected"], "generation": current_generation()["id"]}
+        )
+
+    try:
+        generation = await data_store["reloader"].reload("admin request")
+    except ReloadFailed as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Reload failed, still serving generation {data_store['current']['id']}: {e}"
+        )
+    return {"status": "reloaded", "generation": generation_info(generation)}
 
 class PredictRequest(BaseModel):
     username: str
+    # Older clients that still page through the full list themselves can ask for it
+    include_item_scores: bool = False
 
-@app.post("/predict")
-async def predict(request_data: PredictRequest):
-    try:
-        top_20_predictions, item_score_pairs_sorted, user_stats, user_anime_details = predict_scores(
-            request_data.username, 
-            data_store["dataset"], 
-            data_store["model"], 
-            data_store["csv"]
+def json_response(content):
+    """
+    Encode a response with json.dumps directly. Recommendation payloads are plain dicts and
+    lists, and FastAPI's generic encoder costs ~10x more event-loop time on them.
+    """
+    with span("response.encode"):
+        body = json.dumps(content)
+    return Response(content=body, media_type="application/json")
+
+def score_pinned_users(calls):
+    """
+    The predict batcher's job: score (generation, username, list_objects) calls, each on
+    the generation its request was pinned to. Outside a reload a batch has only one.
+    """
+    results = [None] * len(calls)
+    by_generation = {}
+    for position, (generation, username, list_objects) in enumerate(calls):
+        by_generation.setdefault(generation["id"], (generation, []))[1].append((position, (username, list_objects)))
+    for generation, members in by_generation.values():
+        scored = predict_scores_batch(
+            [user for _, user in members],
+            generation["dataset"],
+            generation["model"],
+            generation["catalog"],
+            fold_in_engine=generation["fold_in"],
+            neighbours=generation["neighbours"]
         )
+        for (position, _), result in zip(members, scored):
+            results[position] = result
+    return results
 
-        # Check if we got any user data back
-        if len(user_anime_details) == 0:
-            # This means the username was invalid or not found
-            raise HTTPException(
-                status_code=404, 
-                detail=f"Username '{request_data.username}' not found on MyAnimeList. Please check the username and try again."
-            )
+def server_busy(e):
+    return HTTPException(
+        status_code=503,
+        detail="The server is busy generating recommendations. Please try again shortly.",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+async def run_model_work(fn, *args, **kwargs):
+    """Run CPU-heavy work on the model executor, turning a full queue into a 503."""
+    try:
+        return await data_store["model_executor"].run(fn, *args, **kwargs)
+    except ExecutorSaturated as e:
+        raise server_busy(e)
 
-        # Check if we have any recommendations
-        if len(top_20_predictions) == 0:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Unable to generate recommendations for user '{request_data.username}'"
+async def rank_user(username, generation):
+    """Fetch a user's list and run it through the predict batcher; raises HTTPException on failure."""
+    try:
+        list_objects = await data_store["user_lists"].get(username)
+    except MALError as e:
+        print(f"Error fetching anime list for {username}: {e}")
+        raise HTTPException(status_code=502, detail="MyAnimeList is not responding. Please try again later.")
+
+    try:
+        # Queueing for a batch plus the batch's model work
+        with span("predict.batch_wait"):
+            top_20_predictions, ranked, user_stats, user_anime_details = await data_store["predict_batcher"].submit(
+                generation, username, list_objects or []
             )
+    except ExecutorSaturated as e:
+        raise server_busy(e)
+
+    # Check if we got any user data back
+    if len(user_anime_details) == 0:
+        # This means the username was invalid or not found
+        raise HTTPException(
+            status_code=404, 
+            detail=f"Username '{username}' not found on MyAnimeList. Please check the username and try again."
+        )
+
+    # Check if we have any recommendations
+    if len(top_20_predictions) == 0:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Unable to generate recommendations for user '{username}'"
+        )
+
+    return top_20_predictions, ranked, user_stats, user_anime_details
+
+@app.post("/predict")
+async def predict(request_data: PredictRequest):
+    generation = current_generation()
+    try:
+        top_20_predictions, ranked, user_stats, user_anime_details = await rank_user(request_data.username, generation)
     
-        return {
+        # Keep the full ranking server-side; the client pages through it with the token
+        session_token = data_store["sessions"].create(ranked, generation=generation["id"])
+
+        response = {
             "recommendations": top_20_predictions, 
-            "item_score_pairs_sorted": item_score_pairs_sorted, 
+            "session_token": session_token,
+            "total_count": len(ranked),
             "user_stats": user_stats,
             "user_anime_details": user_anime_details
         }
+        if request_data.include_item_scores:
+            response["item_score_pairs_sorted"] = await run_model_work(ranked.pairs)
+        return json_response(response)
     except HTTPException:
         # Re-raise HTTP exceptions as-is
         raise
@@ -123,109 +402,263 @@ async def predict(request_data: PredictRequest):
         print("--------------------------------------")
         raise HTTPException(status_code=500, detail="Internal Server Error during prediction.")
 
+class BatchPredictRequest(BaseModel):
+    usernames: List[str]
+    concurrency: int = BATCH_FETCH_CONCURRENCY
+
+async def score_block(users, generation):
+    """
+    Score a block of batch users on the model executor. Offline batches wait for a free
+    slot instead of taking a 503, so interactive /predict traffic keeps priority.
+    """
+    while True:
+        try:
+            return await data_store["model_executor"].run(
+                predict_scores_batch,
+                users,
+                generation["dataset"],
+                generation["model"],
+                generation["catalog"],
+                fold_in_engine=generation["fold_in"],
+                neighbours=generation["neighbours"]
+            )
+        except ExecutorSaturated as e:
+            await asyncio.sleep(e.retry_after)
+
+@app.post("/predict/batch")
+async def predict_batch(request: BatchPredictRequest):
+    """
+    Recommendations for many usernames, streamed as NDJSON: one line per user in the order
+    they finish, each with its own status (200, or /predict's 404/400/502/500).
+    """
+    usernames = unique_usernames(request.usernames)
+    if len(usernames) > BATCH_MAX_USERS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_USERS} usernames per batch.")
+
+    # A long batch stays on the generation it started with, even across a reload
+    generation = current_generation()
+
+    async def score_pinned_block(users):
+        return await score_block(users, generation)
+
+    async def lines():
+        async for result in predict_many(
+            usernames,
+            data_store["user_lists"],
+            score_pinned_block,
+            concurrency=min(request.concurrency, BATCH_FETCH_CONCURRENCY)
+        ):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 class FilteredPredictRequest(BaseModel):
-    item_score_pairs_sorted: List[List[float]]
+    session_token: str | None = None
+    # Lets a worker that does not hold the session rebuild it (see serve.py)
+    username: str | None = None
+    # Fallback for clients that send the ranking back instead of a session token
+    item_score_pairs_sorted: List[List[float]] | None = None
     selected_genres: List[str] = []
     selected_media_types: List[str] = []
     min_users: int = 0
     max_users: int = 4200000
     filter_sequels: bool = False
-    page: int = 1
+    page: int = Field(default=1, ge=1)
 
 @app.post("/predict/filtered")
 async def predict_filtered(request: FilteredPredictRequest):
-    paginated_recs, total_filtered_count = fetch_recs_from_filters(
-        item_score_pairs_sorted=request.item_score_pairs_sorted,
-        df=data_store["csv"],
-        dataset=data_store["dataset"],
-        filters={
-            "genres": request.selected_genres,
-            "media_types": request.selected_media_types,
-            "min_users": request.min_users,
-            "max_users": request.max_users,
-            "filter_sequels": request.filter_sequels,
-        },
-        page=request.page,
-        page_size=20
+    filters = {
+        "genres": request.selected_genres,
+        "media_types": request.selected_media_types,
+        "min_users": request.min_users,
+        "max_users": request.max_users,
+        "filter_sequels": request.filter_sequels,
+    }
+
+    generation = current_generation()
+    sessions = data_store["sessions"]
+    ranked = sessions.get(request.session_token, generation=generation["id"]) if request.session_token else None
+    rebuilt_token = None
+    if ranked is None and request.session_token and request.username:
+        # Sessions live in the worker that served /predict. Fold-in is deterministic, so any
+        # other worker (or this one after expiry or a reload) can rebuild the ranking for the
+        # user. The rebuilt session gets a token of our own; the client switches to it.
+        _, ranked, _, _ = await rank_user(request.username, generation)
+        rebuilt_token = sessions.create(ranked, generation=generation["id"])
+    if ranked is not None:
+        paginated_recs, total_filtered_count = await run_model_work(
+            filter_ranked_items,
+            ranked=ranked,
+            catalog=generation["catalog"],
+            filters=filters,
+            page=request.page,
+            page_size=20
+        )
+    elif request.item_score_pairs_sorted is not None:
+        paginated_recs, total_filtered_count = await run_model_work(
+            fetch_recs_from_filters,
+            item_score_pairs_sorted=request.item_score_pairs_sorted,
+            catalog=generation["catalog"],
+            filters=filters,
+            page=request.page,
+            page_size=20
+        )
+    elif request.session_token:
+        raise HTTPException(
+            status_code=410,
+            detail="Recommendation session expired. Please fetch recommendations again."
+        )
+    else:
+        raise HTTPException(status_code=400, detail="Either session_token or item_score_pairs_sorted is required.")
+
+    response = {"recommendations": paginated_recs, "total_count": total_filtered_count}
+    if rebuilt_token is not None:
+        response["session_token"] = rebuilt_token
+    return json_response(response)
+
+@app.get("/similar/{anime_id}")
+async def get_similar_anime(
+    anime_id: int,
+    mode: str = SIMILAR_MODE,
+    nprobe: int = SIMILAR_NPROBE,
+    selected_genres: List[str] = Query([]),
+    selected_media_types: List[str] = Query([]),
+    min_users: int = 0,
+    max_users: int = 4200000,
+    filter_sequels: bool = False,
+    page: int = Query(1, ge=1)
+):
+    """Anime whose learned embeddings are closest to this one, with the /predict/filtered filters."""
+    if mode not in SIMILAR_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(SIMILAR_MODES)}")
+    generation = current_generation()
+    internal_id = generation["catalog"].internal_id(anime_id)
+    if internal_id is None:
+        raise HTTPException(status_code=404, detail="Anime not found")
+
+    filters = {
+        "genres": selected_genres,
+        "media_types": selected_media_types,
+        "min_users": min_users,
+        "max_users": max_users,
+        "filter_sequels": filter_sequels,
+    }
+    paginated_recs, total_filtered_count = await run_model_work(
+        similar_items,
+        generation["similarity"],
+        generation["catalog"],
+        internal_id,
+        filters,
+        page=page,
+        page_size=20,
+        mode=mode,
+        nprobe=max(1, nprobe)
+    )
+    return Response(
+        content=json.dumps({"anime_id": anime_id, "recommendations": paginated_recs, "total_count": total_filtered_count}),
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=300"}
     )
-    return {"recommendations": paginated_recs, "total_count": total_filtered_count}
 
 @app.get("/atlas")
-async def get_atlas_data(username: str | None = None):
+async def get_atlas_data(request: Request, username: str | None = None):
+    atlas_index = current_generation().get("atlas_index")
+    if atlas_index is None:
+        raise HTTPException(status_code=500, detail="An error occurred while loading the atlas data.")
+
+    if not username:
+        # The anonymous atlas never changes between data loads, so let clients revalidate
+        headers = {"ETag": atlas_index.etag, "Cache-Control": "public, max-age=300"}
+        if request.headers.get("if-none-match") == atlas_index.etag:
+            return Response(status_code=304, headers=headers)
+        return Response(content=atlas_index.payload, media_type="application/json", headers=headers)
+
+    # Get user's anime status if username is provided
+    user_anime_status = {}
     try:
-        # Load the pre-generated atlas data and anime data
-        atlas_df = data_store["atlas"]
-        anime_df = data_store["csv"]
-
-        # Ensure 'anime_id' is the same data type in both DataFrames before merging
-        atlas_df['anime_id'] = atlas_df['anime_id'].astype(int)
-        anime_df['anime_id'] = anime_df['anime_id'].astype(int)
-
-        # Select only necessary columns and merge
-        anime_info_df = anime_df[['anime_id', 'num_list_users', 'title']]
-        merged_df = pd.merge(atlas_df, anime_info_df, on='anime_id')
-        
-        # Check if required columns exist
-        required_columns = ['anime_id', 'x_coord', 'y_coord', 'num_list_users', 'title']
-        if not all(col in merged_df.columns for col in required_columns):
-            raise HTTPException(status_code=500, detail="Atlas data is missing required columns.")
-
-        # Get user's anime status if username is provided
-        user_anime_status = {}
-        if username:
-            try:
-                user_anime_status = get_user_anime_status(username)
-            except Exception as e:
-                print(f"Error fetching user's anime status for {username}: {e}")
-                # Continue without user data if there's an error
-
-        # Add user status to each anime
-        atlas_data = []
-        for _, row in merged_df.iterrows():
-            anime_record = row.to_dict()
-            anime_id = anime_record['anime_id']
-            anime_record['user_status'] = user_anime_status.get(anime_id, None)
-            atlas_data.append(anime_record)
-        
-        return {"atlas_data": atlas_data}
-    except FileNotFoundError as fnf_error:
-        # Be more specific about which file is missing
-        missing_file = str(fnf_error).split("'")[1]
-        raise HTTPException(status_code=404, detail=f"Data file not found: {missing_file}. Please ensure it exists.")
+        with span("atlas.user_list"):
+            list_objects = await data_store["user_lists"].get(username)
+        user_anime_status = get_user_anime_status(list_objects or [])
     except Exception as e:
-        # Log the error for debugging
-        print(f"Error loading atlas data: {e}")
+        print(f"Error fetching user's anime status for {username}: {e}")
+        # Continue without user data if there's an error
+
+    with span("atlas.overlay"):
+        body = atlas_index.user_payload(user_anime_status)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"Cache-Control": "private, no-store"}
+    )
+
+@app.get("/atlas/viewport")
+async def get_atlas_viewport(min_x: float, min_y: float, max_x: float, max_y: float, zoom: int = 0):
+    """Most popular atlas points inside a bounding box, capped by zoom level."""
+    atlas_grid = current_generation().get("atlas_grid")
+    if atlas_grid is None:
+        raise HTTPException(status_code=500, detail="An error occurred while loading the atlas data.")
+    return Response(
+        content=atlas_grid.viewport(min_x, min_y, max_x, max_y, zoom),
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=300"}
+    )
+
+@app.get("/atlas/tiles/{zoom}/{tile_x}/{tile_y}")
+async def get_atlas_tile(request: Request, zoom: int, tile_x: int, tile_y: int):
+    """One tile of the atlas, 2^zoom tiles per side, with its most popular points."""
+    atlas_grid = current_generation().get("atlas_grid")
+    if atlas_grid is None:
         raise HTTPException(status_code=500, detail="An error occurred while loading the atlas data.")
+    if not 0 <= zoom <= MAX_TILE_ZOOM or not 0 <= tile_x < 2 ** zoom or not 0 <= tile_y < 2 ** zoom:
+        raise HTTPException(status_code=404, detail="Tile not found")
+
+    body, etag = atlas_grid.tile(zoom, tile_x, tile_y)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/get/anime")
+async def get_anime_details_batch(request: Request, ids: List[int] = Query([])):
+    """Card details for many anime in one request: ?ids=1&ids=5&..."""
+    anime_details = current_generation().get("anime_details")
+    if anime_details is None:
+        raise HTTPException(status_code=500, detail="An error occurred while fetching anime details.")
+    if not ids:
+        raise HTTPException(status_code=400, detail="No anime ids given.")
+    if len(ids) > DETAILS_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {DETAILS_BATCH_MAX_IDS} anime ids per request.")
+
+    etag = anime_details.batch_etag(ids)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=300"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=anime_details.batch_payload(ids), media_type="application/json", headers=headers)
 
 @app.get("/get/anime/{anime_id}")
-async def get_anime_details(anime_id: int):
-    try:
-        anime_df = data_store["csv"]
-        
-        # Ensure 'anime_id' is the correct type for comparison
-        anime_df['anime_id'] = anime_df['anime_id'].astype(int)
-        
-        anime_data = anime_df[anime_df['anime_id'] == anime_id]
-        
-        if anime_data.empty:
-            raise HTTPException(status_code=404, detail="Anime not found")
-            
-        # Select specific details to return
-        anime_details = anime_data.iloc[0]
-        return {
-            "title": anime_details.get('title', 'Unknown'),
-            "image_url": anime_details.get('image_url', ''),
-            "mean": float(anime_details.get('mean', 0.0)),
-            "num_list_users": int(anime_details.get('num_list_users', 0))
-        }
-    except Exception as e:
-        print(f"Error fetching anime details: {e}")
+async def get_anime_details(request: Request, anime_id: int):
+    anime_details = current_generation().get("anime_details")
+    if anime_details is None:
         raise HTTPException(status_code=500, detail="An error occurred while fetching anime details.")
 
+    body = anime_details.get(anime_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Anime not found")
+
+    # Details only change with the catalog, so let clients revalidate against its version
+    etag = anime_details.etag(anime_id)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=300"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.get("/hello")
 def read_root():
     return {"message": "Hello from AniRec API"}
 
+# Request series for every route, declared before serve.py shares the metrics across workers
+declare_endpoints(route.path for route in app.routes)
+
 if __name__ == "__main__":
     uvicorn.run(
         app, 
@@ -0,0 +1,101 @@
+import asyncio
+import os
+from urllib.parse import quote
+
+import httpx
+from dotenv import load_dotenv
+
+from metrics import span
+
+load_dotenv()
+
+MAL_API_URL = os.getenv("MAL_API_URL", "https://api.myanimelist.net/v2")
+MAL_TIMEOUT_SECONDS = float(os.getenv("MAL_TIMEOUT_SECONDS", 10))
+MAL_MAX_CONNECTIONS = int(os.getenv("MAL_MAX_CONNECTIONS", 20))
+MAL_MAX_RETRIES = int(os.getenv("MAL_MAX_RETRIES", 3))
+
+# Statuses worth retrying: rate limiting and transient upstream failures
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# MAL answers these for unknown or private lists
+NOT_FOUND_STATUS_CODES = {403, 404}
+
+
+class MALError(Exception):
+    """MyAnimeList could not be reached or kept failing after retries."""
+
+
+class MALClient:
+    """
+    Async MyAnimeList API client sharing one pooled keep-alive connection set.
+
+    Created once in main.lifespan and used by every endpoint that needs a user's list, so a
+    slow MAL pagination only suspends its own request instead of blocking the event loop.
+    """
+
+    def __init__(self, client_id=None, base_url=MAL_API_URL, timeout=MAL_TIMEOUT_SECONDS,
+                 max_connections=MAL_MAX_CONNECTIONS, max_retries=MAL_MAX_RETRIES,
+                 backoff_seconds=0.5, transport=None):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._client = httpx.AsyncClient(
+            headers={"X-MAL-CLIENT-ID": client_id or os.getenv("MAL_CLIENT_ID") or ""},
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+
+    async def fetch_anime_list(self, username, fields="list_status"):
+        """
+        Fetch every entry of a user's anime list, following MAL's pagination.
+
+        Returns the raw list of {"node": ..., "list_status": ...} entries, or None if MAL says
+        the user does not exist or the list is private. Raises MALError for anything else.
+        """
+        url = (f"{self.base_url}/users/{quote(username, safe='')}/animelist"
+               f"?nsfw=true&limit=1000&fields={fields}")
+        # Every page, including retries and backoff
+        with span("mal.fetch_list"):
+            list_objects = []
+
+            while url:
+                response = await self._get(url)
+                if response.status_code in NOT_FOUND_STATUS_CODES:
+                    print(f"Error {response.status_code}: {response.text}")
+                    return None
+                if response.status_code != 200:
+                    raise MALError(f"MyAnimeList returned {response.status_code} for user '{username}'")
+
+                data = response.json()
+                page = data.get("data", [])
+                print(f"Fetched {len(page)} anime entries for user '{username}' from {url}")
+                list_objects.extend(page)
+                url = data.get("paging", {}).get("next", "")
+
+            return list_objects
+
+    async def _get(self, url):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._client.get(url)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise MALError(f"Could not reach MyAnimeList: {e}") from e
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                return response
+            await asyncio.sleep(self._backoff(attempt, response.headers.get("Retry-After")))
+        return response
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), 30.0)
+            except ValueError:
+                pass
+        return self.backoff_seconds * (2 ** attempt)
+
+    async def aclose(self):
+        await self._client.aclose()
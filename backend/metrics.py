@@ -0,0 +1,280 @@
+import array
+import contextvars
+import json
+import multiprocessing
+import os
+import threading
+import time
+from bisect import bisect_left
+
+import numpy as np
+
+# Print one JSON line per request with its stage timings
+REQUEST_LOG = os.getenv("REQUEST_LOG", "0") == "1"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Every timed stage; spans may only use these names
+STAGES = (
+    "mal.fetch_list",
+    "predict.batch_wait",
+    "predict.profile",
+    "predict.fold_in",
+    "predict.deepcopy",
+    "predict.fit_partial",
+    "predict.model_predict",
+    "predict.rank",
+    "predict.records",
+    "filtered.parse",
+    "filtered.filter",
+    "filtered.records",
+    "atlas.user_list",
+    "atlas.overlay",
+    "response.encode",
+)
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+# Requests that did not match a route
+OTHER_ENDPOINT = "other"
+
+
+class MetricsRegistry:
+    """
+    Fixed set of Prometheus series kept in one flat buffer of doubles per worker.
+
+    Series are declared up front (stages here, endpoints by main.py) so every process
+    agrees on the layout. Recording is a bisect and two float additions under a lock,
+    cheap enough for every span on the hot path. serve.py calls share() before forking,
+    which moves the buffer into anonymous shared memory with one row per worker slot:
+    each worker only writes its own row and /metrics on any worker renders the sum.
+    """
+
+    def __init__(self):
+        self.families = {}
+        self.size = 0
+        self.workers = 1
+        self.shared = False
+        self.row = 0
+        self.values = array.array('d')
+        self.lock = threading.Lock()
+
+    def _declare(self, name, kind, help_text, labels, width, bounds=None):
+        if self.shared:
+            raise RuntimeError(f"Metric {name} declared after the metrics buffer was shared")
+        family = self.families.setdefault(name, {"kind": kind, "help": help_text, "series": []})
+        series = Series(self, self.size, labels, bounds)
+        family["series"].append(series)
+        self.size += width
+        self.values.extend([0.0] * width)
+        return series
+
+    def histogram(self, name, help_text, labels, bounds):
+        # One slot per bucket plus +Inf, then the sum
+        return self._declare(name, "histogram", help_text, labels, len(bounds) + 2, bounds)
+
+    def counter(self, name, help_text, labels):
+        return self._declare(name, "counter", help_text, labels, 1)
+
+    def gauge(self, name, help_text, labels):
+        return self._declare(name, "gauge", help_text, labels, 1)
+
+    def share(self, workers):
+        """Back the series with shared memory, one row per worker; call before forking."""
+        self.workers = workers
+        self.shared = True
+        self.values = memoryview(multiprocessing.RawArray('d', workers * self.size)).cast('B').cast('d')
+
+    def attach(self, slot):
+        """Write to row slot from now on. A restarted worker keeps its counters but not its gauges."""
+        self.row = slot
+        for family in self.families.values():
+            if family["kind"] == "gauge":
+                for series in family["series"]:
+                    self.values[slot * self.size + series.offset] = 0.0
+
+    def totals(self):
+        return np.frombuffer(self.values, dtype=np.float64).reshape(self.workers, self.size).sum(axis=0)
+
+    def render(self):
+        """All series in the Prometheus text exposition format, summed over workers."""
+        totals = self.totals()
+        lines = []
+        for name, family in self.families.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            for series in family["series"]:
+                labels = series.labels
+                if family["kind"] != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(totals[series.offset])}")
+                    continue
+                counts = np.cumsum(totals[series.offset:series.offset + len(series.bounds) + 1])
+                for bound, count in zip(series.bounds, counts):
+                    lines.append(f"{name}_bucket{_labels(labels, le=_number(bound))} {_number(count)}")
+                lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {_number(counts[-1])}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(totals[series.offset + len(series.bounds) + 1])}")
+                lines.append(f"{name}_count{_labels(labels)} {_number(counts[-1])}")
+        return "\n".join(lines) + "\n"
+
+
+class Series:
+    def __init__(self, registry, offset, labels, bounds):
+        self.registry = registry
+        self.offset = offset
+        self.labels = labels
+        self.bounds = bounds
+
+    def observe(self, value):
+        registry = self.registry
+        base = registry.row * registry.size + self.offset
+        with registry.lock:
+            registry.values[base + bisect_left(self.bounds, value)] += 1
+            registry.values[base + len(self.bounds) + 1] += value
+
+    def inc(self, amount=1):
+        registry = self.registry
+        with registry.lock:
+            registry.values[registry.row * registry.size + self.offset] += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        registry = self.registry
+        registry.values[registry.row * registry.size + self.offset] = value
+
+
+def _labels(labels, **extra):
+    pairs = dict(labels, **extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs.items()) + "}"
+
+
+def _number(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = {
+    stage: registry.histogram("anirec_stage_seconds", "Time spent in each named stage of request handling.",
+                              {"stage": stage}, LATENCY_BUCKETS)
+    for stage in STAGES
+}
+REQUESTS_IN_FLIGHT = registry.gauge("anirec_requests_in_flight", "HTTP requests being handled.", {})
+MODEL_JOBS = {
+    state: registry.gauge("anirec_model_jobs", "Model executor jobs by state.", {"state": state})
+    for state in ("running", "queued")
+}
+_endpoints = {}
+
+# Stage timings of the request being handled, when REQUEST_LOG is on
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+def declare_endpoints(paths):
+    """Request latency, response size and status series for each route path."""
+    for path in list(paths) + [OTHER_ENDPOINT]:
+        if path in _endpoints:
+            continue
+        labels = {"endpoint": path}
+        _endpoints[path] = {
+            "seconds": registry.histogram("anirec_request_seconds", "HTTP request latency by endpoint.",
+                                          labels, LATENCY_BUCKETS),
+            "bytes": registry.histogram("anirec_response_bytes", "HTTP response body size by endpoint.",
+                                        labels, SIZE_BUCKETS),
+            "status": {
+                status_class: registry.counter("anirec_requests_total", "HTTP requests by endpoint and status.",
+                                               dict(labels, status=status_class))
+                for status_class in STATUS_CLASSES
+            },
+        }
+
+
+class span:
+    """
+    Time a named stage: `with span("predict.rank"):`. The duration goes into the stage's
+    histogram and, when REQUEST_LOG is on, into the current request's log line. Model
+    executor jobs inherit the request's context, so spans in them count for the request.
+    """
+
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS[self.stage].observe(elapsed)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((self.stage, elapsed))
+        return False
+
+
+def untraced():
+    """Stop attributing spans in the current context to a request (for shared batch work)."""
+    _trace.set(None)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-endpoint latency, response size and status class,
+    requests in flight, and with REQUEST_LOG the per-request span log line.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        token = _trace.set([] if REQUEST_LOG else None)
+        status = 500
+        size = 0
+
+        async def send_recording(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_recording)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            elapsed = time.perf_counter() - started
+            trace = _trace.get()
+            _trace.reset(token)
+
+            route = scope.get("route")
+            path = getattr(route, "path", None)
+            series = _endpoints.get(path) or _endpoints.get(OTHER_ENDPOINT)
+            if series is not None:
+                series["seconds"].observe(elapsed)
+                series["bytes"].observe(size)
+                status_series = series["status"].get(f"{status // 100}xx")
+                if status_series is not None:
+                    status_series.inc()
+
+            if trace is not None:
+                print(json.dumps({
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "endpoint": path or OTHER_ENDPOINT,
+                    "status": status,
+                    "ms": round(elapsed * 1000, 3),
+                    "bytes": size,
+                    "spans": [[stage, round(seconds * 1000, 3)] for stage, seconds in trace],
+                }))
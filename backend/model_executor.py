@@ -0,0 +1,107 @@
+import asyncio
+import contextvars
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from metrics import MODEL_JOBS
+
+MODEL_THREADS = int(os.getenv("MODEL_THREADS", 2))
+MODEL_QUEUE_SIZE = int(os.getenv("MODEL_QUEUE_SIZE", 16))
+MODEL_RETRY_AFTER_SECONDS = int(os.getenv("MODEL_RETRY_AFTER_SECONDS", 2))
+
+
+class ExecutorSaturated(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Model executor is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class ModelExecutor:
+    """
+    Runs CPU-heavy model work (fold-in, scoring, ranking) off the event loop.
+
+    At most `threads` jobs run at once and at most `max_queue` more wait for a thread.
+    Anything beyond that is refused immediately with ExecutorSaturated rather than queued,
+    so a burst of users gets fast 503s instead of stalling every request, and the event
+    loop stays free for /health and cached responses. NumPy releases the GIL for the
+    heavy array work, so threads overlap well without copying the model into processes;
+    serve.py adds processes on top of this.
+    """
+
+    def __init__(self, threads=MODEL_THREADS, max_queue=MODEL_QUEUE_SIZE, retry_after=MODEL_RETRY_AFTER_SECONDS):
+        self.threads = threads
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.completed = 0
+        self.rejected = 0
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="model")
+        # Only touched from the event loop thread, so no lock is needed
+        self._admitted = 0
+        self._running = 0
+        self._waits = deque(maxlen=1024)
+
+    @property
+    def saturated(self):
+        return self._admitted >= self.threads + self.max_queue
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool, or raise ExecutorSaturated if it is full."""
+        if self.saturated:
+            self.rejected += 1
+            raise ExecutorSaturated(self.retry_after)
+
+        loop = asyncio.get_running_loop()
+        submitted_at = time.monotonic()
+
+        def job():
+            loop.call_soon_threadsafe(self._started, time.monotonic() - submitted_at)
+            return fn(*args, **kwargs)
+
+        def release(done):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._finished, done)
+
+        self._admitted += 1
+        self._report()
+        # Spans inside the job count for the request that submitted it (see metrics.span)
+        future = self._pool.submit(contextvars.copy_context().run, job)
+        # Release the slot when the job itself ends, not when the caller stops waiting for it
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    def _started(self, waited):
+        self._running += 1
+        self._waits.append(waited)
+        self._report()
+
+    def _finished(self, future):
+        self._admitted -= 1
+        if not future.cancelled():
+            self._running -= 1
+            self.completed += 1
+        self._report()
+
+    def _report(self):
+        MODEL_JOBS["running"].set(self._running)
+        MODEL_JOBS["queued"].set(self._admitted - self._running)
+
+    def stats(self):
+        waits_ms = np.array(self._waits) * 1000 if self._waits else np.zeros(1)
+        return {
+            "threads": self.threads,
+            "max_queue": self.max_queue,
+            "running": self._running,
+            "queued": self._admitted - self._running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_ms_p50": round(float(np.percentile(waits_ms, 50)), 2),
+            "wait_ms_p95": round(float(np.percentile(waits_ms, 95)), 2),
+            "wait_ms_max": round(float(waits_ms.max()), 2),
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+
+# Neighbours kept per item, and how many watched titles explain each recommendation
+NEIGHBOURS_PER_ITEM = int(os.getenv("NEIGHBOURS_PER_ITEM", 100))
+EXPLANATIONS_PER_ITEM = int(os.getenv("EXPLANATIONS_PER_ITEM", 3))
+
+
+class NeighbourTable:
+    """
+    The top-M most similar items of every item by cosine similarity of item embeddings.
+
+    ids is num_items x M int32 and similarities the matching float16 values, each row sorted
+    most similar first, so the whole table costs num_items * M * 6 bytes. It is computed
+    offline with the model artifacts (see artifacts.py) and only read when serving.
+    """
+
+    def __init__(self, ids, similarities):
+        self.ids = ids
+        self.similarities = similarities
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes + self.similarities.nbytes
+
+    @classmethod
+    def build(cls, item_embeddings, neighbours=NEIGHBOURS_PER_ITEM, block_size=1024):
+        vectors = np.asarray(item_embeddings, dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        num_items = vectors.shape[0]
+        m = min(neighbours, num_items - 1)
+
+        ids = np.empty((num_items, max(m, 0)), dtype=np.int32)
+        similarities = np.empty((num_items, max(m, 0)), dtype=np.float16)
+        if m <= 0:
+            return cls(ids, similarities)
+        for start in range(0, num_items, block_size):
+            block = vectors[start:start + block_size] @ vectors.T
+            rows = np.arange(block.shape[0])
+            block[rows, start + rows] = -np.inf
+            top = np.argpartition(-block, m - 1, axis=1)[:, :m]
+            top_similarities = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_similarities, axis=1, kind='stable')
+            ids[start:start + block.shape[0]] = np.take_along_axis(top, order, axis=1)
+            similarities[start:start + block.shape[0]] = np.take_along_axis(top_similarities, order, axis=1)
+        return cls(ids, similarities)
+
+    def explain(self, item_ids, interactions, limit=EXPLANATIONS_PER_ITEM):
+        """
+        For each of item_ids, up to `limit` (watched internal id, similarity) pairs among its
+        neighbours that the user has interacted with, ordered by similarity times the user's
+        interaction weight. interactions is the user's 1 x num_items weighted CSR row, so
+        dropped titles (weight 0) never explain anything. Costs one sorted lookup per
+        neighbour, independent of list length beyond a log factor.
+        """
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        if item_ids.size == 0 or interactions.nnz == 0:
+            return [[] for _ in item_ids]
+
+        order = np.argsort(interactions.indices)
+        watched = interactions.indices[order]
+        weights = np.asarray(interactions.data, dtype=np.float32)[order]
+
+        rows = self.ids[item_ids]
+        positions = np.minimum(np.searchsorted(watched, rows), watched.size - 1)
+        hits = watched[positions] == rows
+        similarities = self.similarities[item_ids].astype(np.float32)
+        contributions = np.where(hits, similarities * weights[positions], 0.0)
+        best = np.argsort(-contributions, axis=1, kind='stable')[:, :limit]
+
+        return [
+            [(int(rows[r, j]), float(similarities[r, j])) for j in best[r] if contributions[r, j] > 0]
+            for r in range(item_ids.size)
+        ]
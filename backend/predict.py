@@ -1,190 +1,245 @@
-import pandas as pd
-from dotenv import load_dotenv
-import os
-import pickle
-import requests
 import numpy as np
 from scipy.sparse import csr_matrix
 import copy
 from collections import Counter
 
+from metrics import span
+from ranking import RankedScores
+
 # TODO: ADD SAFETY FOR UNSEEN FUTURE ANIME IDS AND BAD ANIME IDS
 
 # Anime ids that are in the model but not in the current dataset
 BAD_ANIME_IDS = [51563, 52401, 52257, 51210, 5742, 50898]
 
-load_dotenv()  
+# MAL list fields needed to build a new user's profile and statistics
+USER_LIST_FIELDS = "list_status,genres,start_season,media_type,main_picture"
 
-def get_user_anime_status(username):
+def get_user_anime_status(list_objects):
     """
-    Fetch user's anime list and return a dictionary mapping anime_id to status.
+    Map a user's MAL list entries to a dictionary of anime_id to status.
     Returns {anime_id: status} for all anime in user's list.
     """
-    CLIENT_ID = os.getenv("MAL_CLIENT_ID")
-    headers = {
-        "X-MAL-CLIENT-ID": CLIENT_ID
-    }
-
-    url = f"https://api.myanimelist.net/v2/users/{username}/animelist?nsfw=true&limit=1000&fields=list_status"
     anime_status = {}
+    for entry in list_objects:
+        # Include all anime with their status
+        anime_status[entry["node"]["id"]] = entry["list_status"]["status"]
+    return anime_status
 
-    # Fetch user's anime list
-    while url and url != "":
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            list_objects = data.get("data", [])
-            print(f"Fetched {len(list_objects)} anime entries for user '{username}' from {url}")
-            
-            for entry in list_objects:
-                anime = entry["node"]
-                list_status = entry["list_status"]
-                status = list_status["status"]
-                
-                # Include all anime with their status
-                anime_status[anime["id"]] = status
-            
-            url = data["paging"].get("next", "")
-        else:
-            print(f"Error {response.status_code}: {response.text}")
-            if response.status_code == 403 or response.status_code == 404:
-                return {}
-            else:
-                return {}
+def parse_user_anime_list(username, list_objects):
+    """
+    Flatten MAL list entries (fetched with USER_LIST_FIELDS) into the per-anime records
+    predict_scores works from.
+    """
+    new_user_data = []
+    for entry in list_objects:
+        anime = entry["node"]
+        list_status = entry["list_status"]
+        start_season = anime.get("start_season", {})
+        main_picture = anime.get("main_picture", {})
+
+        new_user_data.append({
+            "username": username,
+            "anime_id": anime["id"],
+            "title": anime["title"],
+            "status": list_status["status"],
+            "score": list_status["score"],
+            "genres": anime.get("genres", []),
+            "start_date": list_status.get("start_date"),
+            "finish_date": list_status.get("finish_date"),
+            "start_season_year": start_season.get("year"),
+            "start_season_season": start_season.get("season"),
+            "media_type": anime.get("media_type"),
+            "image_url": main_picture.get("large") or main_picture.get("medium")
+        })
+    return new_user_data
+
+def fetch_recs_from_filters(item_score_pairs_sorted, catalog, filters, page, page_size):
+    """
+    Filter a ranking sent back by the client and return one page, keeping the client's order.
+    """
+    with span("filtered.parse"):
+        pairs = np.asarray(item_score_pairs_sorted, dtype=np.float64).reshape(-1, 2)
+        item_ids = pairs[:, 0].astype(np.int64)
+        scores = pairs[:, 1]
 
-    return anime_status
+    with span("filtered.filter"):
+        in_catalog = (item_ids >= 0) & (item_ids < len(catalog))
+        passing = np.zeros(item_ids.size, dtype=bool)
+        passing[in_catalog] = catalog.filter_mask(filters)[item_ids[in_catalog]]
+        passing_positions = np.flatnonzero(passing)
 
-def fetch_recs_from_filters(item_score_pairs_sorted, df, dataset, filters, page, page_size):
-    # Get mapping from internal model ID to original anime ID
-    _, _, item_id_map, _ = dataset.mapping()
-    internal_to_original_anime_id = {v: k for k, v in item_id_map.items()}
+    total_filtered_count = int(passing_positions.size)
 
-    # Create a lookup dictionary for all anime data by anime_id
-    df['anime_id'] = df['anime_id'].astype(str)
-    anime_data_lookup = df.set_index('anime_id').to_dict('index')
+    # Paginate
+    start_index = (page - 1) * page_size
+    end_index = start_index + page_size
+    page_positions = passing_positions[start_index:end_index]
 
-    filtered_recommendations = []
+    with span("filtered.records"):
+        paginated_recs = [
+            catalog.record(int(item_ids[position]), float(scores[position]))
+            for position in page_positions
+        ]
 
-    for internal_id, score in item_score_pairs_sorted:
-        original_anime_id = internal_to_original_anime_id.get(internal_id)
-        if not original_anime_id:
-            print(f"Original anime ID not found for internal ID: {internal_id}")
-            continue
+    return paginated_recs, total_filtered_count
 
-        anime_data = anime_data_lookup.get(str(original_anime_id))
-        if not anime_data:
-            print(f"Anime data not found for original anime ID: {original_anime_id}")
-            continue
 
-        # --- Apply filters ---
-        # Genre filter
-        selected_genres = filters.get("genres", [])
-        if selected_genres:
-            anime_genres_str = anime_data.get('genres', '')
-            if pd.isna(anime_genres_str):
-                continue
-            anime_genres = {g.strip() for g in anime_genres_str.split(',')}
-            if not all(g in anime_genres for g in selected_genres):
-                continue
-        
-        # Media type filter
-        selected_media_types = filters.get("media_types", [])
-        if selected_media_types:
-            media_type = anime_data.get('media_type', '').lower()
-            if not media_type or media_type not in selected_media_types:
-                continue
-
-        # User count filter
-        min_users = filters.get("min_users", 0)
-        max_users = filters.get("max_users", 4200000)
-        num_list_users = anime_data.get('num_list_users', 0)
-        if not (min_users <= num_list_users <= max_users):
-            continue
+def filter_ranked_items(ranked, catalog, filters, page, page_size):
+    """
+    Apply the /predict/filtered filters to a server-side RankedScores and return one page.
 
-        # Relationship filter (sequel filter)
-        filter_sequels = filters.get("filter_sequels", False)
-        if filter_sequels:
-            relationship = anime_data.get('relationship', '')
-            if relationship != 's1':
-                continue
-
-        # If all filters pass, add to list
-        recommendation_item = {
-            "anime_id": original_anime_id,
-            "title": anime_data.get('title', 'Unknown'),
-            "score": score,
-            "num_list_users": num_list_users,
-            "mean": anime_data.get('mean', 0.0),
-            "genres": anime_data.get('genres', ''),
-            "synopsis": anime_data.get('synopsis', ''),
-            "image_url": anime_data.get('image_url', ''),
-            "media_type": anime_data.get('media_type', '')
-        }
-        filtered_recommendations.append(recommendation_item)
-
-    total_filtered_count = len(filtered_recommendations)
-    
-    # Paginate
+    Filters are evaluated once as a mask over the whole catalog, and only the items up to
+    the end of the requested page are ever sorted.
+    """
     start_index = (page - 1) * page_size
     end_index = start_index + page_size
-    paginated_recs = filtered_recommendations[start_index:end_index]
 
-    return paginated_recs, total_filtered_count
+    with span("filtered.filter"):
+        positions, total_filtered_count = ranked.top_where(catalog.filter_mask(filters), max(end_index, 0))
+    page_positions = positions[start_index:end_index] if start_index >= 0 else positions[0:0]
 
+    with span("filtered.records"):
+        paginated_recs = [
+            catalog.record(int(ranked.item_ids[position]), float(ranked.scores[position]))
+            for position in page_positions
+        ]
 
-def predict_scores(username, dataset, model, df):
-    
-    # Create a copy of the model to avoid affecting the original
-    model_copy = copy.deepcopy(model)
-    
-    _, user_feature_map, item_id_map, _ = dataset.mapping()
-    internal_to_original_anime_id = {v: k for k, v in item_id_map.items()}
+    return paginated_recs, int(total_filtered_count)
 
-    CLIENT_ID = os.getenv("MAL_CLIENT_ID")
-    headers = {
-                "X-MAL-CLIENT-ID": CLIENT_ID
-            }
 
-    url = f"https://api.myanimelist.net/v2/users/{username}/animelist?nsfw=true&limit=1000&fields=list_status,genres,start_season,media_type,main_picture"
+def build_new_user_matrices(new_user_genre_preferences, new_user_data, dataset):
+    """
+    Build the 1×num_user_features genre row and the 1×num_items weighted interaction row
+    for a user that is not part of the trained model.
+    """
+    _, user_feature_map, item_id_map, _ = dataset.mapping()
 
-    new_user_data = []
+    new_user_feature_indices = []
+    new_user_feature_data = []
 
-    # Fetch user's anime list
-    while url and url != "":
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            list_objects = data.get("data", [])
-            print(f"Fetched {len(list_objects)} anime entries for user '{username}' from {url}")
-            for entry in list_objects:
-                user_should_count = True
-                anime = entry["node"]
-                list_status = entry["list_status"]
-                start_season = anime.get("start_season", {})
-                main_picture = anime.get("main_picture", {})
-                
-                new_user_data.append({
-                    "username": username,
-                    "anime_id": anime["id"],
-                    "title": anime["title"],
-                    "status": list_status["status"],
-                    "score": list_status["score"],
-                    "genres": anime.get("genres", []),
-                    "start_date": list_status.get("start_date"),
-                    "finish_date": list_status.get("finish_date"),
-                    "start_season_year": start_season.get("year"),
-                    "start_season_season": start_season.get("season"),
-                    "media_type": anime.get("media_type"),
-                    "image_url": main_picture.get("large") or main_picture.get("medium")
-                })
-            url = data["paging"].get("next", "")
+    for genre, weight in new_user_genre_preferences.items():
+        if genre in user_feature_map:
+            feature_internal_id = user_feature_map[genre]
+            new_user_feature_indices.append(feature_internal_id)
+            new_user_feature_data.append(weight)
         else:
-            print(f"Error {response.status_code}: {response.text}")
-            if response.status_code == 403 or response.status_code == 404:
-                return [], [], {}, []
+            print(f"Warning: Genre '{genre}' not found in user features. Skipping this genre.")
+
+    num_total_user_features = dataset.user_features_shape()[1]
+    new_user_features_sparse = csr_matrix(
+        (new_user_feature_data, ([0] * len(new_user_feature_data), new_user_feature_indices)),
+        shape=(1, num_total_user_features)
+    )
+
+    new_user_interactions_rows = []
+    new_user_interactions_cols = []
+    new_user_interactions_data = []
+
+    # Basically all heuristic
+    for entry in new_user_data:
+        orig_anime_id = str(entry["anime_id"])
+        if orig_anime_id not in item_id_map:
+            print(f"Warning: Anime ID {entry['anime_id']} not found in item_id_map. Skipping this entry.")
+            continue
+        item_int_id = item_id_map[orig_anime_id]
+        status = entry["status"]
+        row_weight = 1.0
+        score = float(entry['score'])
+        if status == 'completed' or status == 'watching':
+            if score == 0:
+                row_weight = 0.5
+            elif score >= 8:
+                row_weight = score / 10.0
+            elif score == 7:
+                row_weight = 0.6
+            elif score == 6:
+                row_weight = 0.4
+            elif score == 5:
+                row_weight = 0.2
             else:
-                # For other API errors, we should still return empty but with a flag
-                return [], [], {}, []
+                row_weight = 0.1
+        elif status == 'plan_to_watch':
+            row_weight = 0.7
+        elif status == 'dropped':
+            row_weight = 0.0
+        elif status == 'on_hold':
+            row_weight = 0.2
+        new_user_interactions_rows.append(0)
+        new_user_interactions_cols.append(item_int_id)
+        new_user_interactions_data.append(row_weight)
+
+    # Create a 1×num_items CSR for the new user
+    num_items_in_dataset = dataset.interactions_shape()[1]
+    new_user_interactions = csr_matrix(
+        (new_user_interactions_data,
+        (new_user_interactions_rows, new_user_interactions_cols)),
+        shape=(1, num_items_in_dataset)
+    )
+
+    return new_user_features_sparse, new_user_interactions
+
+
+def fit_partial_scores(model, new_user_features_sparse, new_user_interactions):
+    """
+    Original scoring path: fit a deep copy of the whole model on the new user and predict.
+    Kept as the reference the fold-in engine is checked against.
+    """
+    # Create a copy of the model to avoid affecting the original
+    with span("predict.deepcopy"):
+        model_copy = copy.deepcopy(model)
+
+    # Train the model copy instead of the original model
+    with span("predict.fit_partial"):
+        model_copy.fit_partial(
+            interactions=new_user_interactions,
+            user_features=new_user_features_sparse,
+            item_features=None,
+            epochs=10
+        )
+
+    num_items_in_dataset = new_user_interactions.shape[1]
+    all_item_internal_ids = np.arange(num_items_in_dataset)
+    # Use the model copy for predictions
+    with span("predict.model_predict"):
+        scores = model_copy.predict(user_ids=0,
+                                item_ids=all_item_internal_ids,
+                                user_features=new_user_features_sparse,
+                                item_features=None)
+
+    # Clean up the model copy
+    del model_copy
+
+    return scores
+
+
+def rank_unseen_items(scores, excluded_internal_ids):
+    """
+    Min-max normalize the model scores and drop seen and bad items with a boolean mask.
+    Returns a RankedScores that sorts only as much of the ranking as is asked for.
+    """
+    min_s = np.min(scores)
+    max_s = np.max(scores)
+
+    # Check if all scores are the same to avoid division by zero
+    if max_s == min_s:
+        # If all scores are the same, set normalized scores to 0.5
+        normalized_model_scores = np.full(scores.shape, 0.5, dtype=np.float32)
+    else:
+        normalized_model_scores = (scores - min_s) / (max_s - min_s)
+
+    excluded = np.zeros(scores.size, dtype=bool)
+    excluded[np.asarray(excluded_internal_ids, dtype=np.int64)] = True
+    unseen_item_ids = np.flatnonzero(~excluded)
+
+    return RankedScores(unseen_item_ids, normalized_model_scores[unseen_item_ids])
+
+
+def build_user_profile(username, list_objects, dataset):
+    """
+    Everything /predict derives from a MAL list before scoring: the parsed entries, the
+    stats and details shown on the frontend, and the fold-in feature and interaction rows.
+    """
+    new_user_data = parse_user_anime_list(username, list_objects)
 
     new_user_genre_preferences = {}
     genre_counts = {}
@@ -280,150 +335,114 @@ def predict_scores(username, dataset, model, df):
     if total_anime_in_list > 0:
         user_stats["completion_rate"] = round((user_stats["completed_anime"] / total_anime_in_list) * 100, 1)
 
-    new_user_feature_indices = []
-    new_user_feature_data = []
-
-    for genre, weight in new_user_genre_preferences.items():
-        if genre in user_feature_map: 
-            feature_internal_id = user_feature_map[genre]
-            new_user_feature_indices.append(feature_internal_id)
-            new_user_feature_data.append(weight)
-        else:
-            print(f"Warning: Genre '{genre}' not found in user features.")
-            exit(1)
-
-    num_total_user_features = dataset.user_features_shape()[1]
-    new_user_features_sparse = csr_matrix(
-        (new_user_feature_data, ([0] * len(new_user_feature_data), new_user_feature_indices)),
-        shape=(1, num_total_user_features)
+    new_user_features_sparse, new_user_interactions = build_new_user_matrices(
+        new_user_genre_preferences, new_user_data, dataset
     )
 
-    new_user_interactions_rows = []
-    new_user_interactions_cols = []
-    new_user_interactions_data = []
+    return new_user_data, user_stats, user_anime_details, new_user_features_sparse, new_user_interactions
 
-    # Basically all heuristic
-    for entry in new_user_data:
-        orig_anime_id = str(entry["anime_id"])
-        if orig_anime_id not in item_id_map:
-            print(f"Warning: Anime ID {entry['anime_id']} not found in item_id_map. Skipping this entry.")
-            continue
-        item_int_id = item_id_map[orig_anime_id]
-        status = entry["status"]
-        row_weight = 1.0
-        score = float(entry['score'])
-        if status == 'completed' or status == 'watching':
-            if score == 0:
-                row_weight = 0.5
-            elif score >= 8:
-                row_weight = score / 10.0
-            elif score == 7:
-                row_weight = 0.6
-            elif score == 6:
-                row_weight = 0.4
-            elif score == 5:
-                row_weight = 0.2
-            else:
-                row_weight = 0.1
-        elif status == 'plan_to_watch':
-            row_weight = 0.7
-        elif status == 'dropped':
-            row_weight = 0.0
-        elif status == 'on_hold':
-            row_weight = 0.2
-        new_user_interactions_rows.append(0)           
-        new_user_interactions_cols.append(item_int_id)
-        new_user_interactions_data.append(row_weight)
 
-    # Create a 1×num_items CSR for the new user
-    num_items_in_dataset = dataset.interactions_shape()[1]
-    new_user_interactions = csr_matrix(
-        (new_user_interactions_data,
-        (new_user_interactions_rows, new_user_interactions_cols)),
-        shape=(1, num_items_in_dataset)
-    )
+def explain_recommendations(recommendations, item_ids, interactions, neighbours, catalog):
+    """Attach the watched titles most similar to each recommendation as because_you_watched."""
+    for record, explanations in zip(recommendations, neighbours.explain(item_ids, interactions)):
+        because_you_watched = []
+        for watched_id, similarity in explanations:
+            watched = catalog.record(watched_id, similarity)
+            because_you_watched.append({
+                "anime_id": watched["anime_id"],
+                "title": watched["title"],
+                "similarity": round(similarity, 3),
+            })
+        record["because_you_watched"] = because_you_watched
 
-    # Train the model copy instead of the original model
-    model_copy.fit_partial(
-        interactions=new_user_interactions,
-        user_features=new_user_features_sparse,
-        item_features=None,    
-        epochs=10               
-    )
 
-    num_items_in_dataset = dataset.interactions_shape()[1]
-    all_item_internal_ids = np.arange(num_items_in_dataset)
-    # Use the model copy for predictions
-    scores = model_copy.predict(user_ids=0,
-                            item_ids=all_item_internal_ids,
-                            user_features=new_user_features_sparse,
-                            item_features=None)
+def recommend_from_scores(scores, new_user_data, user_stats, user_anime_details, catalog,
+                          interactions=None, neighbours=None):
+    """
+    Rank a user's model scores and build the /predict result tuple. With a NeighbourTable
+    and the user's interaction row, each top recommendation also explains itself.
+    """
+    item_id_map = catalog.original_to_internal
 
     if scores.size > 0:
         top_n = 20
-        min_s = np.min(scores)
-        max_s = np.max(scores)
-        
-        # Check if all scores are the same to avoid division by zero
-        if max_s == min_s:
-            # If all scores are the same, set normalized scores to 0.5
-            normalized_model_scores = [0.5 for s in scores]
-        else:
-            normalized_model_scores = [(s - min_s) / (max_s - min_s) for s in scores]
-        
-        item_scores_pairs = list(zip(all_item_internal_ids, normalized_model_scores))
 
-        seen_and_bad_item_internal_ids = set()
+        excluded_item_internal_ids = []
 
         for bad_anime_id in BAD_ANIME_IDS:
-            seen_and_bad_item_internal_ids.add(item_id_map[str(bad_anime_id)])
+            if str(bad_anime_id) in item_id_map:
+                excluded_item_internal_ids.append(item_id_map[str(bad_anime_id)])
 
         for entry in new_user_data:
             original_id = str(entry.get("anime_id"))
             if original_id in item_id_map:
-                seen_and_bad_item_internal_ids.add(item_id_map[original_id])
-        
-        unseen_item_scores_pairs = [(int(item_id), float(score)) for item_id, score in item_scores_pairs if item_id not in seen_and_bad_item_internal_ids]
-
-        item_score_pairs_sorted = sorted(unseen_item_scores_pairs, key=lambda x: x[1], reverse=True)
-
-        df['anime_id'] = df['anime_id'].astype(str)
-        anime_data_lookup = df.set_index('anime_id').to_dict('index')
-
-        recommendations = []
-
-        for i, (item_internal_id, score) in enumerate(item_score_pairs_sorted[:top_n]):
-            original_anime_id = internal_to_original_anime_id.get(item_internal_id)
-            original_anime_id_str = str(original_anime_id)
-            
-            anime_data = anime_data_lookup.get(original_anime_id_str, {})
-            
-            title = anime_data.get('title', f"Unknown Anime (ID: {original_anime_id})")
-            num_list_users = anime_data.get('num_list_users', 0)
-            mean = anime_data.get('mean', 0.0)
-            genres = anime_data.get('genres', '')
-            synopsis = anime_data.get('synopsis', '')
-            image_url = anime_data.get('image_url', '')
-            media_type = anime_data.get('media_type', '')
-            
-            recommendations.append({
-                "anime_id": original_anime_id,
-                "title": title,
-                "score": score,
-                "num_list_users": num_list_users,
-                "mean": mean,
-                "genres": genres,
-                "synopsis": synopsis,
-                "image_url": image_url,
-                "media_type": media_type
-            })
-        
-        # Clean up the model copy
-        del model_copy
-        
-        # Have frontend remember the model scores for pagination
-        return recommendations, item_score_pairs_sorted, user_stats, user_anime_details
+                excluded_item_internal_ids.append(item_id_map[original_id])
+
+        with span("predict.rank"):
+            ranked = rank_unseen_items(scores, excluded_item_internal_ids)
+            top_item_ids, top_scores = ranked.top(top_n)
+
+        with span("predict.records"):
+            recommendations = [
+                catalog.record(int(item_internal_id), float(score))
+                for item_internal_id, score in zip(top_item_ids, top_scores)
+            ]
+            if neighbours is not None and interactions is not None:
+                explain_recommendations(recommendations, top_item_ids, interactions, neighbours, catalog)
+
+        # The rest of the ranking is kept server-side for pagination
+        return recommendations, ranked, user_stats, user_anime_details
     else:
-        del model_copy
         print("No recommendations could be generated for the new user.")
         return [], [], {}, []
+
+
+def predict_scores(username, list_objects, dataset, model, catalog, fold_in_engine=None, neighbours=None):
+    with span("predict.profile"):
+        new_user_data, user_stats, user_anime_details, new_user_features_sparse, new_user_interactions = build_user_profile(
+            username, list_objects, dataset
+        )
+
+    if fold_in_engine is not None:
+        with span("predict.fold_in"):
+            scores = fold_in_engine.predict(new_user_features_sparse, new_user_interactions)
+    else:
+        scores = fit_partial_scores(model, new_user_features_sparse, new_user_interactions)
+
+    return recommend_from_scores(
+        scores, new_user_data, user_stats, user_anime_details, catalog,
+        interactions=new_user_interactions, neighbours=neighbours
+    )
+
+
+def predict_scores_batch(users, dataset, model, catalog, fold_in_engine=None, neighbours=None):
+    """
+    predict_scores for a list of (username, list_objects) pairs, scored together.
+
+    Returns one entry per user: the predict_scores result, or the exception raised while
+    building or ranking that user, so one bad list does not fail the rest of the batch.
+    """
+    results = [None] * len(users)
+    profiles = []
+    with span("predict.profile"):
+        for position, (username, list_objects) in enumerate(users):
+            try:
+                profiles.append((position, build_user_profile(username, list_objects, dataset)))
+            except Exception as e:
+                results[position] = e
+
+    if fold_in_engine is not None:
+        with span("predict.fold_in"):
+            all_scores = fold_in_engine.predict_batch([(profile[3], profile[4]) for _, profile in profiles])
+    else:
+        all_scores = [fit_partial_scores(model, profile[3], profile[4]) for _, profile in profiles]
+
+    for (position, profile), scores in zip(profiles, all_scores):
+        try:
+            results[position] = recommend_from_scores(
+                scores, *profile[:3], catalog, interactions=profile[4], neighbours=neighbours
+            )
+        except Exception as e:
+            results[position] = e
+
+    return results
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+from pathlib import Path
+
+from scipy.sparse import load_npz, save_npz
+
+from ingest import PreprocessedData, preprocess
+
+# Bump when preprocessing produces different matrices from the same inputs
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+DATASET_NAME = "dataset.pkl"
+MATRIX_NAMES = ("interactions", "weights", "user_features")
+PREPROCESS_CACHE_DIR = os.getenv("PREPROCESS_CACHE_DIR", "preprocess_cache")
+# Most recently used preprocessing results kept on disk
+PREPROCESS_CACHE_KEEP = int(os.getenv("PREPROCESS_CACHE_KEEP", 4))
+# Source files whose contents decide the preprocessing output besides the inputs
+CODE_FILES = ("ingest.py",)
+
+
+def file_digest(path, block_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(input_paths, **params):
+    """
+    Key for preprocessing input_paths with params (filter thresholds and the like). It
+    hashes the contents of every input and of the preprocessing code, so an edited input,
+    a changed threshold or a changed weight heuristic all map to a new entry and stale
+    entries are never read. Returns (key, description); the description goes into the
+    entry's manifest.
+    """
+    code_dir = Path(__file__).resolve().parent
+    description = {
+        "format_version": FORMAT_VERSION,
+        "inputs": {str(path): file_digest(path) for path in input_paths},
+        "code": {name: file_digest(code_dir / name) for name in CODE_FILES},
+        "params": params,
+    }
+    key = hashlib.blake2b(json.dumps(description, sort_keys=True).encode(), digest_size=8).hexdigest()
+    return key, description
+
+
+def load_preprocessed(root, key):
+    """The PreprocessedData cached under root for key, or None on a miss or an unreadable entry."""
+    entry = Path(root) / key
+    manifest_path = entry / MANIFEST_NAME
+    if not manifest_path.is_file():
+        return None
+    try:
+        matrices = [load_npz(entry / f"{name}.npz") for name in MATRIX_NAMES]
+        with open(entry / DATASET_NAME, "rb") as f:
+            dataset = pickle.load(f)
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError) as e:
+        print(f"Ignoring unreadable preprocessing cache entry {entry}: {e}")
+        return None
+    # Most recently used entries survive pruning
+    os.utime(manifest_path)
+    return PreprocessedData(dataset, *matrices)
+
+
+def save_preprocessed(root, key, description, data, keep=4):
+    """
+    Write data under root/key. The entry is staged and renamed into place with its manifest
+    written last, so an interrupted run never leaves a readable partial entry. Only the keep
+    most recently used entries are kept.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    staging = root / f".staging-{os.getpid()}-{time.time_ns()}"
+    staging.mkdir()
+    try:
+        for name in MATRIX_NAMES:
+            save_npz(staging / f"{name}.npz", getattr(data, name), compressed=False)
+        with open(staging / DATASET_NAME, "wb") as f:
+            pickle.dump(data.dataset, f)
+        manifest = dict(description, key=key, created_at=time.strftime('%Y-%m-%dT%H:%M:%S%z'))
+        (staging / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+
+        entry = root / key
+        if entry.exists():
+            shutil.rmtree(entry)
+        os.replace(staging, entry)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    _prune(root, keep)
+    return entry
+
+
+def _prune(root, keep):
+    entries = [path for path in root.iterdir() if (path / MANIFEST_NAME).is_file()]
+    entries.sort(key=lambda path: (path / MANIFEST_NAME).stat().st_mtime, reverse=True)
+    for path in entries[keep:]:
+        print(f"Removing old preprocessing cache entry {path}")
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def load_or_preprocess(interactions_path, user_genres_path, min_user_interactions, min_item_interactions,
+                       root=PREPROCESS_CACHE_DIR, keep=PREPROCESS_CACHE_KEEP):
+    """
+    ingest.preprocess through the cache under root: reused while the input files,
+    thresholds and ingest code are unchanged, otherwise rebuilt and stored. With root None
+    the cache is bypassed.
+    """
+    if root is None:
+        return preprocess(interactions_path, user_genres_path, min_user_interactions, min_item_interactions)
+
+    key, description = cache_key(
+        [interactions_path, user_genres_path],
+        min_interactions_per_user=min_user_interactions,
+        min_interactions_per_item=min_item_interactions,
+    )
+    data = load_preprocessed(root, key)
+    if data is not None:
+        print(f"Loaded preprocessed data from {Path(root) / key}, skipping preprocessing.")
+        return data
+
+    data = preprocess(interactions_path, user_genres_path, min_user_interactions, min_item_interactions)
+    entry = save_preprocessed(root, key, description, data, keep=keep)
+    print(f"Saved preprocessed data to {entry}.")
+    return data
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+
+# "" scores on the float32 embeddings; "int8" or "float16" scores on a quantized copy
+SCORING_QUANTIZATION = os.getenv("SCORING_QUANTIZATION", "")
+# Best candidates per user whose quantized scores are replaced by exact float32 ones
+SCORING_RERANK = int(os.getenv("SCORING_RERANK", 200))
+QUANTIZATIONS = ("int8", "float16")
+
+
+class QuantizedItems:
+    """
+    Item embeddings stored as int8 with one float32 scale per row, or as float16.
+
+    NumPy has no BLAS kernels for either type, so dot() dequantizes block_size rows at a
+    time into a float32 buffer that stays in cache and multiplies that. Scoring then streams
+    1 (int8) or 2 (float16) bytes per value from memory instead of 4. int8 only beats the
+    float32 BLAS product for single users once the matrix is far larger than the CPU cache,
+    and NumPy's float16 conversion is slow enough that float16 only saves memory; see
+    benchmarks/bench_quantization.py.
+    """
+
+    def __init__(self, item_embeddings, dtype="int8", block_size=4096):
+        if dtype not in QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization {dtype!r}, expected one of {QUANTIZATIONS}")
+        item_embeddings = np.asarray(item_embeddings, dtype=np.float32)
+        self.dtype = dtype
+        self.block_size = block_size
+        self.num_items = item_embeddings.shape[0]
+
+        if dtype == "int8":
+            scales = np.abs(item_embeddings).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            self.values = np.round(item_embeddings / scales[:, None]).astype(np.int8)
+            self.scales = scales.astype(np.float32)
+        else:
+            self.values = item_embeddings.astype(np.float16)
+            self.scales = None
+
+        self.values.flags.writeable = False
+        if self.scales is not None:
+            self.scales.flags.writeable = False
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def dot(self, embeddings):
+        """
+        Approximate item_embeddings @ embeddings for one user embedding (returns num_items
+        scores) or a users x dim stack (returns users x num_items), as float32.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        out = np.empty(embeddings.shape[:-1] + (self.num_items,), dtype=np.float32)
+        buffer = np.empty((min(self.block_size, self.num_items), self.values.shape[1]), dtype=np.float32)
+        for start in range(0, self.num_items, self.block_size):
+            values = self.values[start:start + self.block_size]
+            block = buffer[:values.shape[0]]
+            np.copyto(block, values, casting='unsafe')
+            if embeddings.ndim == 1:
+                np.dot(block, embeddings, out=out[start:start + values.shape[0]])
+            else:
+                out[:, start:start + values.shape[0]] = embeddings @ block.T
+        if self.scales is not None:
+            out *= self.scales
+        return out
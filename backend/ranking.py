@@ -0,0 +1,78 @@
+import threading
+
+import numpy as np
+
+
+def top_k_order(scores, k):
+    """
+    Positions of the k highest scores, highest first.
+
+    Ties are broken by lower position, exactly like a stable descending sort, but only the
+    top k are ever sorted: argpartition finds the k-th best score and everything above it
+    (plus as many ties as fit) is selected before sorting.
+    """
+    n = scores.size
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores, kind='stable')
+
+    threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    above = np.flatnonzero(scores > threshold)
+    ties = np.flatnonzero(scores == threshold)[:k - above.size]
+    chosen = np.concatenate([above, ties])
+    return chosen[np.lexsort((chosen, -scores[chosen]))]
+
+
+class RankedScores:
+    """
+    Unseen items and their normalized scores for one user, ordered lazily.
+
+    item_ids are internal ids in ascending order and scores are float32. Only as much of the
+    ranking as has been asked for is ever sorted; the sorted prefix is kept and grown
+    geometrically when a client pages deeper. Sessions share one instance between
+    concurrent page requests on executor threads, so growing the prefix takes a lock.
+    """
+
+    def __init__(self, item_ids, scores):
+        self.item_ids = np.ascontiguousarray(item_ids, dtype=np.int32)
+        self.scores = np.ascontiguousarray(scores, dtype=np.float32)
+        self.item_ids.flags.writeable = False
+        self.scores.flags.writeable = False
+        self._order = np.empty(0, dtype=np.int64)
+        self._order_lock = threading.Lock()
+
+    def __len__(self):
+        return self.item_ids.size
+
+    @property
+    def nbytes(self):
+        # Include room for a fully sorted order, which is what a deep pager ends up with
+        return self.item_ids.nbytes + self.scores.nbytes + self.item_ids.size * np.dtype(np.int32).itemsize
+
+    def top(self, k):
+        """(item_ids, scores) of the k best items, best first."""
+        k = min(k, len(self))
+        order = self._order
+        if k > order.size:
+            with self._order_lock:
+                order = self._order
+                if k > order.size:
+                    grown = min(len(self), max(k, 2 * order.size))
+                    order = top_k_order(self.scores, grown).astype(np.int32 if len(self) < 2 ** 31 else np.int64)
+                    self._order = order
+        order = order[:k]
+        return self.item_ids[order], self.scores[order]
+
+    def top_where(self, mask, k):
+        """
+        (positions, total) for the k best items whose mask[item_id] is set, best first.
+        positions index into item_ids/scores; total counts every passing item.
+        """
+        passing = np.flatnonzero(mask[self.item_ids])
+        return passing[top_k_order(self.scores[passing], k)], passing.size
+
+    def pairs(self):
+        """The full ranking as [internal_id, score] pairs, for clients that page it themselves."""
+        item_ids, scores = self.top(len(self))
+        return [(int(i), float(s)) for i, s in zip(item_ids, scores)]
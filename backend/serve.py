@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import time
+import traceback
+
+import uvicorn
+
+import main
+from metrics import registry as metrics_registry
+
+WORKERS = int(os.getenv("WEB_WORKERS", os.cpu_count() or 1))
+
+
+def run_worker(slot, sock, attached):
+    """Serve the app on the inherited socket and mark the slot attached once accepting."""
+    metrics_registry.attach(slot)
+    config = uvicorn.Config(main.app, proxy_headers=True, forwarded_allow_ips='127.0.0.1')
+    server = uvicorn.Server(config)
+
+    async def serve():
+        serving = asyncio.create_task(server.serve(sockets=[sock]))
+        while not server.started and not serving.done():
+            await asyncio.sleep(0.05)
+        if server.started:
+            attached[slot] = 1
+            print(f"Worker {slot} (pid {os.getpid()}) attached.")
+        await serving
+
+    asyncio.run(serve())
+
+
+def spawn_worker(slot, sock, attached):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            # uvicorn installs its own handlers; drop the parent's supervisor ones
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # main.py's lifespan handles SIGHUP (reload) once the worker is up
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            run_worker(slot, sock, attached)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def serve(host, port, workers, ready_timeout=120.0):
+    """
+    Load the read-only data once, then fork workers that share it.
+
+    Model and catalog arrays are memory-mapped artifacts (or, with MODEL_FORMAT=pickle,
+    arrays loaded before the fork), so every worker reads the same physical pages; each
+    worker only builds its own MAL client, user-list cache and recommendation sessions.
+    Workers accept on one listening socket, and /ready stays 503 until all of them have
+    attached. Workers that die are restarted.
+
+    SIGHUP (sent by /admin/reload too) is forwarded to every worker, which reloads its data
+    in the background and swaps it in. The parent keeps its copy, so this loop never stalls
+    on a load (nor forks while a loading thread holds locks); workers restarted after a
+    reload start on the parent's data and reload it themselves right away. A reloaded
+    generation is private to each worker, except for memory-mapped artifacts, which stay
+    shared through the page cache; restart serve.py to share everything again.
+    """
+    main.load_data_store()
+
+    # An explicit IPPROTO_TCP, as asyncio only sets TCP_NODELAY on connections accepted from
+    # such sockets; without it small responses wait out the client's delayed ACK
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # One flag per worker slot in anonymous shared memory, inherited across fork
+    attached = multiprocessing.RawArray('b', workers)
+    main.data_store["workers"] = {"attached": attached, "expected": workers}
+    # Metrics too, one row per slot, so /metrics on any worker reports the whole pool
+    metrics_registry.share(workers)
+
+    children = {spawn_worker(slot, sock, attached): slot for slot in range(workers)}
+    print(f"Forked {workers} workers on http://{host}:{port}, waiting for them to attach...")
+
+    stopping = False
+    reload_requested = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    def request_reload(signum, frame):
+        nonlocal reload_requested
+        reload_requested = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, request_reload)
+
+    started_at = time.monotonic()
+    announced = False
+    while children:
+        if reload_requested and not stopping:
+            reload_requested = False
+            print(f"Reload requested; signalling {len(children)} workers.")
+            for pid in children:
+                os.kill(pid, signal.SIGHUP)
+            # Inherited by workers forked from now on (see main.lifespan)
+            main.data_store["reload_on_start"] = True
+
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if not announced and sum(attached) == workers:
+                announced = True
+                print(f"All {workers} workers attached in {time.monotonic() - started_at:.1f}s; ready.")
+            elif not announced and time.monotonic() - started_at > ready_timeout:
+                print(f"Only {sum(attached)} of {workers} workers attached after {ready_timeout:.0f}s.")
+                started_at = time.monotonic()
+            time.sleep(0.1)
+            continue
+
+        slot = children.pop(pid)
+        attached[slot] = 0
+        if not stopping:
+            print(f"Worker {slot} (pid {pid}) exited with status {status}; restarting.")
+            children[spawn_worker(slot, sock, attached)] = slot
+
+    sock.close()
+    print("All workers stopped.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the AniRec API from several worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
@@ -0,0 +1,83 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", 30 * 60))
+SESSION_CACHE_MAX_BYTES = int(float(os.getenv("SESSION_CACHE_MB", 256)) * 1024 * 1024)
+
+
+class RecommendationSessions:
+    """
+    Server-side store for the ranked score vector behind each /predict call.
+
+    /predict/filtered used to receive the whole ranked list back from the browser on every
+    filter change and page turn. Instead the ranking is kept here under a random token as a
+    RankedScores (int32 item ids, float32 scores). Entries expire ttl_seconds after they
+    were last used, and the least recently used ones are evicted once the arrays exceed
+    max_bytes in total. Because every access renews the TTL, LRU order is also expiry order.
+    Rankings hold internal item ids, so each session remembers the data generation it was
+    ranked on and is dropped when asked for under another one.
+    """
+
+    def __init__(self, ttl_seconds=SESSION_TTL_SECONDS, max_bytes=SESSION_CACHE_MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def create(self, ranked, generation=None):
+        """Store a user's RankedScores under a new random token and return the token."""
+        size = ranked.nbytes
+        token = secrets.token_urlsafe(16)
+
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            self._entries[token] = (time.monotonic() + self.ttl_seconds, ranked, generation)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._evict(next(iter(self._entries)))
+        return token
+
+    def get(self, token, generation=None):
+        """
+        Return the RankedScores for a live session, or None if it expired, was evicted or
+        was ranked on a generation other than the given one.
+        """
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires_at, ranked, ranked_generation = entry
+            now = time.monotonic()
+            if expires_at <= now or ranked_generation != generation:
+                self._evict(token)
+                return None
+            self._entries[token] = (now + self.ttl_seconds, ranked, ranked_generation)
+            self._entries.move_to_end(token)
+            return ranked
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self, token):
+        _, ranked, _ = self._entries.pop(token)
+        self._bytes -= ranked.nbytes
+
+    def _purge_expired(self, now):
+        while self._entries:
+            token, (expires_at, _, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._evict(token)
@@ -0,0 +1,127 @@
+import os
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from ranking import top_k_order
+
+# "exact" scores every item; "ivf" probes the closest clusters only, which pays off from
+# around 100k items (see benchmarks/bench_similarity.py)
+SIMILAR_MODE = os.getenv("SIMILAR_MODE", "exact")
+SIMILAR_NPROBE = int(os.getenv("SIMILAR_NPROBE", 8))
+# Number of IVF clusters; 0 picks about sqrt(num_items)
+SIMILAR_NLIST = int(os.getenv("SIMILAR_NLIST", 0))
+SIMILAR_MODES = ("exact", "ivf")
+
+
+class ItemSimilarityIndex:
+    """
+    Cosine nearest-neighbour index over the model's item embeddings.
+
+    The trained model has no item features, so an item's LightFM representation is its
+    row of item_embeddings. Rows are L2-normalized once, so "exact" mode is a single
+    matrix-vector product over every item. "ivf" mode clusters the rows with spherical
+    k-means into nlist inverted lists stored contiguously; a query only scores the items in
+    the nprobe lists whose centroids are closest to it. Larger nprobe trades latency for
+    recall, and nprobe == nlist is exact.
+    """
+
+    def __init__(self, item_embeddings, nlist=SIMILAR_NLIST, iterations=10, seed=0):
+        vectors = np.asarray(item_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = vectors / np.maximum(norms, 1e-12)
+        num_items = self.vectors.shape[0]
+
+        self.nlist = max(1, min(num_items, nlist or int(round(np.sqrt(num_items)))))
+        self.centroids, assignments = _spherical_kmeans(self.vectors, self.nlist, iterations, seed)
+
+        # Inverted lists as one array of item ids grouped by cluster, plus offsets into it
+        self.list_items = np.argsort(assignments, kind='stable').astype(np.int32)
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=self.nlist))])
+
+        for array in (self.vectors, self.centroids, self.list_items, self.list_offsets):
+            array.flags.writeable = False
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def search(self, internal_id, mask, k, mode=SIMILAR_MODE, nprobe=SIMILAR_NPROBE):
+        """
+        (item_ids, similarities) of the k items most similar to internal_id among those with
+        mask set, most similar first. The query item itself is never returned.
+
+        In ivf mode, lists are probed nearest first until at least nprobe lists have been
+        scored and at least k passing items found, so a narrow filter widens the search
+        instead of returning a short page.
+        """
+        query = self.vectors[internal_id]
+        if mode == "exact":
+            # Scoring every row is cheaper than gathering the passing rows first
+            candidates = np.flatnonzero(mask)
+            candidates = candidates[candidates != internal_id]
+            similarities = (self.vectors @ query)[candidates]
+        else:
+            list_order = np.argsort(-(self.centroids @ query), kind='stable')
+            passing = []
+            found = 0
+            for probed, cluster in enumerate(list_order, start=1):
+                members = self.list_items[self.list_offsets[cluster]:self.list_offsets[cluster + 1]]
+                members = members[mask[members]]
+                passing.append(members)
+                found += members.size
+                if probed >= nprobe and found > k:
+                    break
+            candidates = np.concatenate(passing) if passing else np.empty(0, dtype=np.int32)
+            candidates = candidates[candidates != internal_id]
+            similarities = self.vectors[candidates] @ query
+
+        order = top_k_order(similarities, k)
+        return candidates[order], similarities[order]
+
+
+def similar_items(index, catalog, internal_id, filters, page, page_size, mode=SIMILAR_MODE, nprobe=SIMILAR_NPROBE):
+    """
+    One page of items most similar to internal_id that pass the /predict/filtered filters,
+    in the same record shape, with the cosine similarity as the score.
+    """
+    start_index = (page - 1) * page_size
+    end_index = start_index + page_size
+
+    mask = catalog.filter_mask(filters)
+    total_filtered_count = int(mask.sum()) - int(mask[internal_id])
+    if start_index < 0:
+        return [], total_filtered_count
+
+    item_ids, similarities = index.search(internal_id, mask, end_index, mode=mode, nprobe=nprobe)
+    paginated_recs = [
+        catalog.record(int(item_id), float(similarity))
+        for item_id, similarity in zip(item_ids[start_index:end_index], similarities[start_index:end_index])
+    ]
+    return paginated_recs, total_filtered_count
+
+
+def _spherical_kmeans(vectors, nlist, iterations, seed, sample_per_list=256):
+    """Cluster unit vectors by cosine similarity; returns (unit centroids, assignment per vector)."""
+    rng = np.random.default_rng(seed)
+    num_items = vectors.shape[0]
+    # Centroids are fit on a sample; a few hundred points per list is plenty
+    sample_size = min(num_items, nlist * sample_per_list)
+    sample = vectors[rng.choice(num_items, size=sample_size, replace=False)] if sample_size < num_items else vectors
+    centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        members = csr_matrix(
+            (np.ones(sample.shape[0], dtype=np.float32), (assignments, np.arange(sample.shape[0]))),
+            shape=(nlist, sample.shape[0])
+        )
+        sums = np.asarray(members @ sample)
+        empty = np.linalg.norm(sums, axis=1) == 0
+        # Restart empty clusters on random points so every list stays in use
+        sums[empty] = sample[rng.choice(sample.shape[0], size=int(empty.sum()))]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+    assignments = np.empty(num_items, dtype=np.int64)
+    for start in range(0, num_items, 65536):
+        assignments[start:start + 65536] = np.argmax(vectors[start:start + 65536] @ centroids.T, axis=1)
+    return centroids.astype(np.float32), assignments
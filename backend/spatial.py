@@ -0,0 +1,150 @@
+import hashlib
+import json
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+# Points returned by one viewport query, by zoom level (the last entry covers deeper zooms)
+VIEWPORT_POINT_CAPS = [500, 1000, 2000, 4000, 8000]
+# Points per tile; tiles quarter in area with every zoom level, so detail grows with zoom
+POINTS_PER_TILE = 256
+MAX_TILE_ZOOM = 12
+TILE_CACHE_SIZE = 4096
+
+
+class AtlasGrid:
+    """
+    Uniform grid over the atlas x/y coordinates for bounding-box queries.
+
+    Points are ranked by num_list_users (rank 0 is the most popular) and each grid cell
+    keeps its ranks in ascending order. Cells of one grid row are stored contiguously, so a
+    bounding box costs one slice per overlapped row, and "most popular first" is simply
+    "smallest rank first".
+    """
+
+    def __init__(self, atlas_index, points_per_cell=64):
+        self.atlas_index = atlas_index
+        num_points = len(atlas_index)
+
+        self.order = np.argsort(-atlas_index.num_list_users, kind='stable')
+        self.xs = atlas_index.x[self.order]
+        self.ys = atlas_index.y[self.order]
+
+        if num_points:
+            self.bounds = (float(self.xs.min()), float(self.ys.min()), float(self.xs.max()), float(self.ys.max()))
+        else:
+            self.bounds = (0.0, 0.0, 1.0, 1.0)
+        self.side = max(1, math.ceil(math.sqrt(num_points / points_per_cell)))
+
+        cells = self._cell_y(self.ys) * self.side + self._cell_x(self.xs)
+        self.cell_ranks = np.argsort(cells, kind='stable')
+        self.cell_starts = np.searchsorted(cells[self.cell_ranks], np.arange(self.side * self.side + 1))
+
+        self.etag = atlas_index.etag
+        self._tile_cache = OrderedDict()
+
+    def _cell_x(self, xs):
+        min_x, _, max_x, _ = self.bounds
+        width = (max_x - min_x) or 1.0
+        return np.clip(((np.asarray(xs) - min_x) / width * self.side).astype(np.int64), 0, self.side - 1)
+
+    def _cell_y(self, ys):
+        _, min_y, _, max_y = self.bounds
+        height = (max_y - min_y) or 1.0
+        return np.clip(((np.asarray(ys) - min_y) / height * self.side).astype(np.int64), 0, self.side - 1)
+
+    def query(self, min_x, min_y, max_x, max_y, limit):
+        """
+        Points inside the box, most popular first, at most `limit` of them.
+        Returns (atlas point indices, whether more than `limit` points are in the box).
+        """
+        b_min_x, b_min_y, b_max_x, b_max_y = self.bounds
+        if min_x > max_x or min_y > max_y or max_x < b_min_x or min_x > b_max_x or max_y < b_min_y or min_y > b_max_y:
+            return np.empty(0, dtype=np.int64), False
+
+        # A box covering a large share of the map would pull most points out of the grid
+        # just to keep the top few; walking down the popularity ranking finds them sooner
+        overlap = ((min(max_x, b_max_x) - max(min_x, b_min_x))
+                   * (min(max_y, b_max_y) - max(min_y, b_min_y)))
+        area = (b_max_x - b_min_x) * (b_max_y - b_min_y)
+        share = overlap / area if area > 0 else 1.0
+        if share * share * len(self.order) > 4 * limit:
+            return self._query_by_rank(min_x, min_y, max_x, max_y, limit, share)
+
+        cx0, cx1 = self._cell_x([min_x, max_x])
+        cy0, cy1 = self._cell_y([min_y, max_y])
+        ranks = np.concatenate([
+            self.cell_ranks[self.cell_starts[cy * self.side + cx0]:self.cell_starts[cy * self.side + cx1 + 1]]
+            for cy in range(cy0, cy1 + 1)
+        ])
+
+        xs = self.xs[ranks]
+        ys = self.ys[ranks]
+        ranks = ranks[(xs >= min_x) & (xs <= max_x) & (ys >= min_y) & (ys <= max_y)]
+        truncated = ranks.size > limit
+
+        if truncated:
+            ranks = np.partition(ranks, limit - 1)[:limit]
+        ranks.sort()
+        return self.order[ranks], truncated
+
+    def _query_by_rank(self, min_x, min_y, max_x, max_y, limit, share):
+        # Expect about share * prefix hits; widen the prefix until limit + 1 are found
+        prefix = min(len(self.order), int(2 * (limit + 1) / share))
+        while True:
+            xs = self.xs[:prefix]
+            ys = self.ys[:prefix]
+            hits = np.flatnonzero((xs >= min_x) & (xs <= max_x) & (ys >= min_y) & (ys <= max_y))
+            if hits.size > limit or prefix == len(self.order):
+                return self.order[hits[:limit]], hits.size > limit
+            prefix = min(len(self.order), prefix * 4)
+
+    def viewport(self, min_x, min_y, max_x, max_y, zoom):
+        limit = VIEWPORT_POINT_CAPS[min(max(zoom, 0), len(VIEWPORT_POINT_CAPS) - 1)]
+        indices, truncated = self.query(min_x, min_y, max_x, max_y, limit)
+        return self.encode(indices, truncated)
+
+    def tile_bounds(self, zoom, tile_x, tile_y):
+        """Box covered by tile (tile_x, tile_y) of the 2^zoom x 2^zoom split of the atlas bounds."""
+        min_x, min_y, max_x, max_y = self.bounds
+        tiles = 2 ** zoom
+        width = (max_x - min_x) / tiles
+        height = (max_y - min_y) / tiles
+        return (min_x + tile_x * width, min_y + tile_y * height,
+                min_x + (tile_x + 1) * width, min_y + (tile_y + 1) * height)
+
+    def tile(self, zoom, tile_x, tile_y):
+        """
+        Encoded body and ETag for one tile. Tiles only change when the atlas data does, so
+        they are cached here and can be cached by clients and proxies.
+        """
+        key = (zoom, tile_x, tile_y)
+        cached = self._tile_cache.get(key)
+        if cached is not None:
+            self._tile_cache.move_to_end(key)
+            return cached
+
+        indices, truncated = self.query(*self.tile_bounds(zoom, tile_x, tile_y), POINTS_PER_TILE)
+        body = self.encode(indices, truncated)
+        etag = '"' + hashlib.blake2b(self.etag.encode() + repr(key).encode(), digest_size=16).hexdigest() + '"'
+
+        self._tile_cache[key] = (body, etag)
+        if len(self._tile_cache) > TILE_CACHE_SIZE:
+            self._tile_cache.popitem(last=False)
+        return body, etag
+
+    def encode(self, indices, truncated):
+        atlas = self.atlas_index
+        points = [
+            {
+                "anime_id": int(atlas.anime_ids[i]),
+                "x_coord": float(atlas.x[i]),
+                "y_coord": float(atlas.y[i]),
+                "num_list_users": int(atlas.num_list_users[i]),
+                "title": atlas.titles[i],
+            }
+            for i in indices
+        ]
+        content = {"atlas_data": points, "truncated": bool(truncated)}
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
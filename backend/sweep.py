@@ -0,0 +1,215 @@
+"""
+Hyperparameter sweep over LightFM settings.
+
+Run from the backend directory:
+    python sweep.py --components 16 30 64 --learning-rate 0.01 0.05 --loss warp bpr --epochs 10 20 30
+    python sweep.py ... --random 8 --workers 4 --threads-per-trial 2
+
+Every combination of the given values is a trial (or --random of them, sampled without
+replacement). The training data is preprocessed once, through the same cache as train.py,
+and shared read-only with a pool of --workers forked processes; each trial trains and
+evaluates with --threads-per-trial LightFM threads. Trials that differ only in epochs are
+trained once, evaluating after each requested epoch count, since fitting N epochs with
+fit_partial gives the same model as fit(epochs=N).
+
+Each trial's precision@k, recall@k, AUC and wall times are appended to --results as
+they finish, and the best warp trial by --metric is exported as a serving artifact. Other
+losses are only evaluated, since the server's fold-in can only serve warp models.
+"""
+import argparse
+import copy
+import csv
+import itertools
+import multiprocessing
+import os
+import random
+import time
+
+import pandas as pd
+from lightfm import LightFM
+from lightfm.evaluation import precision_at_k, recall_at_k, auc_score
+
+from artifacts import export_artifacts
+from ingest import train_test_split, held_out_pairs
+from preprocess_cache import load_or_preprocess, PREPROCESS_CACHE_DIR
+
+METRICS = ("precision_at_k", "recall_at_k", "auc")
+RESULT_COLUMNS = ("trial", "no_components", "learning_rate", "loss", "epochs", *METRICS,
+                  "fit_seconds", "eval_seconds", "threads")
+# FoldInEngine only folds in warp/adagrad models, so only these trials can be exported
+SERVABLE_LOSS = "warp"
+
+# Set in the parent before the pool forks, so workers share the matrices copy-on-write
+_shared = {}
+
+
+def trial_grid(args):
+    grid = [
+        {"no_components": components, "learning_rate": learning_rate, "loss": loss, "epochs": epochs}
+        for components, learning_rate, loss, epochs in itertools.product(
+            args.components, args.learning_rate, args.loss, args.epochs)
+    ]
+    if args.random and args.random < len(grid):
+        grid = random.Random(args.seed).sample(grid, args.random)
+    for trial, config in enumerate(grid):
+        config["trial"] = trial
+    return grid
+
+
+def group_by_model(trials):
+    """Trials that share everything but epochs, each group sorted by epochs."""
+    groups = {}
+    for config in trials:
+        groups.setdefault((config["no_components"], config["learning_rate"], config["loss"]), []).append(config)
+    return [sorted(group, key=lambda config: config["epochs"]) for group in groups.values()]
+
+
+def evaluate(model, k, threads):
+    train_interactions = _shared["train_interactions"]
+    test_interactions = _shared["test_interactions"]
+    user_features = _shared["user_features"]
+    return {
+        "precision_at_k": float(precision_at_k(model, test_interactions, train_interactions=train_interactions,
+                                               user_features=user_features, k=k, num_threads=threads).mean()),
+        "recall_at_k": float(recall_at_k(model, test_interactions, train_interactions=train_interactions,
+                                         user_features=user_features, k=k, num_threads=threads).mean()),
+        "auc": float(auc_score(model, test_interactions, train_interactions=train_interactions,
+                               user_features=user_features, num_threads=threads).mean()),
+    }
+
+
+def run_group(group):
+    """
+    Train one model configuration up to the largest epoch count in group, evaluating at
+    each. Returns the result rows and a copy of the model of the group's best row, or None
+    for a loss the server cannot serve.
+    """
+    threads = _shared["threads"]
+    metric = _shared["metric"]
+    first = group[0]
+    model = LightFM(no_components=first["no_components"],
+                    learning_rate=first["learning_rate"],
+                    loss=first["loss"],
+                    random_state=42) # Same seed as train.py, so the best trial can be reproduced there
+
+    rows = []
+    best_model = None
+    fit_seconds = 0.0
+    trained_epochs = 0
+    for config in group:
+        started = time.perf_counter()
+        model.fit_partial(_shared["train_interactions"],
+                          user_features=_shared["user_features"],
+                          sample_weight=_shared["train_weights"],
+                          epochs=config["epochs"] - trained_epochs,
+                          num_threads=threads)
+        fit_seconds += time.perf_counter() - started
+        trained_epochs = config["epochs"]
+
+        started = time.perf_counter()
+        metrics = evaluate(model, _shared["k"], threads)
+        row = dict(config, **metrics, fit_seconds=round(fit_seconds, 3),
+                   eval_seconds=round(time.perf_counter() - started, 3), threads=threads)
+        if first["loss"] == SERVABLE_LOSS and (best_model is None or row[metric] > max(r[metric] for r in rows)):
+            best_model = copy.deepcopy(model)
+        rows.append(row)
+    return rows, best_model
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--interactions", default="user_anime_data_v2_5282.csv")
+    parser.add_argument("--user-genres", default="user_genre_data_nsfw.txt")
+    parser.add_argument("--min-user-interactions", type=int, default=5)
+    parser.add_argument("--min-item-interactions", type=int, default=3)
+    parser.add_argument("--test-fraction", type=float, default=0.1)
+    parser.add_argument("--no-cache", action="store_true", help="Preprocess without the preprocessing cache")
+
+    parser.add_argument("--components", type=int, nargs="+", default=[30])
+    parser.add_argument("--learning-rate", type=float, nargs="+", default=[0.05])
+    # No warp-kos: LightFM cannot fit it with the sample weights every trial trains on
+    parser.add_argument("--loss", nargs="+", default=["warp"], choices=["warp", "bpr", "logistic"])
+    parser.add_argument("--epochs", type=int, nargs="+", default=[10])
+    parser.add_argument("--random", type=int, default=0, help="Sample this many trials instead of the full grid")
+    parser.add_argument("--seed", type=int, default=0)
+
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads-per-trial", type=int, default=0,
+                        help="LightFM threads per trial (default: CPUs divided among workers)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--metric", default="precision_at_k", choices=METRICS)
+    parser.add_argument("--results", default="sweep_results.csv")
+    parser.add_argument("--artifacts", default="artifacts")
+    parser.add_argument("--anime-csv", default="anime_data_master.csv")
+    parser.add_argument("--no-export", action="store_true")
+    args = parser.parse_args()
+
+    trials = trial_grid(args)
+    groups = group_by_model(trials)
+    workers = max(1, min(args.workers, len(groups)))
+    threads = args.threads_per_trial or max(1, (os.cpu_count() or 1) // workers)
+
+    data = load_or_preprocess(args.interactions, args.user_genres,
+                              args.min_user_interactions, args.min_item_interactions,
+                              root=None if args.no_cache else PREPROCESS_CACHE_DIR)
+    train_interactions, test_interactions, train_weights = train_test_split(data, args.test_fraction)
+    _shared.update(
+        # COO, as sample weights must line up entry for entry with the interactions
+        train_interactions=train_interactions,
+        test_interactions=held_out_pairs(test_interactions, train_interactions),
+        train_weights=train_weights,
+        user_features=data.user_features.tocsr(),
+        threads=threads,
+        metric=args.metric,
+        k=args.k,
+    )
+
+    print(f"Running {len(trials)} trials ({len(groups)} models) on {workers} workers x {threads} threads, "
+          f"results in {args.results}")
+    best_row = None
+    best_servable_row, best_model = None, None
+    started = time.perf_counter()
+    with open(args.results, "w", newline="") as results_file:
+        writer = csv.DictWriter(results_file, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            for rows, model in pool.imap_unordered(run_group, groups):
+                for row in rows:
+                    writer.writerow(row)
+                    print(f"trial {row['trial']:>3}: components={row['no_components']} "
+                          f"learning_rate={row['learning_rate']} loss={row['loss']} epochs={row['epochs']}  "
+                          f"precision@{args.k}={row['precision_at_k']:.4f} recall@{args.k}={row['recall_at_k']:.4f} "
+                          f"auc={row['auc']:.4f}  fit {row['fit_seconds']:.1f}s eval {row['eval_seconds']:.1f}s")
+                results_file.flush()
+                group_best = max(rows, key=lambda row: row[args.metric])
+                if best_row is None or group_best[args.metric] > best_row[args.metric]:
+                    best_row = group_best
+                if model is not None and (best_servable_row is None
+                                          or group_best[args.metric] > best_servable_row[args.metric]):
+                    best_servable_row, best_model = group_best, model
+    print(f"Sweep finished in {time.perf_counter() - started:.1f}s")
+
+    results = pd.read_csv(args.results).sort_values(args.metric, ascending=False)
+    print(results.head(10).to_string(index=False))
+    print(f"\nBest trial by {args.metric}: {best_row['trial']} ({best_row[args.metric]:.4f})")
+
+    if args.no_export:
+        return
+    if best_model is None:
+        print(f"Skipping artifact export: no trial used loss={SERVABLE_LOSS}, the only loss the server can fold in.")
+        return
+    if best_servable_row is not best_row:
+        print(f"Not exporting trial {best_row['trial']}: loss={best_row['loss']} cannot be served (fold-in needs "
+              f"loss={SERVABLE_LOSS}). Exporting the best {SERVABLE_LOSS} trial, {best_servable_row['trial']} "
+              f"({best_servable_row[args.metric]:.4f}), instead.")
+    try:
+        anime_df = pd.read_csv(args.anime_csv, na_values=[], keep_default_na=False)
+    except FileNotFoundError:
+        print(f"Skipping artifact export: {args.anime_csv} not found.")
+        return
+    version_dir = export_artifacts(best_model, data.dataset, anime_df, args.artifacts)
+    print(f"Best model artifacts saved to {version_dir}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,9 @@ from lightfm.evaluation import precision_at_k, recall_at_k, auc_score
 from lightfm.cross_validation import random_train_test_split
 import numpy as np
 from scipy.sparse import csr_matrix
+from artifacts import export_artifacts
+from ingest import train_test_split
+from preprocess_cache import load_or_preprocess, PREPROCESS_CACHE_DIR
 
 # --- 1. Configuration & Load Data ---
 CSV_FILE_PATH = 'user_anime_data_v2_5282.csv'
@@ -19,146 +22,32 @@ LOSS_FUNCTION = 'warp'
 N_EPOCHS = 10
 N_THREADS = 1                     
 
-print(f"Loading user anime data from {CSV_FILE_PATH}...")
-try:
-    df = pd.read_csv(CSV_FILE_PATH)
-except FileNotFoundError:
-    print(f"ERROR: File not found at {CSV_FILE_PATH}")
-    exit(1)
-
-print(f"Initial data shape: {df.shape}")
-print(f"Uniue users: {df['username'].nunique()}, Unique anime: {df['anime_id'].nunique()}")
-print(df.head())
-
-print(f"Loading user anime genre data from {USER_GENRE_FILE_PATH}...")
-all_genre_names = set()
-parsed_user_features_input = []
-
-with open(USER_GENRE_FILE_PATH, "r") as infile:
-    user_genres = []
-    for line in infile:
-        parts = line.strip().split(",")
-        username = parts[0]
-        genres = []
-        user_specific_genres = {}
-        for unparsed_genres in parts[1:]:
-            genre_data = unparsed_genres.strip().split("=")
-            if len(genre_data) != 2:
-                print(f"Skipping invalid genre data for user {username}: {genre_data}")
-                exit(1)
-            genre_name, genre_weight = tuple(genre_data)
-            user_specific_genres[genre_name.strip()] = float(genre_weight)
-            all_genre_names.add(genre_name.strip())
-        parsed_user_features_input.append((username, user_specific_genres))
-
-print(f"Loaded {len(parsed_user_features_input)} user genre entries from {USER_GENRE_FILE_PATH}.")
-
-print(f"Found {len(all_genre_names)} unique genre names in feature file.")
-for genre_name in sorted(all_genre_names):
-    print(f" - {genre_name}")
-print("\n")
+USE_PREPROCESS_CACHE = True
 
 # --- 2. Data Preprocessing ---
-df['anime_id'] = df['anime_id'].astype(str)
-df['username'] = df['username'].astype(str)
-
-while True:
-    user_counts = df['username'].value_counts()
-    item_counts = df['anime_id'].value_counts()
-    
-    initial_rows = len(df)
-    
-    df = df[df['username'].isin(user_counts[user_counts >= MIN_INTERACTIONS_PER_USER].index)]
-    if len(df) == 0:
-        print("ERROR: No users left after filtering by MIN_INTERACTIONS_PER_USER. Try lowering the threshold.")
-        exit()
-        
-    df = df[df['anime_id'].isin(item_counts[item_counts >= MIN_INTERACTIONS_PER_ITEM].index)]
-    if len(df) == 0:
-        print("ERROR: No items left after filtering by MIN_INTERACTIONS_PER_ITEM. Try lowering the threshold.")
-        exit()
-
-    if len(df) == initial_rows: 
-        break
-    else:
-        print(f"Filtered data shape: {df.shape}")
-
-if df.empty:
-    print("ERROR: DataFrame is empty after filtering. Check your MIN_INTERACTIONS thresholds or data.")
-    exit()
-
-print(f"Final data shape after filtering: {df.shape}")
-print(f"Number of unique users: {df['username'].nunique()}")
-print(f"Number of unique anime: {df['anime_id'].nunique()}")
-
-print("\nFiltering user features for users present in interaction data...")
-active_users = set(df['username'].unique())
-filtered_user_features_input = []
-final_all_genre_names = set()
-
-for username, features in parsed_user_features_input:
-    if username in active_users:
-        filtered_user_features_input.append((username, features))
-        for genre_name in features.keys():
-            final_all_genre_names.add(genre_name)
-
-parsed_user_features_input = filtered_user_features_input
-all_genre_names = final_all_genre_names # Update with genres from active users only
-
-print(f"Number of users with features after filtering: {len(parsed_user_features_input)}")
-print(f"Number of unique genres from active users: {len(all_genre_names)}")
+# Filtered matrices and mappings are reused while the input files and thresholds are unchanged
+# (see preprocess_cache.py; PREPROCESS_CACHE_DIR sets where)
+try:
+    data = load_or_preprocess(CSV_FILE_PATH, USER_GENRE_FILE_PATH,
+                              MIN_INTERACTIONS_PER_USER, MIN_INTERACTIONS_PER_ITEM,
+                              root=PREPROCESS_CACHE_DIR if USE_PREPROCESS_CACHE else None)
+except FileNotFoundError as e:
+    print(f"ERROR: File not found at {e.filename}")
+    exit(1)
+except ValueError as e:
+    print(f"ERROR: {e}")
+    exit(1)
 
 # --- 3. Prepare Data for LightFM using Dataset ---
-dataset = Dataset()
-
-dataset.fit(users=df['username'].unique(),
-            items=df['anime_id'].unique(),
-            user_features=list(all_genre_names))
-
-interactions_data = []
-for index, row in df.iterrows():
-    row_weight = 1.0
-    score = float(row['score'])
-    if row['status'] == 'Completed' or row['status'] == 'Watching':
-        if score == 0:
-            row_weight = 0.5
-        elif score >= 8:
-            row_weight = score / 10.0
-        elif score == 7:
-            row_weight = 0.6
-        elif score == 6:
-            row_weight = 0.4
-        elif score == 5:
-            row_weight = 0.2
-        else:
-            row_weight = 0.1
-    elif row['status'] == 'Plan to Watch':
-        row_weight = 0.7
-    elif row['status'] == 'Dropped':
-        row_weight = 0.0
-    elif row['status'] == 'On-Hold':
-        row_weight = 0.2
-    interactions_data.append((row['username'], row['anime_id'], row_weight)) 
-
-(interactions, weights) = dataset.build_interactions(interactions_data)
+dataset = data.dataset
+interactions = data.interactions
+user_features_matrix = data.user_features
 
 print("Interactions matrix shape:", interactions.shape)
-
-user_features_matrix = dataset.build_user_features(parsed_user_features_input, normalize=False)
 print("User features matrix shape:", user_features_matrix.shape)
 
 # --- 4. Split into Training and Test Sets ---
-(train_interactions, test_interactions) = random_train_test_split(
-    interactions,
-    test_percentage=TEST_SET_FRACTION,
-    random_state=np.random.RandomState(42) # for reproducibility
-)
-
-(train_weights, test_weights) = random_train_test_split(
-    weights,
-    test_percentage=TEST_SET_FRACTION,
-    random_state=np.random.RandomState(42)
-)
+(train_interactions, test_interactions, train_weights) = train_test_split(data, TEST_SET_FRACTION)
 
 print("Train interactions shape:", train_interactions.shape)
 if test_interactions is not None:
@@ -193,7 +82,19 @@ with open(DATASET_SAVE_PATH, 'wb') as dataset_file:
     pickle.dump(dataset, dataset_file)
 print("Dataset saved successfully.")
 
+# Memory-mappable copy of the model, id maps and catalog that the server loads by default
+ANIME_CSV_FILE_PATH = 'anime_data_master.csv'
+ARTIFACTS_DIR = 'artifacts'
+try:
+    anime_df = pd.read_csv(ANIME_CSV_FILE_PATH, na_values=[], keep_default_na=False)
+    print(f"\nExporting model artifacts to {ARTIFACTS_DIR}...")
+    version_dir = export_artifacts(model, dataset, anime_df, ARTIFACTS_DIR)
+    print(f"Model artifacts saved to {version_dir}.")
+except FileNotFoundError:
+    print(f"Skipping artifact export: {ANIME_CSV_FILE_PATH} not found. Run artifacts.py once it is available.")
+
 # --- 6. Evaluate the Model ---
+# evaluate.py measures the exported artifacts on this split, including the serving path
 # if test_interactions is not None and test_interactions.nnz > 0:
 #     print("\nEvaluating model...")
 #     K_EVAL = 10 # K for top-K recommendations
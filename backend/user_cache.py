@@ -0,0 +1,88 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from predict import USER_LIST_FIELDS
+
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 10 * 60))
+USER_CACHE_MAX_USERS = int(os.getenv("USER_CACHE_MAX_USERS", 2000))
+
+
+def normalize_username(username):
+    """MAL usernames are case-insensitive, so cache them under one spelling."""
+    return username.strip().lower()
+
+
+class UserListCache:
+    """
+    Shared cache of parsed MAL lists, keyed by normalized username.
+
+    Both /predict and /atlas?username= need the same list, so it is fetched once with
+    USER_LIST_FIELDS (a superset of what /atlas needs) and kept for ttl_seconds, with the
+    least recently used users evicted past max_users. Concurrent misses for the same user
+    share one in-flight fetch instead of each paginating MAL separately. "User not found"
+    (None) is cached too; MAL errors are not.
+    """
+
+    def __init__(self, mal_client, ttl_seconds=USER_CACHE_TTL_SECONDS, max_users=USER_CACHE_MAX_USERS):
+        self.mal_client = mal_client
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._in_flight = {}
+
+    async def get(self, username, store=True):
+        """
+        Return the user's list entries, or None if MAL has no such (public) list. With
+        store=False a miss is fetched but not cached, so bulk jobs do not evict live users.
+        """
+        key = normalize_username(username)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, list_objects = entry
+            if expires_at > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return list_objects
+            del self._entries[key]
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(in_flight)
+
+        self.misses += 1
+        fetch = asyncio.ensure_future(self.mal_client.fetch_anime_list(username, fields=USER_LIST_FIELDS))
+        self._in_flight[key] = fetch
+        try:
+            list_objects = await asyncio.shield(fetch)
+        finally:
+            self._in_flight.pop(key, None)
+
+        if not store:
+            return list_objects
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, list_objects)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+        return list_objects
+
+    def invalidate(self, username):
+        self._entries.pop(normalize_username(username), None)
+
+    def stats(self):
+        return {
+            "users": len(self._entries),
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+    def clear(self):
+        self._entries.clear()
@@ -15,7 +15,8 @@ const AnimeCard = ({ anime }) => {
     genres,
     synopsis,
     image_url,
-    media_type
+    media_type,
+    because_you_watched
   } = anime;
 
   // Reset expansion state when synopsis changes
@@ -113,6 +114,26 @@ const AnimeCard = ({ anime }) => {
             </div>
           )}
 
+          {/* Watched titles this recommendation is most similar to */}
+          {because_you_watched && because_you_watched.length > 0 && (
+            <div className="mb-3 text-sm text-gray-400">
+              <span className="font-medium text-gray-300">Because you watched: </span>
+              {because_you_watched.map((watched, index) => (
+                <span key={watched.anime_id}>
+                  {index > 0 && ', '}
+                  <a
+                    className="hover:text-white underline"
+                    href={`https://myanimelist.net/anime/${watched.anime_id}`}
+                    target="_blank"
+                    rel="noopener noreferrer"
+                  >
+                    {watched.title}
+                  </a>
+                </span>
+              ))}
+            </div>
+          )}
+
           {/* Synopsis */}
           {synopsis && (
             <div className="flex-1 relative">
@@ -38,6 +38,16 @@ export default function AtlasMapPage({ username }) {
       const response = await fetch(url);
       if (!response.ok) throw new Error('Failed to fetch atlas data');
       const data = await response.json();
+      // The user's statuses come as parallel arrays; join them onto the points here
+      const overlay = data.user_overlay;
+      if (overlay) {
+        const statusById = new Map(
+          overlay.anime_ids.map((id, i) => [id, overlay.status_names[overlay.statuses[i]]])
+        );
+        data.atlas_data.forEach(d => {
+          d.user_status = statusById.get(d.anime_id) ?? null;
+        });
+      }
       setAtlasData(data.atlas_data);
     } catch (err) {
       setError(err.message);
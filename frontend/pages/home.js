@@ -23,8 +23,9 @@ export default function HomePage() {
   const [userStats, setUserStats] = useState(null);
   const [userAnimeDetails, setUserAnimeDetails] = useState([]);
 
-  // Ref for all recommendation IDs
-  const itemScorePairsSortedRef = useRef([]);
+  // Token for the ranked recommendations kept on the server, and the user they belong to
+  const sessionTokenRef = useRef(null);
+  const sessionUsernameRef = useRef(null);
 
   const router = useRouter();
 
@@ -62,7 +63,7 @@ export default function HomePage() {
     setError('');
     setRecommendations(null);
     setUserStats(null);
-    itemScorePairsSortedRef.current = [];
+    sessionTokenRef.current = null;
     setCurrentPage(1);
 
     // Clear all filters when getting new recommendations
@@ -94,8 +95,9 @@ export default function HomePage() {
       setRecommendations(data.recommendations);
       setUserStats(data.user_stats);
       setUserAnimeDetails(data.user_anime_details || []);
-      itemScorePairsSortedRef.current = data.item_score_pairs_sorted;
-      setTotalFilteredCount(data.item_score_pairs_sorted.length);
+      sessionTokenRef.current = data.session_token;
+      sessionUsernameRef.current = finalUsername;
+      setTotalFilteredCount(data.total_count);
     } catch (err) {
       setError(err.message);
     } finally {
@@ -104,7 +106,7 @@ export default function HomePage() {
   };
 
   const handleApplyFilters = async () => {
-    if (itemScorePairsSortedRef.current.length === 0) return;
+    if (!sessionTokenRef.current) return;
 
     setIsFiltering(true);
     setCurrentPage(1);
@@ -115,7 +117,8 @@ export default function HomePage() {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
-          item_score_pairs_sorted: itemScorePairsSortedRef.current,
+          session_token: sessionTokenRef.current,
+          username: sessionUsernameRef.current,
           selected_genres: selectedGenres,
           selected_media_types: selectedMediaTypes,
           min_users: minUsers,
@@ -131,6 +134,8 @@ export default function HomePage() {
       }
 
       const data = await response.json();
+      // The server rebuilt an expired session under a new token
+      if (data.session_token) sessionTokenRef.current = data.session_token;
       setRecommendations(data.recommendations);
       setTotalFilteredCount(data.total_count);
     } catch (err) {
@@ -142,7 +147,7 @@ export default function HomePage() {
   };
 
   const handlePageChange = async (newPage) => {
-    if (newPage < 1 || newPage > totalPages || itemScorePairsSortedRef.current.length === 0) return;
+    if (newPage < 1 || newPage > totalPages || !sessionTokenRef.current) return;
     
     setIsFiltering(true);
     setCurrentPage(newPage);
@@ -152,7 +157,8 @@ export default function HomePage() {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
-          item_score_pairs_sorted: itemScorePairsSortedRef.current,
+          session_token: sessionTokenRef.current,
+          username: sessionUsernameRef.current,
           selected_genres: selectedGenres,
           selected_media_types: selectedMediaTypes,
           min_users: minUsers,
@@ -168,6 +174,7 @@ export default function HomePage() {
       }
 
       const data = await response.json();
+      if (data.session_token) sessionTokenRef.current = data.session_token;
       setRecommendations(data.recommendations);
     } catch (err) {
       setError(err.message);